@@ -1,5 +1,5 @@
 import argparse
-from analytics import parser, operation_builder, visualization
+from analytics import parser, operation_builder, pipeline, visualization
 import config
 
 # Parsing the command line arguments
@@ -19,6 +19,20 @@ cl_parser.add_argument("-viz", "--visualization",
                        help="Display the visualization (proportion of participation of the users per pad/paragraph, "
                             "how synchronous they are...)",
                        default=False)
+cl_parser.add_argument("--time_window", nargs=2, type=int, metavar=("START", "END"),
+                       help="Only process the edits made between these two timestamps (in ms)",
+                       default=None)
+cl_parser.add_argument("-j", "--jobs", type=int,
+                       help="Number of worker processes used to analyse the pads (the visualizations and -vv are "
+                            "always done in a single process)",
+                       default=1)
+cl_parser.add_argument("--sweep", nargs="+", type=int, metavar="MAXIMUM_TIME",
+                       help="Print the metrics of each pad for each of these maximum times between the elementary "
+                            "operations of an operation (in ms), e.g. to tune maximum_time_between_elem_ops",
+                       default=None)
+cl_parser.add_argument("--no_cache", action="store_true",
+                       help="Parse the logs again instead of using the elementary operations cached by a previous run",
+                       default=False)
 cl_parser.add_argument("-v", "--verbosity",
                        action="count",
                        default=0,
@@ -30,86 +44,117 @@ group.add_argument("--subset_of_pads",
 group.add_argument("--specific_pad",
                    help="Process only one pad",
                    default=None)
-args = cl_parser.parse_args()
-
-verbosity = args.verbosity
-path_to_db = args.path_to_db
-editor = args.editor
-subset_of_pads = args.subset_of_pads
-specific_pad = args.specific_pad
-texts = args.texts
-visualizations = args.visualization
-
-if path_to_db is None and editor != 'collab-react-components':
-    print("No arguments passed, displaying help and exiting:")
-    cl_parser.print_help()
-    cl_parser.exit()
-
-list_of_elem_ops_per_pad = parser.get_elem_ops_per_pad_from_db(path_to_db, editor, specific_pad)
-
-if subset_of_pads is not None:
-    subset_of_keys = list(list_of_elem_ops_per_pad.keys())[:subset_of_pads]
-    new_list_of_elem_ops_per_pad = dict()
-    for key in subset_of_keys:
-        new_list_of_elem_ops_per_pad[key] = list_of_elem_ops_per_pad[key]
-    list_of_elem_ops_per_pad = new_list_of_elem_ops_per_pad
-elif specific_pad is not None:
-    list_of_elem_ops_per_pad = {specific_pad: list_of_elem_ops_per_pad[specific_pad]}
-
-print("There are {} pads.".format(len(list_of_elem_ops_per_pad.keys())))
-if verbosity == 1:
-    print("The pads are", list(list_of_elem_ops_per_pad.keys()))
-
-# Sort the ElementaryOperation
-list_of_elem_ops_per_pad_sorted = operation_builder.sort_elem_ops_per_pad(list_of_elem_ops_per_pad)
-# Build the operations from the ElementaryOperation
-pads, _, _ = operation_builder.build_operations_from_elem_ops(list_of_elem_ops_per_pad_sorted,
-                                                              config.maximum_time_between_elem_ops)
-# for each Pad, create the paragraphs, classifiy the ops and create their context
-for pad_name in pads:
-    pad = pads[pad_name]
-    # create the paragraphs
-    pad.create_paragraphs_from_ops(pad.get_elem_ops(True))
-    # classify the operations of the pad
-    pad.classify_operations(length_edit=config.length_edit, length_delete=config.length_delete)
-    # find the context of the operation of the pad
-    pad.build_operation_context(config.delay_sync, config.time_to_reset_day, config.time_to_reset_break)
-
-# For each Pad, add the visualization
-for pad_name in pads:
-    pad = pads[pad_name]
-    if texts:
-        print("PAD:", pad_name)
-        text = pad.get_text()
-        print("TEXT")
-        print(text)
-
-        print('\nCOLORED TEXT BY AUTHOR')
-        pad.display_text_colored_by_authors()
-
-        print('\nCOLORED TEXT BY OPS')
-        pad.display_text_colored_by_ops()
-
-    if visualizations:
-        visualization.display_user_participation_paragraphs_with_del(pad)
-        # plot the participation proportion per user per paragraphs
-        visualization.display_user_participation_paragraphs(pad)
-
-        # plot the proportion of synchronous writing per paragraphs
-        visualization.display_proportion_sync_in_paragraphs(pad)
-
-        # plot the overall type counts
-        visualization.display_overall_op_type(pad)
-
-        # plot the counts of type per users
-        visualization.display_types_per_user(pad)
-
-        # Display user participation
-        visualization.display_user_participation(pad)
-
-    if verbosity > 1:
-        # print('OPERATIONS')
-        pad.display_operations()
-
-        # print("PARAGRAPHS:")
-        pad.display_paragraphs(verbose=1)
+if __name__ == '__main__':
+    # The worker processes of the pipeline must not run the script again when they import it
+    args = cl_parser.parse_args()
+
+    verbosity = args.verbosity
+    path_to_db = args.path_to_db
+    editor = args.editor
+    subset_of_pads = args.subset_of_pads
+    specific_pad = args.specific_pad
+    texts = args.texts
+    visualizations = args.visualization
+    cache_location = None if args.no_cache else config.parser_cache_location
+    timestamp_range = tuple(args.time_window) if args.time_window is not None else None
+    jobs = args.jobs
+    maximum_times = args.sweep
+
+    if path_to_db is None and editor != 'collab-react-components':
+        print("No arguments passed, displaying help and exiting:")
+        cl_parser.print_help()
+        cl_parser.exit()
+
+    # Only the pads we want are parsed
+    if subset_of_pads is not None:
+        # The pads are listed from the keys of the records only, without decoding them
+        pad_filter = parser.get_pad_names_from_db(path_to_db, editor)[:subset_of_pads]
+    elif specific_pad is not None:
+        pad_filter = specific_pad
+    else:
+        pad_filter = None
+
+    list_of_elem_ops_per_pad, _ = parser.get_elem_ops_per_pad_from_db(path_to_db, editor, cache_location=cache_location,
+                                                                       pad_filter=pad_filter,
+                                                                       timestamp_range=timestamp_range)
+
+    print("There are {} pads.".format(len(list_of_elem_ops_per_pad.keys())))
+    if verbosity == 1:
+        print("The pads are", list(list_of_elem_ops_per_pad.keys()))
+
+    # Sort the ElementaryOperation
+    list_of_elem_ops_per_pad_sorted = operation_builder.sort_elem_ops_per_pad(list_of_elem_ops_per_pad)
+    if maximum_times is not None:
+        # The operations are built for all the maximum times at once
+        results = pipeline.run_sweep(list_of_elem_ops_per_pad_sorted, maximum_times, jobs=jobs)
+        for maximum_time, results_of_pads in results.items():
+            print('\nMAXIMUM TIME BETWEEN ELEMENTARY OPERATIONS:', maximum_time)
+            for pad_name, result in results_of_pads.items():
+                print('SCORES OF', pad_name)
+                for metric_name, value in result.items():
+                    if metric_name != pipeline.OPERATIONS_KEY:
+                        print(metric_name + ':', value)
+    elif not visualizations and verbosity <= 1:
+        # Only the metrics and the texts are needed, the pads are analysed in worker processes
+        results = pipeline.run_pipeline(list_of_elem_ops_per_pad_sorted, jobs=jobs, texts=texts)
+        for pad_name, result in results.items():
+            if texts:
+                print("PAD:", pad_name)
+                print("TEXT")
+                print(result['text'])
+
+                print('\nCOLORED TEXT BY AUTHOR')
+                print(result['text_colored_by_authors'])
+
+                print('\nCOLORED TEXT BY OPS')
+                print(result['text_colored_by_ops'])
+
+            if verbosity == 1:
+                print('\nSCORES OF', pad_name)
+                for metric_name, value in result.items():
+                    if metric_name not in pipeline.TEXT_KEYS:
+                        print(metric_name + ':', value)
+    else:
+        # The pads are needed in this process for the visualizations and to display their operations. Build the
+        # operations, the paragraphs and the context of the operations of each Pad
+        pads = {pad_name: pipeline.build_pad(pad_name, elem_ops)
+                for pad_name, elem_ops in list_of_elem_ops_per_pad_sorted.items()}
+
+        # For each Pad, add the visualization
+        for pad_name in pads:
+            pad = pads[pad_name]
+            if texts:
+                print("PAD:", pad_name)
+                text = pad.get_text()
+                print("TEXT")
+                print(text)
+
+                print('\nCOLORED TEXT BY AUTHOR')
+                pad.display_text_colored_by_authors()
+
+                print('\nCOLORED TEXT BY OPS')
+                pad.display_text_colored_by_ops()
+
+            if visualizations:
+                visualization.display_user_participation_paragraphs_with_del(pad)
+                # plot the participation proportion per user per paragraphs
+                visualization.display_user_participation_paragraphs(pad)
+
+                # plot the proportion of synchronous writing per paragraphs
+                visualization.display_proportion_sync_in_paragraphs(pad)
+
+                # plot the overall type counts
+                visualization.display_overall_op_type(pad)
+
+                # plot the counts of type per users
+                visualization.display_types_per_user(pad)
+
+                # Display user participation
+                visualization.display_user_participation(pad)
+
+            if verbosity > 1:
+                # print('OPERATIONS')
+                pad.display_operations()
+
+                # print("PARAGRAPHS:")
+                pad.display_paragraphs(verbose=1)
@@ -0,0 +1,392 @@
+import array
+import json
+
+import numpy as np
+
+from analytics.Operations import ElementaryOperation
+
+
+class ElemOpStore:
+    """
+    Columnar store of elementary operations (struct of arrays). Instead of one ElementaryOperation object per
+    elementary operation, each attribute is kept in a typed NumPy array and the text added by all the elementary
+    operations is kept in a single shared string, addressed by offsets. The authors and the pads are stored once and
+    referred to by their id.
+
+    The parsers fill the store directly (see parser.get_elem_op_store_from_db). The rows are appended to Python arrays
+    and converted to NumPy arrays the first time a column is read after some appends. ElementaryOperation objects are
+    only created on demand (elem_op, get_elem_ops, get_elem_ops_per_pad) for the parts of the analytics that still use
+    the object API. Each call creates new objects.
+
+    Columns (one row per elementary operation):
+
+    - operation_type: ADD or DEL
+    - abs_position: position in document
+    - length: number of characters added or deleted
+    - timestamp: time of the edit (ms)
+    - author_id: index in authors
+    - pad_id: index in pads
+    - revs: version number (-1 if unknown)
+    - line_number: line number (-1 if unknown)
+    - position_inline: position in the current line (-1 if unknown)
+    - text_start: offset in text of the text added (only meaningful for ADD)
+    """
+
+    ADD = 0
+    DEL = 1
+    OPERATION_TYPES = ("add", "del")
+
+    # Name, type code of the Python array used while appending and dtype of the NumPy array of each column
+    COLUMNS = (('operation_type', 'b', np.int8),
+               ('abs_position', 'q', np.int64),
+               ('length', 'q', np.int64),
+               ('timestamp', 'q', np.int64),
+               ('author_id', 'i', np.int32),
+               ('pad_id', 'i', np.int32),
+               ('revs', 'q', np.int64),
+               ('line_number', 'q', np.int64),
+               ('position_inline', 'q', np.int64),
+               ('text_start', 'q', np.int64))
+
+    def __init__(self, editor=None):
+        """
+        Create an empty store.
+
+        :param editor: name of the editor the elementary operations come from
+        :type editor: str
+        """
+        self.editor = editor
+        """Editor of all the elementary operations of the store"""
+        self.authors = []
+        """Name of each author id
+
+        :type: list[str]"""
+        self.pads = []
+        """Name of each pad id
+
+        :type: list[str]"""
+        self.author_ids = dict()
+        """Id of each author name
+
+        :type: dict[str,int]"""
+        self.pad_ids = dict()
+        """Id of each pad name
+
+        :type: dict[str,int]"""
+        self._columns = {name: np.empty(0, dtype) for name, _, dtype in self.COLUMNS}
+        self._pending = {name: array.array(typecode) for name, typecode, _ in self.COLUMNS}
+        self._text = ''
+        self._pending_text = []
+        # Length of the text including the pending chunks
+        self._text_length = 0
+
+    def __len__(self):
+        return len(self._columns['operation_type']) + len(self._pending['operation_type'])
+
+    def get_author_id(self, author):
+        """
+        Get the id of an author, creating it if it is a new author
+
+        :param author: name of the author
+        :type author: str
+        :rtype: int
+        """
+        author_id = self.author_ids.get(author)
+        if author_id is None:
+            author_id = len(self.authors)
+            self.author_ids[author] = author_id
+            self.authors.append(author)
+        return author_id
+
+    def get_pad_id(self, pad_name):
+        """
+        Get the id of a pad, creating it if it is a new pad
+
+        :param pad_name: name of the pad
+        :type pad_name: str
+        :rtype: int
+        """
+        pad_id = self.pad_ids.get(pad_name)
+        if pad_id is None:
+            pad_id = len(self.pads)
+            self.pad_ids[pad_name] = pad_id
+            self.pads.append(pad_name)
+        return pad_id
+
+    def append(self, operation_type, abs_position, text_or_length, timestamp, author_id, pad_id, revs=None,
+               line_number=None, position_inline=None):
+        """
+        Append an elementary operation to the store
+
+        :param operation_type: "add" or "del"
+        :type operation_type: str
+        :param abs_position: position in document
+        :type abs_position: int
+        :param text_or_length: text to add if the op is "add", number of characters to delete if the op is "del"
+        :type text_or_length: str|int
+        :param timestamp: time of the edit
+        :type timestamp: int
+        :param author_id: id of the author (see get_author_id)
+        :type author_id: int
+        :param pad_id: id of the pad (see get_pad_id)
+        :type pad_id: int
+        :param revs: version number
+        :type revs: int
+        :param line_number: line number
+        :type line_number: int
+        :param position_inline: position in the current line
+        :type position_inline: int
+        """
+        pending = self._pending
+        if operation_type == "add":
+            pending['operation_type'].append(self.ADD)
+            pending['length'].append(len(text_or_length))
+            pending['text_start'].append(self._text_length)
+            self._pending_text.append(text_or_length)
+            self._text_length += len(text_or_length)
+        elif operation_type == "del":
+            pending['operation_type'].append(self.DEL)
+            pending['length'].append(text_or_length)
+            pending['text_start'].append(self._text_length)
+        else:
+            raise AttributeError("Undefined elementary operation")
+        pending['abs_position'].append(abs_position)
+        pending['timestamp'].append(timestamp)
+        pending['author_id'].append(author_id)
+        pending['pad_id'].append(pad_id)
+        pending['revs'].append(-1 if revs is None else revs)
+        pending['line_number'].append(-1 if line_number is None else line_number)
+        pending['position_inline'].append(-1 if position_inline is None else position_inline)
+
+    def append_elem_op(self, elem_op):
+        """
+        Append an ElementaryOperation to the store. Its belong_to_operation and current_position are not kept.
+
+        :param elem_op: elementary operation to append
+        :type elem_op: ElementaryOperation
+        """
+        self.append(elem_op.operation_type,
+                    elem_op.abs_position,
+                    elem_op.text_to_add if elem_op.operation_type == "add" else elem_op.length_to_delete,
+                    elem_op.timestamp,
+                    self.get_author_id(elem_op.author),
+                    self.get_pad_id(elem_op.pad_name),
+                    elem_op.revs,
+                    elem_op.line_number,
+                    elem_op.position_inline)
+
+    @classmethod
+    def from_elem_ops_per_pad(cls, list_of_elem_ops_per_pad, editor=None):
+        """
+        Create a store from the ElementaryOperation of each pad (as returned by parser.get_elem_ops_per_pad_from_db)
+
+        :param list_of_elem_ops_per_pad: dictionary of elementary operation per pad
+        :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
+        :param editor: name of the editor the elementary operations come from
+        :type editor: str
+        :rtype: ElemOpStore
+        """
+        store = cls(editor)
+        for elem_ops in list_of_elem_ops_per_pad.values():
+            for elem_op in elem_ops:
+                store.append_elem_op(elem_op)
+        return store
+
+    def extend(self, other, pad_names=None, timestamp_offset=0, rows=None):
+        """
+        Append all the elementary operations of another store to this one. The authors and the pads of the other store
+        are mapped to the ids of this store.
+
+        :param other: store whose elementary operations are appended
+        :type other: ElemOpStore
+        :param pad_names: new name of each pad of the other store (the pads not in it keep their name). Pads of the
+            two stores with the same name are merged.
+        :type pad_names: dict[str,str]
+        :param timestamp_offset: offset added to the timestamps of the other store, or offset of each of its rows
+        :type timestamp_offset: int|np.ndarray
+        :param rows: indices of the rows of the other store that are appended (all of them if None)
+        :type rows: np.ndarray
+        """
+        if pad_names is None:
+            pad_names = dict()
+        author_map = np.array([self.get_author_id(author) for author in other.authors], dtype=np.int32)
+        pad_map = np.array([self.get_pad_id(pad_names.get(pad_name, pad_name)) for pad_name in other.pads],
+                           dtype=np.int32)
+        text = other.text
+        for name, typecode, dtype in self.COLUMNS:
+            column = other.column(name)
+            if name == 'author_id':
+                column = author_map[column]
+            elif name == 'pad_id':
+                column = pad_map[column]
+            elif name == 'text_start':
+                column = column + self._text_length
+            elif name == 'timestamp':
+                column = column + timestamp_offset
+            if rows is not None:
+                column = column[rows]
+            self._pending[name].frombytes(column.astype(dtype, copy=False).tobytes())
+        if text:
+            self._pending_text.append(text)
+            self._text_length += len(text)
+
+    def _flush(self):
+        """
+        Move the pending rows to the NumPy arrays and the pending chunks of text to the shared text
+        """
+        if len(self._pending['operation_type']) > 0:
+            for name, typecode, dtype in self.COLUMNS:
+                self._columns[name] = np.concatenate((self._columns[name],
+                                                      np.frombuffer(self._pending[name], dtype)))
+                self._pending[name] = array.array(typecode)
+        if self._pending_text:
+            self._text += ''.join(self._pending_text)
+            self._pending_text = []
+
+    def column(self, name):
+        """
+        Get a column of the store. The array must not be modified.
+
+        :param name: name of the column (see COLUMNS)
+        :type name: str
+        :return: the values of the column for each elementary operation
+        :rtype: np.ndarray
+        """
+        self._flush()
+        return self._columns[name]
+
+    @property
+    def text(self):
+        """
+        Shared string containing the text added by all the elementary operations
+
+        :rtype: str
+        """
+        self._flush()
+        return self._text
+
+    def nbytes(self):
+        """
+        Approximate memory used by the columns and the shared text
+
+        :rtype: int
+        """
+        self._flush()
+        return sum(column.nbytes for column in self._columns.values()) + len(self._text.encode('utf8'))
+
+    def get_text_to_add(self, idx):
+        """
+        Get the text added by an elementary operation
+
+        :param idx: index of the elementary operation in the store
+        :type idx: int
+        :rtype: str
+        """
+        start = self.column('text_start')[idx]
+        return self.text[start:start + self._columns['length'][idx]]
+
+    def pad_indices(self, sorted_=True):
+        """
+        Get the indices of the elementary operations of each pad
+
+        :param sorted_: sort the elementary operations of each pad by timestamp (stable, so the elementary operations
+            with the same timestamp stay in the order they were appended)
+        :type sorted_: bool
+        :return: the indices of the elementary operations of each pad
+        :rtype: dict[str,np.ndarray]
+        """
+        pad_id = self.column('pad_id')
+        if sorted_:
+            order = np.lexsort((self._columns['timestamp'], pad_id))
+        else:
+            order = np.argsort(pad_id, kind='stable')
+        # The elementary operations of a pad are contiguous in order, we split it where the pad changes
+        boundaries = np.flatnonzero(np.diff(pad_id[order])) + 1
+        return {self.pads[pad_id[indices[0]]]: indices for indices in np.split(order, boundaries) if len(indices) > 0}
+
+    def elem_op(self, idx):
+        """
+        Create the ElementaryOperation of a row of the store
+
+        :param idx: index of the elementary operation in the store
+        :type idx: int
+        :rtype: ElementaryOperation
+        """
+        return self.get_elem_ops([idx])[0]
+
+    def get_elem_ops(self, indices):
+        """
+        Create the ElementaryOperation of some rows of the store
+
+        :param indices: indices of the elementary operations in the store
+        :type indices: collections.Iterable[int]
+        :rtype: list[ElementaryOperation]
+        """
+        self._flush()
+        indices = np.asarray(indices, dtype=np.int64)
+        # Gather the rows as Python objects at once rather than reading the arrays element by element
+        rows = zip(*(self._columns[name][indices].tolist() for name, _, _ in self.COLUMNS))
+        text = self._text
+        elem_ops = []
+        for operation_type, abs_position, length, timestamp, author_id, pad_id, revs, line_number, position_inline, \
+                text_start in rows:
+            if operation_type == self.ADD:
+                elem_op = ElementaryOperation("add", abs_position, text_to_add=text[text_start:text_start + length])
+            else:
+                elem_op = ElementaryOperation("del", abs_position, length_to_delete=length)
+            elem_op.line_number = line_number if line_number != -1 else None
+            elem_op.position_inline = position_inline if position_inline != -1 else None
+            elem_op.author = self.authors[author_id]
+            elem_op.timestamp = timestamp
+            elem_op.pad_name = self.pads[pad_id]
+            elem_op.revs = revs if revs != -1 else None
+            elem_op.editor = self.editor
+            elem_ops.append(elem_op)
+        return elem_ops
+
+    def get_elem_ops_per_pad(self, sorted_=True):
+        """
+        Create the ElementaryOperation of each pad, in the format returned by parser.get_elem_ops_per_pad_from_db
+
+        :param sorted_: sort the elementary operations of each pad by timestamp
+        :type sorted_: bool
+        :return: dictionary of elementary operation per pad
+        :rtype: dict[str,list[ElementaryOperation]]
+        """
+        return {pad_name: self.get_elem_ops(indices) for pad_name, indices in self.pad_indices(sorted_).items()}
+
+    def save(self, file, meta=None):
+        """
+        Save the store in a binary file (uncompressed NumPy .npz, the columns are loaded back without any parsing)
+
+        :param file: path or file object in which the store is saved
+        :param meta: information saved along the store (must be serializable in JSON)
+        :type meta: dict
+        """
+        self._flush()
+        arrays = dict(self._columns)
+        arrays['text'] = np.frombuffer(self._text.encode('utf8'), np.uint8)
+        header = {'editor': self.editor, 'authors': self.authors, 'pads': self.pads, 'meta': meta}
+        arrays['header'] = np.frombuffer(json.dumps(header).encode('utf8'), np.uint8)
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load a store saved with save
+
+        :param file: path or file object from which the store is loaded
+        :return: the store and the information saved along it
+        :rtype: (ElemOpStore,dict)
+        """
+        with np.load(file, allow_pickle=False) as data:
+            header = json.loads(data['header'].tobytes().decode('utf8'))
+            store = cls(header['editor'])
+            for author in header['authors']:
+                store.get_author_id(author)
+            for pad_name in header['pads']:
+                store.get_pad_id(pad_name)
+            store._columns = {name: data[name].astype(dtype, copy=False) for name, _, dtype in cls.COLUMNS}
+            store._text = data['text'].tobytes().decode('utf8')
+            store._text_length = len(store._text)
+        return store, header['meta']
@@ -1,6 +1,26 @@
+import operator
+import sys
+
 import numpy as np
 
 
+def _intern(string):
+    """
+    Intern a string so that the (many) objects created from the same pad, author or editor share a single copy of it
+
+    :param string: string to intern, can also be None or a non str (e.g. an author id)
+    :return: the interned string, or the parameter unchanged if it is not a str
+    """
+    if type(string) is str:
+        return sys.intern(string)
+    return string
+
+
+# The elementary operations are ordered by their timestamp, then by their place in the edit they were split from (see
+# ElementaryOperationPart)
+_get_sort_key = operator.attrgetter('timestamp', 'sequence')
+
+
 class ElementaryOperation:
     """
     Elementary operation (finest granularity). Such as addition or removal of one letter or a very short sequence.
@@ -18,8 +38,15 @@ class ElementaryOperation:
     - changeset: Original information encoded in Etherpad format (http://policypad.readthedocs.io/en/latest/changesets.html)
     - belong_to_operation : to which operation it belongs
 
-
+    There are a lot of elementary operations in a pad, so the class uses __slots__ and the pad name, the author and the
+    editor are interned. The changeset is only kept if config.keep_changesets is set (see the parser).
     """
+    __slots__ = ('operation_type', 'text_to_add', 'length_to_delete', 'abs_position', 'line_number',
+                 'position_inline', 'author', 'timestamp', 'pad_name', 'revs', 'changeset', 'belong_to_operation',
+                 'editor', 'current_position', 'deleted')
+
+    sequence = 0
+    """Place in the edit, only the parts of a split edit have a sequence (see ElementaryOperationPart)"""
 
     def __init__(self, operation_type, abs_position,
                  length_to_delete=None,
@@ -73,13 +100,13 @@ class ElementaryOperation:
         self.abs_position = abs_position
         self.line_number = line_number
         self.position_inline = position_inline
-        self.author = author
+        self.author = _intern(author)
         self.timestamp = timestamp
-        self.pad_name = pad_name
+        self.pad_name = _intern(pad_name)
         self.revs = revs
         self.changeset = changeset
         self.belong_to_operation = belong_to_operation
-        self.editor = editor
+        self.editor = _intern(editor)
 		# The position of the op in the current pad. 
         self.current_position = self.abs_position
         self.deleted=False
@@ -100,6 +127,16 @@ class ElementaryOperation:
                 "\nEditor:" + str(self.editor) +
                 "\nBelong to Operation:" + str(self.belong_to_operation))
 
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__ if hasattr(self, slot)}
+
+    def __setstate__(self, state):
+        # The strings are not shared anymore once unpickled (e.g. when coming from another process)
+        for slot, value in state.items():
+            if slot in ('author', 'pad_name', 'editor'):
+                value = _intern(value)
+            setattr(self, slot, value)
+
     def get_length_of_op(self):
         """
         Gives the number of character added (can be negative for deletes)
@@ -116,46 +153,116 @@ class ElementaryOperation:
     @classmethod
     def sort_elem_ops(cls, elem_ops_list):
         """
-        Sort a list of elementary operations
+        Sort a list of elementary operations. The result is a new list (it used to be a numpy array of objects, the
+        callers only iterate over it and index it).
 
         :param elem_ops_list: The list of elem_ops to sort
         :type elem_ops_list: list[ElementaryOperation]
         :return: The sorted list of elementary operation
         :rtype: list[ElementaryOperation]
         """
-        elem_ops = []
-        for elem_op in elem_ops_list:
-            elem_ops.append([elem_op.timestamp, elem_op])
-        # sort them
-        sorted_elem_ops = sorted(elem_ops, key=lambda e: e[0])
-        return np.array(sorted_elem_ops)[:, 1]
+        # The sort is stable and the lists we sort are (nearly) sorted: the elementary operations come in order from
+        # the parsers, or are the concatenation of sorted runs (e.g. the elem_ops of each Operation). The sort detects
+        # the runs, it only checks a sorted list once and merges the runs otherwise.
+        return sorted(elem_ops_list, key=_get_sort_key)
 
-    def copy(self):
+
+def _source_attribute(name, doc):
+    """
+    Property reading an attribute of the source of an ElementaryOperationPart
+
+    :param name: name of the attribute
+    :type name: str
+    :param doc: docstring of the property
+    :type doc: str
+    :rtype: property
+    """
+    get_attribute = operator.attrgetter('source.' + name)
+    return property(get_attribute, doc=doc)
+
+
+class ElementaryOperationPart:
+    """
+    Part of an ElementaryOperation adding text with new lines, once split so that each new line is isolated (see
+    operation_builder.split_elem_op_on_newlines). It is used as an ElementaryOperation.
+
+    A large paste is split into a part per line, so the part is a view of its source: it only keeps the offsets of its
+    text in the text of the source and reads the author, the timestamp... from it. The parts of an edit have the
+    timestamp of the edit and are ordered by their sequence.
+    """
+    __slots__ = ('source', 'start', 'end', 'sequence', 'abs_position', 'current_position', 'deleted',
+                 'belong_to_operation')
+
+    operation_type = 'add'
+    length_to_delete = None
+    line_number = _source_attribute('line_number', "Line number of the source (not updated)")
+    position_inline = _source_attribute('position_inline', "Position in the line of the source (not updated)")
+    author = _source_attribute('author', "Author")
+    timestamp = _source_attribute('timestamp', "Time of the edit")
+    pad_name = _source_attribute('pad_name', "Pad name")
+    revs = _source_attribute('revs', "Version number")
+    changeset = _source_attribute('changeset', "Original changeset of the edit")
+    editor = _source_attribute('editor', "Name of the editor")
+
+    def __init__(self, source, start, end, abs_position, sequence):
+        """
+        Create a part of an elementary operation
+
+        :param source: the elementary operation split
+        :type source: ElementaryOperation
+        :param start: start of the text of the part in the text of the source
+        :type start: int
+        :param end: end of the text of the part in the text of the source (excluded)
+        :type end: int
+        :param abs_position: position in document
+        :type abs_position: int
+        :param sequence: place of the part in the edit: 0 for the text before the first new line (which is ordered
+            like its edit), then 1, 2... for the next parts
+        :type sequence: int
+        """
+        self.source = source
+        """ElementaryOperation"""
+        self.start = start
+        """int"""
+        self.end = end
+        """int"""
+        self.sequence = sequence
+        """int"""
+        self.abs_position = abs_position
+        """int"""
+        self.current_position = abs_position
+        """int"""
+        self.deleted = False
+        """bool"""
+        self.belong_to_operation = None
+        """Operation"""
+
+    @property
+    def text_to_add(self):
         """
-        Copy the elementary operation if it's an add. Used in operation builder. It doesn't copy a few parameters which
-        are unrelevant at this stage
-        :return: The copy of the ElementaryOperation
-        :rtype: ElementaryOperation
-        """
-        new_op = ElementaryOperation(operation_type=self.operation_type,
-                                     abs_position=self.abs_position,
-                                     text_to_add=self.text_to_add,
-                                     line_number=self.line_number,
-                                     position_inline=self.position_inline,
-                                     author=self.author,
-                                     timestamp=self.timestamp,
-                                     pad_name=self.pad_name,
-                                     revs=self.revs,
-                                     changeset=self.changeset,
-                                     belong_to_operation=self.belong_to_operation,
-                                     editor=self.editor)
-        return new_op
+        Text added by the part
+
+        :rtype: str
+        """
+        return self.source.text_to_add[self.start:self.end]
+
+    __str__ = ElementaryOperation.__str__
+
+    def get_length_of_op(self):
+        """
+        Gives the number of character added
+
+        :rtype: int
+        """
+        return self.end - self.start
 
 
 class Operation:
     """
     An Operation. It groups multiple ElementaryOperation of a same user that we consider as a single operation.
     """
+    __slots__ = ('pushed', 'author', 'position_start_of_op', 'position_first_op', 'timestamp_start', 'timestamp_end',
+                 'elem_ops', 'type', 'context')
 
     def __init__(self, elem_op):
         """
@@ -272,6 +379,8 @@ class Operation:
 
 
 class Paragraph:
+    __slots__ = ('elem_ops', 'operations', 'added_elem_ops', 'abs_position', 'length', 'new_line')
+
     def __init__(self, elem_op=None, new_line=False, paragraph=None):
         """
         Create a new paragraph from an ElementaryOperation or a Paragraph
@@ -288,6 +397,9 @@ class Paragraph:
             """list[ElementaryOperation]"""
             self.operations = [elem_op.belong_to_operation]
             """list[Operation]"""
+            # The elementary operations in the order their operations were added to the paragraph
+            self.added_elem_ops = [elem_op]
+            """list[ElementaryOperation]"""
             self.abs_position = elem_op.abs_position
             """int"""
             self.length = len(elem_op.text_to_add)
@@ -299,6 +411,8 @@ class Paragraph:
             """list[ElementaryOperation]"""
             self.operations = paragraph.operations
             """list[Operation]"""
+            self.added_elem_ops = paragraph.added_elem_ops
+            """list[ElementaryOperation]"""
             self.abs_position = paragraph.abs_position
             """int"""
             self.length = paragraph.length
@@ -348,6 +462,7 @@ class Paragraph:
                 self.elem_ops[i].current_position += elem_op.get_length_of_op()
         if not (elem_op.belong_to_operation in self.operations):
             self.operations.append(elem_op.belong_to_operation)
+        self.added_elem_ops.append(elem_op)
 
         if elem_op.operation_type == "del":
             # If it's a deletion, it will change the start position and length
@@ -452,6 +567,7 @@ class Paragraph:
         for op in last_paragraph.operations:
             if not op in new_para.operations:
                 new_para.operations.append(op)
+        new_para.added_elem_ops = first_paragraph.added_elem_ops + last_paragraph.added_elem_ops
 
         # TODO: remove assertions
         assert first_paragraph.new_line is False and last_paragraph.new_line is False
@@ -476,6 +592,8 @@ class Paragraph:
         para2.abs_position = position + 1  # Since we add a new line
         para1.operations = []
         para2.operations = []
+        para1.added_elem_ops = []
+        para2.added_elem_ops = []
         para1.length = position - paragraph_to_split.abs_position
         para2.length = paragraph_to_split.abs_position + paragraph_to_split.length - position
 		
@@ -491,10 +609,12 @@ class Paragraph:
             if position <= elem_op.current_position:
                 elem_op.current_position += 1  # Because we add the new line
                 para2.elem_ops.append(elem_op)
+                para2.added_elem_ops.append(elem_op)
                 if not (elem_op.belong_to_operation in para2.operations):
                     para2.operations.append(elem_op.belong_to_operation)
             else:
                 para1.elem_ops.append(elem_op)
+                para1.added_elem_ops.append(elem_op)
                 if not (elem_op.belong_to_operation in para1.operations):
                     para1.operations.append(elem_op.belong_to_operation)
 					# TODO remove 
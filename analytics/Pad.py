@@ -1,5 +1,8 @@
+import bisect
+import itertools
 from analytics import operation_builder
-from analytics.Operations import ElementaryOperation, Paragraph, Operation
+from analytics.Operations import ElementaryOperation, ElementaryOperationPart, Paragraph, Operation
+from analytics.Rope import Rope
 import numpy as np
 import config
 
@@ -13,6 +16,78 @@ def get_colors():
     return colors
 
 
+def _range_minimum(values, starts, ends):
+    """
+    Minimum of values[start:end] for each pair of starts and ends, with a sparse table of the minimums over the ranges
+    whose length is a power of two
+
+    :param values: the values
+    :type values: np.ndarray
+    :param starts: start of each range
+    :type starts: np.ndarray
+    :param ends: end of each range (excluded), after its start
+    :type ends: np.ndarray
+    :return: the minimum of each range
+    :rtype: np.ndarray
+    """
+    levels = [values]
+    while 2 ** len(levels) <= len(values):
+        half = 2 ** (len(levels) - 1)
+        levels.append(np.minimum(levels[-1][:-half], levels[-1][half:]))
+    # The largest power of two not above the length of the range
+    level_of_range = np.frexp(ends - starts)[1] - 1
+    minimums = np.empty(len(starts), dtype=values.dtype)
+    for level in np.unique(level_of_range).tolist():
+        in_level = level_of_range == level
+        minimums[in_level] = np.minimum(levels[level][starts[in_level]], levels[level][ends[in_level] - 2 ** level])
+    return minimums
+
+
+def _apply_elem_op_to_rope(rope, elem_op):
+    """
+    Apply an elementary operation to a text, the text added is attributed to the elementary operation
+
+    :param rope: the text
+    :type rope: Rope
+    :param elem_op: the elementary operation
+    :type elem_op: ElementaryOperation
+    """
+    if elem_op.operation_type == 'add':
+        if isinstance(elem_op, ElementaryOperationPart):
+            # The text of the part is not copied
+            rope.insert(elem_op.abs_position, elem_op.source.text_to_add, elem_op.start, elem_op.end, elem_op)
+        else:
+            rope.insert(elem_op.abs_position, elem_op.text_to_add, attribute=elem_op)
+    elif elem_op.operation_type == 'del':
+        rope.delete(elem_op.abs_position, elem_op.length_to_delete)
+    else:
+        raise AttributeError("Undefined elementary operation")
+
+
+def _get_author_and_operation_of_span(span):
+    """
+    Author and operation of the elementary operation of a span of the text of a pad
+
+    :param span: text and elementary operation of the span
+    :type span: (str,ElementaryOperation)
+    :rtype: (str,Operation)
+    """
+    return span[1].author, span[1].belong_to_operation
+
+
+def _color_letters(text, color):
+    """
+    Put a color before each letter of a text
+
+    :param text: the text
+    :type text: str
+    :param color: the color
+    :type color: str
+    :rtype: str
+    """
+    return color + color.join(text) if text else ''
+
+
 class Pad:
     """
     Pad. Contains all the operations for a particular pad.
@@ -36,9 +111,40 @@ class Pad:
         self.authors = []
         """:type: list[str]"""
 
+        self.elem_ops_sorted = []
+        """Elementary operations of the operations sorted by timestamp and sequence (see get_elem_ops), without the
+        new ones
+
+        :type: list[ElementaryOperation]"""
+
+        self.elem_ops_timestamps = []
+        """Timestamp of each of elem_ops_sorted, to find the elementary operations by timestamp with a binary search
+
+        :type: list[int]"""
+
+        self.new_elem_ops = []
+        """Elementary operations added since elem_ops_sorted was last updated
+
+        :type: list[ElementaryOperation]"""
+
+        self.rope = None
+        """Text of the pad, built by get_text and then kept up to date by apply_elem_op
+
+        :type: Rope"""
+
+        self.rope_sort_key = None
+        """Timestamp and sequence of the last elementary operation applied to the rope"""
+
+        self.rope_operation_colors = None
+        """Color of each operation which added text to the rope, given in the order of their first elementary operation
+        adding text
+
+        :type: dict[Operation,str]"""
+
     def add_operation(self, operation):
         """
-        Add an Operation to the list of ops
+        Add an Operation to the list of ops, unless it has already been added. Its elementary operations are not added
+        to the pad: each of them must be given to apply_elem_op.
 
         :param operation: Operation to add
         """
@@ -48,7 +154,7 @@ class Pad:
 
     def add_operations(self, operations):
         """
-        Add a list of Operation to the list of ops
+        Add a list of Operation to the list of ops (see add_operation)
 
         :param operations: list of Operation to add
         """
@@ -63,81 +169,151 @@ class Pad:
         :return: list of ElementaryOperation
         :rtype: list[ElementaryOperation]
         """
+        if sorted_:
+            return list(self._get_elem_ops_sorted())
         # Recover all the elementary ops
         elem_ops = []
         for op in self.operations:
             for elem_op in op.elem_ops:
                 elem_ops.append(elem_op)
-        if sorted_:
-            return ElementaryOperation.sort_elem_ops(elem_ops)
-        else:
-            return elem_ops
+        return elem_ops
+
+    def get_elem_ops_until(self, timestamp):
+        """
+        Get the ElementaryOperation made until a timestamp, ordered by timestamp (see get_elem_ops)
+
+        :param timestamp: timestamp of the last elementary operations returned
+        :type timestamp: int
+        :rtype: list[ElementaryOperation]
+        """
+        elem_ops_sorted = self._get_elem_ops_sorted()
+        return elem_ops_sorted[:bisect.bisect_right(self.elem_ops_timestamps, timestamp)]
+
+    def _get_elem_ops_sorted(self):
+        """
+        Get the elementary operations sorted by timestamp and sequence, once the new ones are added to them. The
+        elementary operations with the same timestamp and sequence stay in the order they were added to the pad. The
+        elementary operations are sorted once, then the new ones are usually more recent and only appended.
+
+        :return: the elementary operations sorted, which must not be modified
+        :rtype: list[ElementaryOperation]
+        """
+        if self.new_elem_ops:
+            new_elem_ops = ElementaryOperation.sort_elem_ops(self.new_elem_ops)
+            self.new_elem_ops = []
+            first, last = new_elem_ops[0], self.elem_ops_sorted[-1] if self.elem_ops_sorted else None
+            if last is None or (first.timestamp, first.sequence) >= (last.timestamp, last.sequence):
+                # The new elementary operations are more recent than the others
+                self.elem_ops_sorted += new_elem_ops
+                self.elem_ops_timestamps += [elem_op.timestamp for elem_op in new_elem_ops]
+            else:
+                # The sort is stable and merges the two sorted runs
+                self.elem_ops_sorted = ElementaryOperation.sort_elem_ops(self.elem_ops_sorted + new_elem_ops)
+                self.elem_ops_timestamps = [elem_op.timestamp for elem_op in self.elem_ops_sorted]
+        return self.elem_ops_sorted
 
     def get_text(self, until_timestamp=None):
         """
-        Return a string with the whole text
+        Return a string with the whole text. The text is obtained by applying the elementary operations in the order of
+        their timestamps. The first call builds a Rope which is then updated by the new elementary operations (see
+        apply_elem_op), so the next calls only read it.
 
-        :param until_timestamp:
+        :param until_timestamp: only apply the elementary operations made until then
         :return: the text written so far on the pad
         :rtype: str
         """
-        elem_ops_ordered = self.get_elem_ops(sorted_=True)
-        text = ""
-        for elem_id, elem_op in enumerate(elem_ops_ordered):
-            if until_timestamp is not None and elem_op.timestamp > until_timestamp:
-                return text
-            if elem_op.operation_type == 'add':
-                # We add to the end of the ext
-                if '*' in elem_op.text_to_add or '*' in text or len(elem_ops_ordered) - 1 == elem_id:
-                    pass
-                if len(text) == elem_op.abs_position:
-                    text += elem_op.text_to_add
-                else:
-                    text = text[:elem_op.abs_position] + elem_op.text_to_add + text[elem_op.abs_position:]
-            elif elem_op.operation_type == 'del':
-                text = text[:elem_op.abs_position] + text[elem_op.abs_position + elem_op.length_to_delete:]
-            else:
-                raise AttributeError("Undefined elementary operation")
-        return text
+        if until_timestamp is not None:
+            rope = Rope()
+            for elem_op in self.get_elem_ops_until(until_timestamp):
+                _apply_elem_op_to_rope(rope, elem_op)
+            return rope.get_text()
+        if self.rope is None:
+            self._build_rope()
+        return self.rope.get_text()
+
+    def _build_rope(self):
+        """
+        Build the text of the pad by applying all its elementary operations (see get_text)
+        """
+        self.rope = Rope()
+        self.rope_sort_key = None
+        self.rope_operation_colors = dict()
+        for elem_op in self._get_elem_ops_sorted():
+            self._update_rope(elem_op)
+
+    def _update_rope(self, elem_op):
+        """
+        Apply an elementary operation to the text of the pad
+
+        :param elem_op: the elementary operation, after the ones already applied
+        :type elem_op: ElementaryOperation
+        """
+        _apply_elem_op_to_rope(self.rope, elem_op)
+        self.rope_sort_key = (elem_op.timestamp, elem_op.sequence)
+        if elem_op.operation_type == 'add' and elem_op.belong_to_operation not in self.rope_operation_colors:
+            colors = get_colors()
+            idx_color = len(self.rope_operation_colors) % len(colors)
+            self.rope_operation_colors[elem_op.belong_to_operation] = colors[idx_color]
+
+    def apply_elem_op(self, elem_op):
+        """
+        Update the pad with a new elementary operation of one of its operations: add it to the elementary operations of
+        the pad (see get_elem_ops) and update the text (see get_text). If it is older than the elementary operations
+        already applied, the text is built again by the next get_text.
+
+        :param elem_op: the elementary operation
+        :type elem_op: ElementaryOperation
+        """
+        self.new_elem_ops.append(elem_op)
+        if self.rope is None:
+            return
+        sort_key = (elem_op.timestamp, elem_op.sequence)
+        if self.rope_sort_key is not None and sort_key < self.rope_sort_key:
+            self.rope = None
+            return
+        # The elementary operations with the same timestamp and sequence are sorted in the order they are added
+        self._update_rope(elem_op)
+
+    def apply_elem_ops(self, elem_ops):
+        """
+        Update the pad with new elementary operations of its operations (see apply_elem_op)
+
+        :param elem_ops: the elementary operations, sorted by timestamp
+        :type elem_ops: list[ElementaryOperation]
+        """
+        for elem_op in elem_ops:
+            self.apply_elem_op(elem_op)
+
+    def get_attributed_spans(self):
+        """
+        Get the text of the pad as spans of text added by the same author in the same operation (see get_text)
+
+        :return: the text, the author and the operation of each span
+        :rtype: list[(str,str,Operation)]
+        """
+        if self.rope is None:
+            self._build_rope()
+        spans = []
+        for (author, operation), elem_op_spans in itertools.groupby(self.rope.get_spans(),
+                                                                    key=_get_author_and_operation_of_span):
+            spans.append((''.join(text for text, _ in elem_op_spans), author, operation))
+        return spans
 
     def display_text_colored_by_ops(self):
         """
-        Print the colored text according to the operations.
+        Print the colored text according to the operations. Like get_text, only the parts of the text changed since the
+        last call are colored again.
         """
+        if self.rope is None:
+            self._build_rope()
+        op_to_color = self.rope_operation_colors
 
-        letters = []
-        letters_color = []
-        idx_color = 0
-        elem_ops_ordered = self.get_elem_ops(sorted_=True)
-        op_to_color = {}
-        colors = get_colors()
-        for idx, elem_op in enumerate(elem_ops_ordered):
-            idx_elem = elem_op.abs_position
-            if elem_op.operation_type == 'add':
-                # We find the right color to print
-                op = elem_op.belong_to_operation
-                if op in op_to_color:
-                    color = op_to_color[op]
-                else:
-                    op_to_color[op] = colors[idx_color % len(colors)]
-                    idx_color += 1
-                    color = op_to_color[op]
-
-                # We add to the end of the ext
-                if idx_elem == len(letters):
-                    letters += list(elem_op.text_to_add)
-                    letters_color += [color] * elem_op.get_length_of_op()
-                else:
-                    letters = letters[:idx_elem] + list(elem_op.text_to_add) + letters[idx_elem:]
-                    letters_color = letters_color[:idx_elem] + [color] * elem_op.get_length_of_op() + letters_color[
-                                                                                                      idx_elem:]
-            elif elem_op.operation_type == 'del':
-                letters = letters[:idx_elem] + letters[idx_elem + elem_op.length_to_delete:]
-                letters_color = letters_color[:idx_elem] + letters_color[idx_elem + elem_op.length_to_delete:]
-            else:
-                raise AttributeError("Undefined elementary operation")
-        # Print letter after letter with the right color
-        string_colored = ''.join([color + letter for letter, color in zip(letters, letters_color)])
+        def color_piece(text, start, end, elem_op):
+            # Print letter after letter with the right color
+            return _color_letters(text[start:end], op_to_color[elem_op.belong_to_operation])
+
+        # The operations keep the color given when they first added text, so the colored pieces can be reused
+        string_colored = self.rope.render('colored_by_ops', color_piece)
 
         # Change color back to original at the end and return
         return string_colored + get_colors()[0]
@@ -152,38 +328,38 @@ class Pad:
         """
         letters = []
         letters_color = []
-        elem_ops_ordered = self.get_elem_ops(sorted_=True)
-        authors = self.authors
-        colors = get_colors()
-        for elem_op in elem_ops_ordered:
-            idx_elem = elem_op.abs_position
-            color = colors[authors.index(elem_op.author) % len(colors)]
-            if elem_op.operation_type == 'add':
-                # We add to the end of the ext
-                if idx_elem == len(letters):
-                    letters += list(elem_op.text_to_add)
-                    letters_color += [color] * elem_op.get_length_of_op()
-                else:
-                    letters = letters[:idx_elem] + list(elem_op.text_to_add) + letters[idx_elem:]
-                    letters_color = letters_color[:idx_elem] + [color] * elem_op.get_length_of_op() + letters_color[
-                                                                                                      idx_elem:]
-            elif elem_op.operation_type == 'del':
-                letters = letters[:idx_elem] + letters[idx_elem + elem_op.length_to_delete:]
-                letters_color = letters_color[:idx_elem] + letters_color[idx_elem + elem_op.length_to_delete:]
-            else:
-                raise AttributeError("Undefined elementary operation")
+        author_to_color = self._get_author_colors()
+        for text, author, _ in self.get_attributed_spans():
+            letters += text
+            letters_color += [author_to_color[author]] * len(text)
         return letters, letters_color
 
+    def _get_author_colors(self):
+        """
+        Get the color of each author of the pad
+
+        :rtype: dict[str,str]
+        """
+        colors = get_colors()
+        return {author: colors[idx_author % len(colors)] for idx_author, author in enumerate(self.authors)}
+
     def display_text_colored_by_authors(self):
         """
-        Display the text the same way as get_text but with different colors according to authors.
+        Display the text the same way as get_text but with different colors according to authors. Like get_text, only
+        the parts of the text changed since the last call are colored again.
 
         :return: None
         """
-        letters, colors = self.get_letters_and_colors_from_authors()
+        if self.rope is None:
+            self._build_rope()
+        author_to_color = self._get_author_colors()
 
-        # Print letter after letter with the right color
-        colored_text = ''.join([color + letter for letter, color in zip(letters, colors)])
+        def color_piece(text, start, end, elem_op):
+            # Print letter after letter with the right color
+            return _color_letters(text[start:end], author_to_color[elem_op.author])
+
+        # The authors are only added to the pad, so they keep their color and the colored pieces can be reused
+        colored_text = self.rope.render('colored_by_authors', color_piece)
 
         # Change color back to original
         return colored_text + get_colors()[0]
@@ -477,10 +653,32 @@ class Pad:
                     raise AssertionError
 
         # Find the  list of authors in the pad
+        self._update_authors()
+
+    def _update_authors(self):
+        """
+        Add the authors of the operations to the list of authors of the pad
+        """
         for op in self.operations:
             if op.author not in self.authors:
                 self.authors.append(op.author)
 
+    def reuse_paragraphs(self, paragraphs):
+        """
+        Use the paragraphs built for the same elementary operations grouped into other operations (e.g. with another
+        maximum_time_between_elem_ops). The paragraphs only depend on the elementary operations, so only their
+        operations are updated: the paragraphs can't be used by their previous pad anymore.
+
+        :param paragraphs: the paragraphs
+        :type paragraphs: list[Paragraph]
+        """
+        self.paragraphs = paragraphs
+        for paragraph in paragraphs:
+            # Keep the order in which the operations were added to the paragraph
+            paragraph.operations = list(dict.fromkeys(elem_op.belong_to_operation
+                                                      for elem_op in paragraph.added_elem_ops))
+        self._update_authors()
+
     def display_paragraphs(self, verbose=0):
         """
         Print all the paragraphs contained in the pad
@@ -529,44 +727,50 @@ class Pad:
         :param time_to_reset_break: Number of milliseconds to indicate the first op after a break, by default 10min
         :return: None
         """
-        # Iterate over all Operation of each Paragraph which is the same as to iterate all iterations of the pad
         pad_operations = self.operations
-        len_pad = sum([abs(op.get_length_of_op()) for op in pad_operations])
-        for op in pad_operations:
+        lengths = [abs(op.get_length_of_op()) for op in pad_operations]
+        len_pad = sum(lengths)
+        start_times = np.array([op.timestamp_start for op in pad_operations], dtype=np.float64)
+        end_times = np.array([op.timestamp_end for op in pad_operations], dtype=np.float64)
+
+        # The first op of the day or after a break comes long enough after the previous op of the pad
+        first_op_day = np.ones(len(pad_operations), dtype=bool)
+        first_op_day[1:] = start_times[1:] >= end_times[:-1] + time_to_reset_day
+        first_op_break = np.zeros(len(pad_operations), dtype=bool)
+        first_op_break[1:] = ~first_op_day[1:] & (start_times[1:] >= end_times[:-1] + time_to_reset_break)
+
+        # An op is synchronous with the ops of the other authors starting while it is written (+ some delay). For each
+        # other author, find the first of their ops (in the order of the pad) that starts in this time window
+        authors = [op.author for op in pad_operations]
+        other_authors = [author for author in dict.fromkeys(authors) if author != 'Etherpad_admin']
+        author_indices = np.array([other_authors.index(author) if author != 'Etherpad_admin' else -1
+                                   for author in authors], dtype=np.int64)
+        first_sync_op = np.full((len(pad_operations), len(other_authors)), len(pad_operations), dtype=np.int64)
+        for other_author_index in range(len(other_authors)):
+            other_ops = np.flatnonzero(author_indices == other_author_index)
+            order = np.argsort(start_times[other_ops], kind='stable')
+            other_start_times = start_times[other_ops][order]
+            window_start = np.searchsorted(other_start_times, start_times - delay_sync, side='left')
+            window_end = np.searchsorted(other_start_times, end_times + delay_sync, side='right')
+            in_window = (window_start < window_end) & (author_indices != other_author_index) & (author_indices != -1)
+            first_sync_op[in_window, other_author_index] = _range_minimum(other_ops[order], window_start[in_window],
+                                                                          window_end[in_window])
+        synchronous_with_order = np.argsort(first_sync_op, axis=1, kind='stable')
+
+        for op_index, op in enumerate(pad_operations):
             # Initialize the context
-            len_op = abs(op.get_length_of_op())
-            op.context['proportion_pad'] = len_op / len_pad
+            op.context['proportion_pad'] = lengths[op_index] / len_pad
             # An operation is originally 100% of a new paragraph
             op.context['proportion_paragraph'] = 1
-            op.context['synchronous_in_pad'] = False
-            op.context['synchronous_in_pad_with'] = []
+            synchronous_in_pad_with = [other_authors[other_author_index]
+                                       for other_author_index in synchronous_with_order[op_index].tolist()
+                                       if first_sync_op[op_index, other_author_index] != len(pad_operations)]
+            op.context['synchronous_in_pad'] = len(synchronous_in_pad_with) != 0
+            op.context['synchronous_in_pad_with'] = synchronous_in_pad_with
             op.context['synchronous_in_paragraph'] = False
             op.context['synchronous_in_paragraph_with'] = []
-            op.context['first_op_day'] = False
-            op.context['first_op_break'] = False
-            start_time = op.timestamp_start
-            end_time = op.timestamp_end
-
-            # Check in the pad if the other operations are written by someone else at the same time (+ some delay)
-            op_index = 0
-            for other_op in pad_operations:
-                other_start_time = other_op.timestamp_start
-                # Control if this is the current operation to do some processing on it
-                if other_op == op:
-                    # Check if the op is a first one
-                    if op_index == 0 or other_start_time >= pad_operations[
-                                op_index - 1].timestamp_end + time_to_reset_day:
-                        op.context['first_op_day'] = True
-                    elif op_index != 0 and other_start_time >= pad_operations[
-                                op_index - 1].timestamp_end + time_to_reset_break:
-                        op.context['first_op_break'] = True
-                op_index += 1
-
-                if other_op.author != op.author and other_op.author != 'Etherpad_admin' and op.author != 'Etherpad_admin' \
-                        and end_time + delay_sync >= other_start_time >= start_time - delay_sync:
-                    op.context['synchronous_in_pad'] = True
-                    if other_op.author not in op.context['synchronous_in_pad_with']:
-                        op.context['synchronous_in_pad_with'].append(other_op.author)
+            op.context['first_op_day'] = bool(first_op_day[op_index])
+            op.context['first_op_break'] = bool(first_op_break[op_index])
         for para in self.paragraphs:
             abs_length_para = 0
             para_ops = para.operations
@@ -845,13 +1049,7 @@ class Pad:
         :rtype: Pad
         """
 
-        new_pad = Pad(self.pad_name)
-        elem_ops = []
-        for elem_op in self.get_elem_ops(True):
-            if elem_op.timestamp <= timestamp_threshold:
-                if not elem_op.belong_to_operation in new_pad.operations:
-                    new_pad.operations.append(elem_op.belong_to_operation)
-                elem_ops.append(elem_op)
+        elem_ops = self.get_elem_ops_until(timestamp_threshold)
         pads, _, elem_ops_treated = operation_builder.build_operations_from_elem_ops({self.pad_name: elem_ops},
                                                                                      config.maximum_time_between_elem_ops)
         return pads[self.pad_name], elem_ops_treated[self.pad_name]
\ No newline at end of file
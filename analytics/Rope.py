@@ -0,0 +1,387 @@
+import itertools
+import random
+
+_MAXIMUM_SIZE_RENDERED = 256
+"""Number of characters up to which a subtree keeps its renderings (see Rope.render)"""
+
+
+class _Piece:
+    """
+    Node of a Rope: a piece of text, the view text[start:end] of a string with its attribute, and the subtree of the
+    pieces before and after it. The tree is a treap: the priority of a node is above the ones of its subtree, so the
+    tree is balanced on average.
+    """
+    __slots__ = ('text', 'start', 'end', 'attribute', 'priority', 'left', 'right', 'size', 'renderings')
+
+    def __init__(self, text, start, end, attribute, priority):
+        self.text = text
+        """str"""
+        self.start = start
+        """int"""
+        self.end = end
+        """int"""
+        self.attribute = attribute
+        """What the text is attributed to (e.g. the elementary operation which inserted it)"""
+        self.priority = priority
+        """float"""
+        self.left = None
+        """_Piece"""
+        self.right = None
+        """_Piece"""
+        self.size = end - start
+        """Number of characters of the subtree"""
+        self.renderings = None
+        """Renderings by name (see Rope.render), until the subtree changes: of the whole subtree if it has at most
+        _MAXIMUM_SIZE_RENDERED characters, of the piece alone otherwise
+
+        :type: dict[str,str]"""
+
+    def update_size(self):
+        """
+        Compute the number of characters of the subtree once a child changed
+        """
+        self.renderings = None
+        self.size = self.end - self.start + (self.left.size if self.left is not None else 0) \
+            + (self.right.size if self.right is not None else 0)
+
+
+def _split(piece, position):
+    """
+    Split a subtree in two after the given number of characters, a piece is cut in two if needed
+
+    :param piece: root of the subtree
+    :type piece: _Piece
+    :param position: number of characters of the first subtree
+    :type position: int
+    :return: the roots of the subtree of the characters before position and of the one of the characters after
+    :rtype: (_Piece,_Piece)
+    """
+    if piece is None:
+        return None, None
+    left_size = piece.left.size if piece.left is not None else 0
+    if position <= left_size:
+        before, piece.left = _split(piece.left, position)
+        piece.update_size()
+        return before, piece
+    piece_end = left_size + piece.end - piece.start
+    if position >= piece_end:
+        piece.right, after = _split(piece.right, position - piece_end)
+        piece.update_size()
+        return piece, after
+    # The position is in the piece: the piece keeps its beginning and a new piece (with the same priority, above the
+    # ones of its subtree) takes the rest
+    cut = piece.start + position - left_size
+    after = _Piece(piece.text, cut, piece.end, piece.attribute, piece.priority)
+    after.right = piece.right
+    after.update_size()
+    piece.end = cut
+    piece.right = None
+    piece.update_size()
+    return piece, after
+
+
+def _merge(before, after):
+    """
+    Concatenate two subtrees
+
+    :param before: root of the subtree of the first characters
+    :type before: _Piece
+    :param after: root of the subtree of the last characters
+    :type after: _Piece
+    :return: the root of the concatenation
+    :rtype: _Piece
+    """
+    if before is None:
+        return after
+    if after is None:
+        return before
+    if before.priority > after.priority:
+        before.right = _merge(before.right, after)
+        before.update_size()
+        return before
+    after.left = _merge(before, after.left)
+    after.update_size()
+    return after
+
+
+def _render(piece, name, render_piece, renderings):
+    """
+    Render a subtree, reusing the renderings of the subtrees which didn't change (see Rope.render). The subtrees of at
+    most _MAXIMUM_SIZE_RENDERED characters are rendered as a whole, the pieces above them are rendered alone, so the
+    renderings kept don't overlap.
+
+    :param piece: root of the subtree
+    :type piece: _Piece
+    :param name: name of the rendering
+    :type name: str
+    :param render_piece: function rendering a piece
+    :type render_piece: (str,int,int,object)->str
+    :param renderings: list to which the renderings of the pieces and of the subtrees are appended, in order
+    :type renderings: list[str]
+    """
+    if piece.size <= _MAXIMUM_SIZE_RENDERED:
+        if piece.renderings is None:
+            piece.renderings = dict()
+        elif name in piece.renderings:
+            renderings.append(piece.renderings[name])
+            return
+        subtree_renderings = []
+        _render_pieces(piece, render_piece, subtree_renderings)
+        piece.renderings[name] = ''.join(subtree_renderings)
+        renderings.append(piece.renderings[name])
+        return
+    if piece.left is not None:
+        _render(piece.left, name, render_piece, renderings)
+    if piece.renderings is None:
+        piece.renderings = dict()
+    if name not in piece.renderings:
+        piece.renderings[name] = render_piece(piece.text, piece.start, piece.end, piece.attribute)
+    renderings.append(piece.renderings[name])
+    if piece.right is not None:
+        _render(piece.right, name, render_piece, renderings)
+
+
+def _render_pieces(piece, render_piece, renderings):
+    """
+    Render each piece of a subtree. The renderings kept below it are dropped, the subtree keeps them instead (see
+    _render), so that the renderings kept don't overlap.
+
+    :param piece: root of the subtree
+    :type piece: _Piece
+    :param render_piece: function rendering a piece
+    :type render_piece: (str,int,int,object)->str
+    :param renderings: list to which the rendering of each piece is appended, in order
+    :type renderings: list[str]
+    """
+    if piece.left is not None:
+        piece.left.renderings = None
+        _render_pieces(piece.left, render_piece, renderings)
+    renderings.append(render_piece(piece.text, piece.start, piece.end, piece.attribute))
+    if piece.right is not None:
+        piece.right.renderings = None
+        _render_pieces(piece.right, render_piece, renderings)
+
+
+def _get_text_of_piece(text, start, end, attribute):
+    """
+    Render a piece as its text (see Rope.get_text)
+
+    :rtype: str
+    """
+    return text if start == 0 and end == len(text) else text[start:end]
+
+
+class Rope:
+    """
+    Editable text. The text is kept as a balanced tree of pieces, which are views of the strings inserted (e.g. the
+    texts of the ElementaryOperation), so inserting or deleting text costs O(log n) with n the number of pieces and
+    reading the whole text costs O(L) with L its length. Each piece keeps the attribute of the text inserted, the text
+    can be read as spans of text with the same attribute (see get_spans). The subtrees of a few hundred characters keep
+    their renderings (e.g. their text) until they change, so reading the text again after k edits only renders the
+    pieces of O(k) such subtrees (see render).
+
+    The positions follow the slicing of a str: the text inserted at a position after the end of the text is added at its
+    end and a negative position counts from the end.
+    """
+    __slots__ = ('root',)
+
+    def __init__(self, text=''):
+        """
+        Create a rope
+
+        :param text: the initial text
+        :type text: str
+        """
+        self.root = None
+        """_Piece"""
+        if text:
+            self.root = _Piece(text, 0, len(text), None, random.random())
+
+    def __len__(self):
+        return self.root.size if self.root is not None else 0
+
+    def __str__(self):
+        return self.get_text()
+
+    def _normalize(self, position):
+        """
+        Normalize a position the way str slicing does
+
+        :param position: a position, can be negative or after the end of the text
+        :type position: int
+        :return: the position between 0 and the length of the text
+        :rtype: int
+        """
+        length = len(self)
+        if position < 0:
+            return max(position + length, 0)
+        return min(position, length)
+
+    def insert(self, position, text, start=0, end=None, attribute=None):
+        """
+        Insert text[start:end] at position (same as text[:position] + inserted + text[position:] on a str)
+
+        :param position: position where the text is inserted
+        :type position: int
+        :param text: string containing the text inserted, it is not copied
+        :type text: str
+        :param start: start of the text inserted in the string
+        :type start: int
+        :param end: end of the text inserted in the string (excluded), the end of the string by default
+        :type end: int
+        :param attribute: attribute of the text inserted
+        """
+        if end is None:
+            end = len(text)
+        if end <= start:
+            return
+        position = self._normalize(position)
+        new_piece = _Piece(text, start, end, attribute, random.random())
+        # Walk down to the place of the new piece in the heap of priorities, then only split the subtree below it
+        parent = None
+        on_left = False
+        piece = self.root
+        while piece is not None and piece.priority > new_piece.priority:
+            piece.size += new_piece.size
+            piece.renderings = None
+            parent = piece
+            left_size = piece.left.size if piece.left is not None else 0
+            on_left = position <= left_size
+            if on_left:
+                piece = piece.left
+                continue
+            piece_end = left_size + piece.end - piece.start
+            if position >= piece_end:
+                position -= piece_end
+                piece = piece.right
+                continue
+            # The position is in the piece: its end is moved to a new piece which is inserted first after it
+            cut = piece.start + position - left_size
+            rest = _Piece(piece.text, cut, piece.end, piece.attribute, piece.priority)
+            rest.right = piece.right
+            rest.update_size()
+            piece.end = cut
+            piece.right = rest
+            # The rest is a part of the subtree on the right that starts at its beginning
+            position = 0
+            piece = rest
+        new_piece.left, new_piece.right = _split(piece, position)
+        new_piece.update_size()
+        if parent is None:
+            self.root = new_piece
+        elif on_left:
+            parent.left = new_piece
+        else:
+            parent.right = new_piece
+
+    def delete(self, position, length):
+        """
+        Delete length characters from position (same as text[:position] + text[position + length:] on a str)
+
+        :param position: position of the first character deleted
+        :type position: int
+        :param length: number of characters deleted
+        :type length: int
+        """
+        start = self._normalize(position)
+        end = self._normalize(position + length)
+        if end == start:
+            return
+        if end < start:
+            # Slicing a str with a negative length repeats the text in between: the rope is rebuilt from the pieces
+            # before start and the (copies of the) pieces after end
+            pieces = list(self._get_pieces())
+            self.root = None
+            for text, piece_start, piece_end, attribute in itertools.chain(_slice_pieces(pieces, 0, start),
+                                                                          _slice_pieces(pieces, end, None)):
+                self.insert(len(self), text, piece_start, piece_end, attribute)
+            return
+        before, after = _split(self.root, start)
+        _, after = _split(after, end - start)
+        self.root = _merge(before, after)
+
+    def _get_pieces(self):
+        """
+        Iterate over the pieces in the order of the text
+
+        :return: the string, the start and the end of the view and the attribute of each piece
+        :rtype: collections.Iterable[(str,int,int,object)]
+        """
+        # In-order traversal of the tree
+        stack = []
+        piece = self.root
+        while stack or piece is not None:
+            while piece is not None:
+                stack.append(piece)
+                piece = piece.left
+            piece = stack.pop()
+            yield piece.text, piece.start, piece.end, piece.attribute
+            piece = piece.right
+
+    def get_text(self):
+        """
+        Get the whole text
+
+        :rtype: str
+        """
+        return self.render('text', _get_text_of_piece)
+
+    def render(self, name, render_piece):
+        """
+        Render the text piece by piece, e.g. with the color of the attribute of each piece. The rendering of the subtrees
+        of at most _MAXIMUM_SIZE_RENDERED characters, and of each piece above them, is kept until one of their pieces
+        changes. After a few edits only the subtrees around the edits are rendered again, the others are concatenated.
+        The renderings kept take about as much memory as one rendering of the whole text.
+
+        :param name: name of the rendering, all the renderings with the same name must use the same render_piece
+        :type name: str
+        :param render_piece: function rendering text[start:end] of a piece with its attribute. A piece must always
+            be rendered the same way.
+        :type render_piece: (str,int,int,object)->str
+        :return: the concatenation of the renderings of the pieces
+        :rtype: str
+        """
+        if self.root is None:
+            return ''
+        renderings = []
+        _render(self.root, name, render_piece, renderings)
+        return ''.join(renderings)
+
+    def get_spans(self):
+        """
+        Get the text as spans of consecutive characters with the same attribute
+
+        :return: the text and the attribute of each span
+        :rtype: list[(str,object)]
+        """
+        spans = []
+        for attribute, pieces in itertools.groupby(self._get_pieces(), key=lambda piece: piece[3]):
+            spans.append((''.join(text[start:end] for text, start, end, _ in pieces), attribute))
+        return spans
+
+
+def _slice_pieces(pieces, start, end):
+    """
+    Cut the pieces of a text to only keep the characters from start to end
+
+    :param pieces: the string, the start and the end of the view and the attribute of each piece
+    :type pieces: list[(str,int,int,object)]
+    :param start: position of the first character kept
+    :type start: int
+    :param end: position after the last character kept, None to keep the end of the text
+    :type end: int
+    :return: the pieces kept
+    :rtype: list[(str,int,int,object)]
+    """
+    sliced = []
+    position = 0
+    for text, piece_start, piece_end, attribute in pieces:
+        piece_position = position
+        position += piece_end - piece_start
+        if position <= start:
+            continue
+        if end is not None and piece_position >= end:
+            break
+        sliced.append((text, piece_start + max(start - piece_position, 0),
+                       piece_end - (max(position - end, 0) if end is not None else 0), attribute))
+    return sliced
@@ -9,22 +9,19 @@ import os
 import math
 from sklearn.cluster import KMeans
 
-list_of_elem_ops_per_pad = dict()
 elemOpsCounter = 0
 root_of_dbs = "../belgian_experiment/"
-# Os walk among all the directories containing all the pads.
-for (dirpath, dirnames, filenames) in os.walk(root_of_dbs):
-    for filename in filenames:
-        if ".db" in filename:
-            path_to_db = os.path.join(dirpath, filename)
-            # Fetching the new operations
-            list_of_elem_ops_per_main, _ = get_elem_ops_per_pad_from_db(path_to_db=path_to_db, editor='etherpadSQLite3')
-            # the pad extracted from each file always have the same name so we give them a new name based on their path
-            pad_name = path_to_db[len(root_of_dbs):path_to_db.find("data") - 1]
-            # We check that there is only one pad per file as there should be (one pad per session)
-            assert len(list_of_elem_ops_per_main.keys()) == 1
-            # we rename it
-            list_of_elem_ops_per_pad[pad_name] = list_of_elem_ops_per_main['main']
+
+
+def session_pad_name(path_to_db, pad_name):
+    # the pad extracted from each file always have the same name so we give them a new name based on their path
+    assert pad_name == 'main'
+    return path_to_db[len(root_of_dbs):path_to_db.find("data") - 1]
+
+
+# Parse all the files containing the pads (one pad per session) in parallel
+list_of_elem_ops_per_pad = get_elem_ops_per_pad_from_corpus(root_of_dbs, editor='etherpadSQLite3',
+                                                            pad_naming=session_pad_name, jobs=os.cpu_count())
 
 # We create the operation from the list of elementary operations
 pads, _, elem_ops_treated = operation_builder.build_operations_from_elem_ops(list_of_elem_ops_per_pad,
@@ -1,113 +1,20 @@
 # Main file to display the metrics and visualizations from the belgian experiment pads
 import config
-from analytics import operation_builder
+from analytics import pipeline
 from analytics.parser import *
 from analytics.visualization import *
 import os
 
-list_of_elem_ops_per_pad = dict()
-elemOpsCounter = 0
 root_of_dbs = "../belgian_experiment/"
-# Walk among all the files containing the pads.
-for (dirpath, dirnames, filenames) in os.walk(root_of_dbs):
-    for filename in filenames:
-        if ".db" in filename:
-            path_to_db = os.path.join(dirpath, filename)
-            # Fetching the new operations
-            list_of_elem_ops_per_main, _ = get_elem_ops_per_pad_from_db(path_to_db=path_to_db, editor='etherpadSQLite3')
-            # the pad extracted from each file always have the same name so we give them a new name based on their path
-            pad_name = path_to_db[len(root_of_dbs):path_to_db.find("data") - 1]
-            # We check that there is only one pad per file as there should be (one pad per session)
-            assert len(list_of_elem_ops_per_main.keys()) == 1
-            # we rename it
-            list_of_elem_ops_per_pad[pad_name] = list_of_elem_ops_per_main['main']
 
-# We create the operation from the list of elementary operations
-pads, _, elem_ops_treated = operation_builder.build_operations_from_elem_ops(list_of_elem_ops_per_pad,
-                                                                             config.maximum_time_between_elem_ops)
-# For each pad we create its paragraphs, classify its operations and create their context
-for pad_name in pads:
-    elemOpsCounter += len(elem_ops_treated[pad_name])
-    pad = pads[pad_name]
-    # create the paragraphs
-    pad.create_paragraphs_from_ops(elem_ops_treated[pad_name])
-    # classify the operations of the pad
-    pad.classify_operations(length_edit=config.length_edit, length_delete=config.length_delete)
-    # find the context of the operation of the pad
-    pad.build_operation_context(config.delay_sync, config.time_to_reset_day, config.time_to_reset_break)
 
-print("There are %s pads with a total of %s elementary operations" % (str(len(pads)), str(elemOpsCounter)))
+def session_pad_name(path_to_db, pad_name):
+    # the pad extracted from each file always have the same name so we give them a new name based on their path
+    assert pad_name == 'main'
+    return path_to_db[len(root_of_dbs):path_to_db.find("data") - 1]
 
-user_participation_paragraph_score_list = []
-prop_score_list = []
-sync_score_list = []
-alternating_score_list = []
-break_score_day_list = []
-break_score_short_list = []
-type_overall_score_write_list = []
-type_overall_score_delete_list = []
-type_overall_score_edit_list = []
-type_overall_score_paste_list = []
-user_type_score_delete_list = []
-user_type_score_edit_list = []
-user_type_score_write_list = []
-user_type_score_paste_list = []
-
-# We calcuate the metrics
-for pad_name in pads:
-    pad = pads[pad_name]
-    user_participation_paragraph_score = pad.user_participation_paragraph_score()
-    user_participation_paragraph_score_list.append(user_participation_paragraph_score)
-    prop_score = pad.prop_score()
-    prop_score_list.append(prop_score)
-    sync_score = pad.sync_score()[0]
-    sync_score_list.append(sync_score)
-    alternating_score = pad.alternating_score()
-    alternating_score_list.append(alternating_score)
-    break_score_day = pad.break_score('day')
-    break_score_day_list.append(break_score_day)
-    break_score_short = pad.break_score('short')
-    break_score_short_list.append(break_score_short)
-    type_overall_score_write = pad.type_overall_score('write')
-    type_overall_score_write_list.append(type_overall_score_write)
-    type_overall_score_paste = pad.type_overall_score('paste')
-    type_overall_score_paste_list.append(type_overall_score_paste)
-    type_overall_score_delete = pad.type_overall_score('delete')
-    type_overall_score_delete_list.append(type_overall_score_delete)
-    type_overall_score_edit = pad.type_overall_score('edit')
-    type_overall_score_edit_list.append(type_overall_score_edit)
-    user_type_score_write = pad.user_type_score('write')
-    user_type_score_write_list.append(user_type_score_write)
-    user_type_score_paste = pad.user_type_score('paste')
-    user_type_score_paste_list.append(user_type_score_paste)
-    user_type_score_delete = pad.user_type_score('delete')
-    user_type_score_delete_list.append(user_type_score_delete)
-    user_type_score_edit = pad.user_type_score('edit')
-    user_type_score_edit_list.append(user_type_score_edit)
-
-    to_print = "PAD:" + pad_name + "\n" \
-               + "TEXT:\n" + pad.get_text() + "\n" \
-               + '\nCOLORED TEXT BY AUTHOR\n' + pad.display_text_colored_by_authors() + "\n" \
-               + '\nCOLORED TEXT BY OPS\n' + pad.display_text_colored_by_ops() + "\n" \
-               + '\nSCORES' \
-               + '\nUser proportion per paragraph score:' + str(user_participation_paragraph_score) \
-               + '\nProportion score:' + str(prop_score) \
-               + '\nSynchronous score:' + str(sync_score) \
-               + '\nAlternating score:' + str(alternating_score) \
-               + '\nBreak score day:' + str(break_score_day) \
-               + '\nBreak score short:' + str(break_score_short) \
-               + '\nOverall write type score:' + str(type_overall_score_write) \
-               + '\nOverall paste type score:' + str(type_overall_score_paste) \
-               + '\nOverall delete type score:' + str(type_overall_score_delete) \
-               + '\nOverall edit type score:' + str(type_overall_score_edit) \
-               + '\nUser write score:' + str(user_type_score_write) \
-               + '\nUser paste score:' + str(user_type_score_paste) \
-               + '\nUser delete score:' + str(user_type_score_delete) \
-               + '\nUser edit score:' + str(user_type_score_edit)
-    print(to_print)
-    with open("texts/" + pad_name + ".txt", "w+", encoding='utf-8') as f:
-        f.write(to_print)
 
+def save_visualizations(pad):
     # TODO save them at different places
     # We save the visualizations (each time they overwrite the previous)
     display_user_participation(pad, config.figs_save_location)
@@ -124,3 +31,34 @@ for pad_name in pads:
 
     # plot the counts of type per users
     display_types_per_user(pad, config.figs_save_location)
+
+
+if __name__ == '__main__':
+    # Parse all the files containing the pads (one pad per session) in parallel
+    list_of_elem_ops_per_pad = get_elem_ops_per_pad_from_corpus(root_of_dbs, editor='etherpadSQLite3',
+                                                                pad_naming=session_pad_name, jobs=os.cpu_count(),
+                                                                cache_location=config.parser_cache_location)
+    elemOpsCounter = sum(len(elem_ops) for elem_ops in list_of_elem_ops_per_pad.values())
+
+    # For each pad we create the operations, the paragraphs, classify its operations, create their context and
+    # calculate the metrics in worker processes. The visualizations are saved by the workers.
+    results = pipeline.run_pipeline(list_of_elem_ops_per_pad, jobs=os.cpu_count(), texts=True,
+                                    pad_callback=save_visualizations)
+
+    print("There are %s pads with a total of %s elementary operations" % (str(len(results)), str(elemOpsCounter)))
+
+    # The scores of all the pads for each metric
+    score_lists = dict()
+    for pad_name, result in results.items():
+        to_print = "PAD:" + pad_name + "\n" \
+                   + "TEXT:\n" + result['text'] + "\n" \
+                   + '\nCOLORED TEXT BY AUTHOR\n' + result['text_colored_by_authors'] + "\n" \
+                   + '\nCOLORED TEXT BY OPS\n' + result['text_colored_by_ops'] + "\n" \
+                   + '\nSCORES'
+        for metric_name, score in result.items():
+            if metric_name not in pipeline.TEXT_KEYS:
+                score_lists.setdefault(metric_name, []).append(score)
+                to_print += '\n' + metric_name + ':' + str(score)
+        print(to_print)
+        with open("texts/" + pad_name + ".txt", "w+", encoding='utf-8') as f:
+            f.write(to_print)
@@ -8,7 +8,8 @@ from analytics.visualization import *
 
 path_to_db = "../stian logs/store.csv"
 # We fetch the elementary operations
-list_of_elem_ops_per_pad, _ = parser.get_elem_ops_per_pad_from_db(path_to_db, 'stian_logs')
+list_of_elem_ops_per_pad, _ = parser.get_elem_ops_per_pad_from_db(path_to_db, 'stian_logs',
+                                                                   cache_location=config.parser_cache_location)
 print(list_of_elem_ops_per_pad.keys())
 print(len(list_of_elem_ops_per_pad.keys()))
 
@@ -1,217 +1,728 @@
+import itertools
+import operator
+
+import numpy as np
+
 from analytics.Pad import Pad
-from analytics.Operations import Operation, ElementaryOperation
+from analytics.Operations import Operation, ElementaryOperation, ElementaryOperationPart
 from analytics import Operations
 
 
-def build_operations_from_elem_ops(list_of_elem_ops_per_pad, maximum_time_between_elem_ops,
-                                   dic_author_current_operations_per_pad=None, pads=None):
+class OperationBuilder:
+    """
+    Build the operations of a pad from a stream of elementary operations. The elementary operations are added one at a
+    time and only the last operation of each author is kept by the builder. An Operation is pushed to the pad when the
+    next operation of its author replaces it, when a new line ends it, or at the end of a batch of elementary
+    operations (see push_operations), so the order of the operations of the pad doesn't depend on the watermark.
+
+    The time of the elementary operations is used as a watermark: when it passes the timestamp_end of an open
+    Operation plus maximum_time_between_elem_ops, no elementary operation can be added to this Operation anymore, so
+    it is closed and emitted. An elementary operation older than the watermark (arriving late) never reopens an
+    Operation. The last Operation of each author is still moved by the edits of the other authors once closed, until
+    the author starts a new one (see Operation.update_indices).
     """
-    Create a object Pad for each pad and create the operations for each one. If pads is specified, add the new 
-    operation to the current list of pads. If dic_author_current_operations_per_pad is not none, it represent the 
-    last operation of each author in case the new elementary operation should be added to this operation instead of 
-    creating a new operation. 
 
-    :param list_of_elem_ops_per_pad: dictionary of elementary operation per pad
+    def __init__(self, pad, maximum_time_between_elem_ops):
+        """
+        Create a builder for a pad
+
+        :param pad: the pad to which the operations are added
+        :type pad: Pad
+        :param maximum_time_between_elem_ops: maximum time idle so that it's part of the same op
+        :type maximum_time_between_elem_ops: int
+        """
+        self.pad = pad
+        self.maximum_time_between_elem_ops = maximum_time_between_elem_ops
+        self.open_operations = dict()
+        """The current ongoing operation of each author, to which the next elementary operations may be added
+        
+        :type: dict[str,Operation]"""
+        self.last_operations = dict()
+        """The last operation of each author, open or closed, whose position is moved by the edits of the other authors.
+        It is pushed to the pad when it is replaced (the order of the authors is kept for push_operations)
+        
+        :type: dict[str,Operation]"""
+        self.watermark = None
+        """Timestamp of the most recent elementary operation"""
+
+    def add_elem_op(self, elem_op, elem_ops_treated=None):
+        """
+        Add an elementary operation to the open Operation of its author or create a new Operation. An elementary
+        operation with new lines is split so that each new line is isolated (for the construction of the paragraphs).
+
+        :param elem_op: the elementary operation, more recent than the previous ones
+        :type elem_op: ElementaryOperation
+        :param elem_ops_treated: list to which the elementary operations actually added (after the split) are appended
+        :type elem_ops_treated: list[ElementaryOperation]
+        :return: the operations closed by this elementary operation
+        :rtype: list[Operation]
+        """
+        if elem_ops_treated is None:
+            elem_ops_treated = []
+        number_of_elem_ops_treated = len(elem_ops_treated)
+        closed_operations = self.advance_watermark(elem_op.timestamp)
+        if elem_op.operation_type == "add" and "\n" in elem_op.text_to_add:
+            first_elem_op, middle_elem_ops, last_elem_op = split_elem_op_on_newlines(elem_op)
+            # For the first element we add it to the current operation if possible
+            if first_elem_op is not None:
+                elem_ops_treated.append(first_elem_op)
+                self._treat_op(first_elem_op, closed_operations)
+            # close the op because after we only have new lines
+            if elem_op.author in self.open_operations:
+                closed_operations.append(self.open_operations.pop(elem_op.author))
+            # push to the pad the op because after we only have new lines
+            if elem_op.author in self.last_operations:
+                self.pad.add_operation(self.last_operations.pop(elem_op.author))
+            # The new lines and the text in between are operations on their own
+            for new_elem_op in middle_elem_ops:
+                elem_ops_treated.append(new_elem_op)
+                operation = Operation(new_elem_op)
+                self.pad.add_operation(operation)
+                closed_operations.append(operation)
+            if last_elem_op is not None:
+                elem_ops_treated.append(last_elem_op)
+                self._open_op(last_elem_op)
+        else:
+            # if the elementary operation does not contain a new line
+            elem_ops_treated.append(elem_op)
+            self._treat_op(elem_op, closed_operations)
+
+        # Notify all other current operation of other users that their indices might have changed (important to
+        # check when a user has moved the text
+        for author, operation in self.last_operations.items():
+            if author is not elem_op.author:
+                operation.update_indices(elem_op)
+        # Add the elementary operations to the pad and keep its text up to date
+        self.pad.apply_elem_ops(elem_ops_treated[number_of_elem_ops_treated:])
+        return closed_operations
+
+    def advance_watermark(self, timestamp):
+        """
+        Move the watermark forward and close the operations that can't be continued anymore, i.e. whose last
+        elementary operation is older than timestamp - maximum_time_between_elem_ops
+
+        :param timestamp: time up to which the elementary operations have been added
+        :type timestamp: int|float
+        :return: the operations closed
+        :rtype: list[Operation]
+        """
+        if self.watermark is not None and timestamp <= self.watermark:
+            return []
+        self.watermark = timestamp
+        closed_authors = [author for author, operation in self.open_operations.items()
+                          if timestamp - operation.timestamp_end >= self.maximum_time_between_elem_ops]
+        return [self.open_operations.pop(author) for author in closed_authors]
+
+    def flush(self):
+        """
+        Close all the open operations, e.g. at the end of the elementary operations
+
+        :return: the operations closed
+        :rtype: list[Operation]
+        """
+        closed_operations = list(self.open_operations.values())
+        self.open_operations.clear()
+        return closed_operations
+
+    def push_operations(self):
+        """
+        Push to the pad the last operation of each author that is not in it yet, e.g. at the end of a batch of
+        elementary operations. They may still be continued by the next elementary operations.
+        """
+        self.pad.add_operations(self.last_operations.values())
+
+    def _open_op(self, elem_op):
+        """
+        Create a new Operation starting with elem_op and keep it open
+
+        :param elem_op: the first elementary operation of the Operation
+        :type elem_op: ElementaryOperation
+        """
+        operation = Operation(elem_op)
+        self.open_operations[elem_op.author] = operation
+        self.last_operations[elem_op.author] = operation
+
+    def _treat_op(self, elem_op, closed_operations):
+        """
+        Add the elementary operation to the open operation of its author or close it and create a new one, depending
+        on the criterias. The last operation of the author is pushed to the pad when it is replaced
+
+        :param elem_op: The elem_op to add
+        :type elem_op: ElementaryOperation
+        :param closed_operations: list to which the closed operation is appended
+        :type closed_operations: list[Operation]
+        """
+        current_op = self.open_operations.get(elem_op.author)
+        if current_op is not None:
+            # check whether it should be part of the current operation
+            if elem_op.timestamp - current_op.timestamp_end < self.maximum_time_between_elem_ops \
+                    and current_op.position_start_of_op \
+                    - abs(elem_op.get_length_of_op()) \
+                    <= elem_op.abs_position \
+                    <= current_op.position_start_of_op \
+                    + abs(current_op.get_length_of_op()):
+                # Time between the last ElementaryOperation of the Operation and our current ElementaryOperation is
+                # smaller than maximum_time_between_elem_ops and the position of the elementary op is more or less
+                # inside the Operation bounds
+                current_op.add_elem_op(elem_op)
+                return
+            # If it shouldn't be added to the operation. We close the operation and create a new operation
+            closed_operations.append(current_op)
+        if elem_op.author in self.last_operations:
+            self.pad.add_operation(self.last_operations[elem_op.author])
+        self._open_op(elem_op)
+
+
+def split_elem_op_on_newlines(elem_op):
+    """
+    Split an elementary operation adding text with new lines so that each new line is isolated. The parts are views of
+    the text of the elementary operation (see ElementaryOperationPart), they keep its timestamp and are ordered by
+    their sequence.
+
+    :param elem_op: the elementary operation adding text with at least one new line
+    :type elem_op: ElementaryOperation
+    :return: the text before the first new line (None if there is none), the new lines and the text in between and
+        the text after the last new line (None if there is none)
+    :rtype: (ElementaryOperationPart,list[ElementaryOperationPart],ElementaryOperationPart)
+    """
+    text = elem_op.text_to_add
+    abs_position = elem_op.abs_position
+    idx_newline = text.find("\n")
+    first_elem_op = None
+    # Text before the newline
+    if idx_newline != 0:
+        first_elem_op = ElementaryOperationPart(elem_op, 0, idx_newline, abs_position, 0)
+
+    # we decomposed the op by their new_line
+    middle_elem_ops = []
+    while True:
+        # The bounds are shared by the consecutive parts
+        idx_line = idx_newline + 1
+        # Warning ! doesn't update the line number
+        middle_elem_ops.append(ElementaryOperationPart(elem_op, idx_newline, idx_line, abs_position + idx_newline,
+                                                       len(middle_elem_ops) + 1))
+        idx_next_newline = text.find("\n", idx_line)
+        if idx_next_newline == -1:
+            break
+        if idx_next_newline != idx_line:
+            # if the text in between is also characters
+            middle_elem_ops.append(ElementaryOperationPart(elem_op, idx_line, idx_next_newline,
+                                                           abs_position + idx_line, len(middle_elem_ops) + 1))
+        idx_newline = idx_next_newline
+
+    last_elem_op = None
+    # The remaining chars after the last new line
+    if idx_line != len(text):
+        last_elem_op = ElementaryOperationPart(elem_op, idx_line, len(text), abs_position + idx_line,
+                                               len(middle_elem_ops) + 1)
+    return first_elem_op, middle_elem_ops, last_elem_op
+
+
+def build_operations_from_elem_ops(list_of_elem_ops_per_pad, maximum_time_between_elem_ops, builders_per_pad=None,
+                                   pads=None):
+    """
+    Create a object Pad for each pad and create the operations for each one with an OperationBuilder. If pads is
+    specified, add the new operation to the current list of pads. If builders_per_pad is not none, it contains the
+    builders of the previous call, whose open operations may be continued by the new elementary operations instead of
+    creating new operations.
+
+    :param list_of_elem_ops_per_pad: dictionary of elementary operation per pad, sorted by timestamp
     :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
     :param maximum_time_between_elem_ops: maximum type idle so that it's part of the same op
     :type maximum_time_between_elem_ops: int
-    :param dic_author_current_operations_per_pad: The current ongoing operations
-    :type dic_author_current_operations_per_pad: dict[str,dict[str,Operation]]
+    :param builders_per_pad: The builders of each pad, with their open operations
+    :type builders_per_pad: dict[str,OperationBuilder]
     :param pads: The current pads
     :type pads: dict[str,Pad]
-    :return: a dictionary of pads, the current operations that might changed depending on the next elem_ops, and the
-        list of elem_ops (they might have changed if there were some new lines.
-    :rtype: (dict[str,Pad],dict[str,dict[str,Operation]],dict[str,list[ElementaryOperation]])
+    :return: a dictionary of pads, the builders of each pad for the next elem_ops, and the list of elem_ops (they might
+        have changed if there were some new lines.
+    :rtype: (dict[str,Pad],dict[str,OperationBuilder],dict[str,list[ElementaryOperation]])
     """
-
+    if pads is None:
+        pads = dict()
+        """:type: dict[str,Pad]"""
+    if builders_per_pad is None:
+        builders_per_pad = dict()
+        """:type: dict[str,OperationBuilder]"""
     # The new list of elementary operation since it might change. (if we have new lines, we isolate the new line for
     # the construction of the paragraphs)
     elem_ops_treated = dict()
     """:type: dict[str,list[ElementaryOperation]]"""
-    for pad_name in list_of_elem_ops_per_pad:
-        # If it doesn't exist, create a pad for each pad present in the list of elem_ops
-        if pads is not None:
-            if pad_name in pads:
-                pad = pads[pad_name]
-            else:
-                pad = Pad(pad_name)
-        else:
-            pads = dict()
-            """:type:dict[str,Pad]"""
-            pad = Pad(pad_name)
-
-        # If we have operation in standby, we get them.
-        if dic_author_current_operations_per_pad is not None:
-            if pad_name in dic_author_current_operations_per_pad:
-                dic_author_current_operations = dic_author_current_operations_per_pad[pad_name]
-            else:
-                dic_author_current_operations = dict()
-                """:type:dict[str,Operation]"""
-        else:
-            dic_author_current_operations_per_pad = dict()
-            """:type:dict[str,dict[str,Operation]]"""
-            dic_author_current_operations = dict()
-            """:type:dict[str,Operation]"""
+    for pad_name, elem_ops in list_of_elem_ops_per_pad.items():
+        # If it doesn't exist, create a pad and its builder for each pad present in the list of elem_ops
+        if pad_name not in pads:
+            pads[pad_name] = Pad(pad_name)
+        builder = builders_per_pad.get(pad_name)
+        if builder is None:
+            builder = builders_per_pad[pad_name] = OperationBuilder(pads[pad_name], maximum_time_between_elem_ops)
         elem_ops_treated[pad_name] = []
+        for elem_op in elem_ops:
+            builder.add_elem_op(elem_op, elem_ops_treated[pad_name])
+        # at the end of the list of elementary operations, push all the unfinished operations to the pad. (we might
+        # add it new elementary operation later on)
+        builder.push_operations()
 
-        # For each elementary operation, we study it and add it to a existing operation or create a new one
-        for elem_op in list_of_elem_ops_per_pad[pad_name]:
-            if elem_op.operation_type == "add" and "\n" in elem_op.text_to_add:
-                # Split the elem_op if it contains a new line
-                idx_newline = elem_op.text_to_add.find("\n")
-                elem_op_txts = []
-                # Text before the newline
-                if elem_op.text_to_add[0] != "\n":
-                    first_elem_op_txt = elem_op.text_to_add[:idx_newline]
-                else:
-                    first_elem_op_txt = ""
-
-                # we decomposed the op by their new_line
-                while idx_newline != -1:
-                    elem_op_txts.append("\n")
-                    # Add the text between our new line and the next new line
-                    idx_next_newline = elem_op.text_to_add.find("\n", idx_newline + 1)
-                    if idx_next_newline == -1:
-                        # We are the last new line
-                        # We add the remaining chars (if there are none, it will be an empty string)
-                        last_elem_op_txt = elem_op.text_to_add[idx_newline + 1:]
-
-                    elif elem_op.text_to_add[idx_newline:idx_next_newline] != "\n":
-                        # if the text in between is also characters
-                        elem_op_txts.append(
-                            elem_op.text_to_add[idx_newline + 1:elem_op.text_to_add.find("\n", idx_newline + 1)])
-                    # Update our position
-                    idx_newline = idx_next_newline
-
-                abs_position = elem_op.abs_position
-                # For the firs element we add it to the current operation if possible
-                if first_elem_op_txt != "":
-                    first_elem_op = elem_op.copy()
-                    first_elem_op.text_to_add = first_elem_op_txt
-                    elem_ops_treated[pad_name].append(first_elem_op)
-                    dic_author_current_operations = treat_op(first_elem_op, dic_author_current_operations, pad,
-                                                             maximum_time_between_elem_ops)
-                    abs_position += len(first_elem_op.text_to_add)
-                # push to the pad the op because after we only have new lines
-                if elem_op.author in dic_author_current_operations.keys():
-                    pad.add_operation(dic_author_current_operations[elem_op.author])
-                    del dic_author_current_operations[elem_op.author]
-                # For all the new lines and text after we create separate elem_ops
-                number_of_new_elem_ops = float(len(elem_op_txts)) + 10  # +10 just to be safe
-                for idx, txt in enumerate(elem_op_txts):
-                    if txt is not "":
-                        # Warning ! doesn't update the line number
-                        new_elem = elem_op.copy()
-                        new_elem.text_to_add = txt
-                        new_elem.abs_position = abs_position
-                        new_elem.current_position = abs_position
-                        # We offset the timestamp so that we keep the order
-                        new_elem.timestamp += (idx + 1) / number_of_new_elem_ops
-                        elem_ops_treated[pad_name].append(new_elem)
-                        pad.add_operation(Operation(new_elem))
-                        abs_position += len(new_elem.text_to_add)
-
-                if last_elem_op_txt != "":
-                    last_elem_op = elem_op.copy()
-                    last_elem_op.text_to_add = last_elem_op_txt
-                    last_elem_op.abs_position = abs_position
-                    last_elem_op.current_position = abs_position
-                    # We offset the timestamp so that we keep the order
-                    last_elem_op.timestamp += (len(elem_op_txts) + 1) / number_of_new_elem_ops
-                    elem_ops_treated[pad_name].append(last_elem_op)
-                    dic_author_current_operations[elem_op.author] = Operation(last_elem_op)
-
-            else:
-                # if the elementary operation does not contain a new line
-                elem_ops_treated[pad_name].append(elem_op)
-                dic_author_current_operations = treat_op(elem_op, dic_author_current_operations, pad,
-                                                         maximum_time_between_elem_ops)
+    return pads, builders_per_pad, elem_ops_treated
 
-            # Notify all other current operation of other users that their indices might have changed (important to
-            # check when a user has moved the text
-            for user in dic_author_current_operations.keys():
-                if user is not elem_op.author:
-                    dic_author_current_operations[user].update_indices(elem_op)
 
-        # at the end of the list of elementary operations, push all the unfinished operations to the pad. (we might
-        # add it new elementary operation later on)
-        for remaining_authors in dic_author_current_operations:
-            pad.add_operation(dic_author_current_operations[remaining_authors])
+_get_abs_position = operator.attrgetter('abs_position')
+_get_author = operator.attrgetter('author')
+_get_timestamp = operator.attrgetter('timestamp')
 
-        # Keep track of the the last operations to which we could maybe add the next elementary operations
-        pads[pad_name] = pad
-        dic_author_current_operations_per_pad[pad_name] = dic_author_current_operations
+# Kind of the elementary operations once those with new lines are split (see split_elem_op_on_newlines)
+_CONTINUABLE = 0
+"""The elementary operation may be added to the open operation of its author"""
+_ALONE = 1
+"""A new line or the text between two new lines, it is an operation on its own"""
+_RESTART = 2
+"""The text after the last new line, it starts a new operation"""
 
-    return pads, dic_author_current_operations_per_pad, elem_ops_treated
+# Number of rounds of vectorized position tests before the remaining operations are split one elementary operation at
+# a time (each round only finds the first split of each group)
+_MAXIMUM_VECTORIZED_ROUNDS = 8
 
 
-def treat_op(elem_op, dic_author_current_operations, pad, maximum_time_between_elem_ops):
+def group_elem_ops(elem_ops, maximum_time_between_elem_ops):
     """
-    Treat the elementary operation by adding it to the current operation or creating one and adding the last to the
-    pad, depending on the criterias
+    Group the elementary operations of a pad into operations at once, for offline runs. The operations are the same as
+    the ones of an OperationBuilder fed with the same elementary operations, but the time gaps and the position bounds
+    are tested on arrays: the elementary operations are split into groups by author and time gaps, and each group is
+    split further where the position test fails. Only the groups during which other authors edited the pad before the
+    operation (moving it) are followed one elementary operation at a time.
 
-    :param elem_op: The elem_op to add
-    :type elem_op: ElementaryOperation
-    :param dic_author_current_operations: The list of current ongoing operations by authors
-    :type dic_author_current_operations: dict[str,Operation]
-    :param pad: The pad we look at
-    :type pad: Pad
-    :param maximum_time_between_elem_ops: Maximum type idle so that it's part of the same op
+    :param elem_ops: elementary operations of the pad sorted by timestamp
+    :type elem_ops: list[ElementaryOperation]
+    :param maximum_time_between_elem_ops: maximum time idle so that it's part of the same op
     :type maximum_time_between_elem_ops: int
-    :return: The updated dic_dic_author_current_operations
-    :rtype: dict[str,Operation]
-    """
-    if elem_op.author in dic_author_current_operations.keys():
-        # This author is already in a current Operation
-        new_time = elem_op.timestamp
-        new_position = elem_op.abs_position
-        current_op = dic_author_current_operations[elem_op.author]
-
-        # check whether it should be part of the current operation
-        if new_time - current_op.timestamp_end < maximum_time_between_elem_ops:
-            # Time between the last ElementaryOperation of the Operation and our current ElementaryOperation is
-            # smaller than maximum_time_between_elem_ops
-            if current_op.position_start_of_op \
-                    - abs(elem_op.get_length_of_op()) \
-                    <= new_position \
-                    <= current_op.position_start_of_op \
-                    + abs(current_op.get_length_of_op()):
-                # Checking that the position of the elementary op is more or less inside the Operation bounds
-                current_op.add_elem_op(elem_op)
-                return dic_author_current_operations
+    :return: the elementary operations once those with new lines are split (see OperationBuilder.add_elem_op), the
+        index of the operation of each of them (the operations are numbered in the order an OperationBuilder pushes
+        them to the pad) and the position_start_of_op and position_first_op of each operation (see
+        _replay_operation_positions)
+    :rtype: (list[ElementaryOperation],np.ndarray,np.ndarray)
+    """
+    elem_ops_treated, operation_indices, operation_positions = group_elem_ops_for_thresholds(
+        elem_ops, [maximum_time_between_elem_ops])
+    return elem_ops_treated, operation_indices[maximum_time_between_elem_ops], \
+        operation_positions[maximum_time_between_elem_ops]
+
+
+def group_elem_ops_for_thresholds(elem_ops, maximum_times):
+    """
+    Group the elementary operations of a pad into operations for several maximum times between the elementary
+    operations of an operation (see group_elem_ops). The elementary operations are split and put in arrays only once,
+    so a sweep over the maximum times costs little more than a single grouping.
+
+    :param elem_ops: elementary operations of the pad sorted by timestamp
+    :type elem_ops: list[ElementaryOperation]
+    :param maximum_times: maximum times idle so that it's part of the same op
+    :type maximum_times: list[int]
+    :return: the elementary operations once those with new lines are split and, for each maximum time, the index of the
+        operation of each of them and the positions of each operation
+    :rtype: (list[ElementaryOperation],dict[int,np.ndarray],dict[int,np.ndarray])
+    """
+    number_of_elem_ops = len(elem_ops)
+    texts = list(map(getattr, elem_ops, itertools.repeat('text_to_add'), itertools.repeat('')))
+    deleted = np.fromiter(map(getattr, elem_ops, itertools.repeat('length_to_delete'), itertools.repeat(0)), np.int64,
+                          number_of_elem_ops)
+    added = np.fromiter(map(len, texts), np.int64, number_of_elem_ops)
+    positions = np.fromiter(map(_get_abs_position, elem_ops), np.int64, number_of_elem_ops)
+    timestamps = np.fromiter(map(_get_timestamp, elem_ops), np.float64, number_of_elem_ops)
+    authors = list(map(_get_author, elem_ops))
+    author_ids = {author: author_id for author_id, author in enumerate(dict.fromkeys(authors))}
+    authors = np.fromiter(map(author_ids.__getitem__, authors), np.int64, number_of_elem_ops)
+
+    # Only the elementary operations with new lines are split one at a time
+    with_new_lines = itertools.compress(range(number_of_elem_ops), map(str.__contains__, texts, itertools.repeat("\n")))
+    elem_ops_treated = []
+    # The parts of the elementary operations split and their index in elem_ops_treated
+    parts = []
+    part_indices = []
+    # The index of the new lines and of the text after the last new line in elem_ops_treated
+    alone_indices = []
+    restart_indices = []
+    # Number of parts of each elementary operation once split
+    number_of_parts = np.ones(number_of_elem_ops, np.int64)
+    previous = 0
+    for index in with_new_lines:
+        elem_ops_treated.extend(elem_ops[previous:index])
+        first_elem_op, middle_elem_ops, last_elem_op = split_elem_op_on_newlines(elem_ops[index])
+        split_elem_ops = ([first_elem_op] if first_elem_op is not None else []) + middle_elem_ops \
+            + ([last_elem_op] if last_elem_op is not None else [])
+        start = len(elem_ops_treated)
+        first_middle = start + (first_elem_op is not None)
+        alone_indices.extend(range(first_middle, first_middle + len(middle_elem_ops)))
+        if last_elem_op is not None:
+            restart_indices.append(start + len(split_elem_ops) - 1)
+        part_indices.extend(range(start, start + len(split_elem_ops)))
+        number_of_parts[index] = len(split_elem_ops)
+        parts.extend(split_elem_ops)
+        elem_ops_treated.extend(split_elem_ops)
+        previous = index + 1
+    elem_ops_treated.extend(elem_ops[previous:])
+
+    # Edit of each elementary operation (before the split) that moves the operations of the other authors after it,
+    # it comes after all its parts
+    events = (np.cumsum(number_of_parts) - 1, positions + deleted, added - deleted)
+    # The parts have the author and the timestamp of their elementary operation but their own position and length
+    lengths = np.repeat(added - deleted, number_of_parts)
+    positions = np.repeat(positions, number_of_parts)
+    timestamps = np.repeat(timestamps, number_of_parts)
+    authors = np.repeat(authors, number_of_parts)
+    lengths[part_indices] = [part.end - part.start for part in parts]
+    positions[part_indices] = [part.abs_position for part in parts]
+    number_of_elem_ops = len(elem_ops_treated)
+    kinds = np.full(number_of_elem_ops, _CONTINUABLE, np.int8)
+    kinds[alone_indices] = _ALONE
+    kinds[restart_indices] = _RESTART
+    operation_indices_per_maximum_time = dict()
+    operation_positions_per_maximum_time = dict()
+    order = np.argsort(authors, kind='stable')
+    for maximum_time, starts in zip(maximum_times, _find_operation_starts(timestamps, positions, lengths, authors,
+                                                                          kinds, events, maximum_times)):
+        # The operations are first numbered in the order of their first elementary operation
+        first_elem_ops = np.flatnonzero(starts)
+        operation_indices = np.empty(number_of_elem_ops, np.int64)
+        operation_indices[first_elem_ops] = np.arange(len(first_elem_ops))
+        # The other elementary operations belong to the last operation started by their author
+        last_start = np.maximum.accumulate(np.where(starts[order], np.arange(number_of_elem_ops), 0))
+        operation_indices[order] = operation_indices[order[last_start]]
+        operation_positions, push_order = _replay_operation_positions(positions, authors, kinds, events,
+                                                                      operation_indices, len(first_elem_ops))
+        # Then they are renumbered in the order they are pushed to the pad
+        push_rank = np.empty(len(first_elem_ops), np.int64)
+        push_rank[push_order] = np.arange(len(first_elem_ops))
+        operation_indices_per_maximum_time[maximum_time] = push_rank[operation_indices]
+        operation_positions_per_maximum_time[maximum_time] = operation_positions[:, push_order]
+    return elem_ops_treated, operation_indices_per_maximum_time, operation_positions_per_maximum_time
+
+
+def _find_operation_starts(timestamps, positions, lengths, authors, kinds, events, maximum_times):
+    """
+    Find the elementary operations that start an operation for each maximum time between the elementary operations of
+    an operation (see group_elem_ops_for_thresholds)
+
+    :param timestamps: timestamp of each elementary operation
+    :type timestamps: np.ndarray
+    :param positions: position of each elementary operation
+    :type positions: np.ndarray
+    :param lengths: number of characters added by each elementary operation (negative for deletions)
+    :type lengths: np.ndarray
+    :param authors: id of the author of each elementary operation
+    :type authors: np.ndarray
+    :param kinds: kind of each elementary operation (_CONTINUABLE, _ALONE or _RESTART)
+    :type kinds: np.ndarray
+    :param events: index of the last elementary operation of each edit, position before which the edit moves the
+        operations of the other authors and number of characters by which it moves them
+    :type events: (np.ndarray,np.ndarray,np.ndarray)
+    :param maximum_times: maximum times idle so that it's part of the same op
+    :type maximum_times: list[int]
+    :return: whether each elementary operation starts an operation, for each maximum time
+    :rtype: list[np.ndarray]
+    """
+    number_of_elem_ops = len(timestamps)
+    if number_of_elem_ops == 0:
+        return [np.zeros(0, bool) for _ in maximum_times]
+    # Work author by author: the elementary operations of an operation are contiguous in this order
+    order = np.argsort(authors, kind='stable')
+    author_sorted = authors[order]
+    kind_sorted = kinds[order]
+    # An elementary operation starts a group if it is the first one of its author, if the new lines force it or if it
+    # comes too long after the previous one of its author (that is the only test that depends on the maximum time)
+    forced_starts = np.ones(number_of_elem_ops, bool)
+    forced_starts[1:] = (author_sorted[1:] != author_sorted[:-1]) \
+        | (kind_sorted[1:] != _CONTINUABLE) | (kind_sorted[:-1] == _ALONE)
+    time_gaps = np.zeros(number_of_elem_ops)
+    time_gaps[1:] = np.diff(timestamps[order])
+    event_indices, event_limits, event_shifts = events
+    is_event = np.zeros(number_of_elem_ops, bool)
+    is_event[event_indices] = True
+    own_events_before = np.cumsum(is_event[order])
+
+    starts_per_maximum_time = []
+    for maximum_time in maximum_times:
+        group_starts = forced_starts | (time_gaps >= maximum_time)
+        group_ends = np.ones(number_of_elem_ops, bool)
+        group_ends[:-1] = group_starts[1:]
+
+        # A group must be followed one elementary operation at a time when an edit of an other author happens while
+        # the group is open, since it might move the operation
+        first_indices = order[group_starts]
+        last_indices = order[group_ends]
+        all_events = np.searchsorted(event_indices, last_indices) - np.searchsorted(event_indices, first_indices)
+        # The own edits of a group are between its first and its last elementary operations (excluded)
+        own_events = own_events_before[group_ends] - own_events_before[group_starts] - is_event[last_indices] \
+            + is_event[first_indices]
+        moved_groups = all_events > own_events
+        moved = np.repeat(moved_groups, np.diff(np.append(np.flatnonzero(group_starts), number_of_elem_ops)))
+
+        starts_sorted = group_starts.copy()
+        # The groups that are never moved are split on the position tests with arrays
+        still = np.flatnonzero(~moved)
+        remaining = _split_groups_on_positions(positions[order[still]], lengths[order[still]], starts_sorted, still)
+        starts = np.empty(number_of_elem_ops, bool)
+        starts[order] = starts_sorted
+        # Then the groups that are moved and the leftovers of the rounds of vectorized tests are followed one at a time
+        sequential = np.sort(np.concatenate((order[moved], order[remaining])))
+        if len(sequential) != 0:
+            ends = np.empty(number_of_elem_ops, bool)
+            ends[order] = group_ends
+            # Only the edits made while a moved group is open matter
+            covered = np.zeros(number_of_elem_ops + 1, np.int64)
+            np.add.at(covered, order[group_starts & moved], 1)
+            np.add.at(covered, order[group_ends & moved], -1)
+            selected_events = np.flatnonzero(np.cumsum(covered)[event_indices] > 0)
+            event_arrays = np.zeros((2, number_of_elem_ops), np.int64)
+            event_arrays[0, event_indices[selected_events]] = event_limits[selected_events]
+            event_arrays[1, event_indices[selected_events]] = event_shifts[selected_events]
+            _split_sequentially(sequential, event_indices[selected_events], starts, ends, positions, lengths, authors,
+                                event_arrays)
+        starts_per_maximum_time.append(starts)
+    return starts_per_maximum_time
+
+
+def _split_groups_on_positions(positions, lengths, starts_sorted, indices):
+    """
+    Split the groups of elementary operations that are not moved by other authors where the position test fails.
+    Within a group, the start of the operation is the minimum of the positions of its elementary operations and its
+    length is the sum of their lengths, so the tests are done with cumulative minimums and sums. Each round finds the
+    first split of each group, the next round only tests the rest of the groups that have been split.
+
+    :param positions: positions of the elementary operations, by author
+    :type positions: np.ndarray
+    :param lengths: lengths of the elementary operations, by author
+    :type lengths: np.ndarray
+    :param starts_sorted: whether each elementary operation starts an operation (by author), updated with the splits
+    :type starts_sorted: np.ndarray
+    :param indices: index of the elementary operations in starts_sorted
+    :type indices: np.ndarray
+    :return: indices (by author) of the elementary operations left to test after the last round
+    :rtype: np.ndarray
+    """
+    active = np.arange(len(indices))
+    for _ in range(_MAXIMUM_VECTORIZED_ROUNDS):
+        if len(active) == 0:
+            break
+        position = positions[active]
+        length = lengths[active]
+        is_start = starts_sorted[indices[active]]
+        group = np.cumsum(is_start) - 1
+        # Cumulative minimum restarted at each group: the positions are offset so that each group is below the previous
+        offset = group * (int(position.max()) - int(position.min()) + 1)
+        minimum = np.minimum.accumulate(position - offset) + offset
+        total = np.cumsum(length)
+        length_before = total - length - (total - length)[np.flatnonzero(is_start)][group]
+        start_before = np.empty_like(minimum)
+        start_before[1:] = minimum[:-1]
+        absolute_length = np.abs(length)
+        failed = ~is_start & ((position < start_before - absolute_length)
+                              | (position > start_before + np.abs(length_before)))
+        failed_indices = np.flatnonzero(failed)
+        if len(failed_indices) == 0:
+            active = active[:0]
+            break
+        # Only the first failure of each group is a split, the next tests depend on it
+        first_failures = failed_indices[np.append(True, group[failed_indices[1:]] != group[failed_indices[:-1]])]
+        starts_sorted[indices[active[first_failures]]] = True
+        first_failure_of_group = np.full(group[-1] + 1, len(active))
+        first_failure_of_group[group[first_failures]] = first_failures
+        active = active[np.arange(len(active)) >= first_failure_of_group[group]]
+    return indices[active]
+
+
+def _split_sequentially(sequence, event_indices, starts, ends, positions, lengths, authors, event_arrays):
+    """
+    Split the groups of elementary operations where the position test fails, one elementary operation at a time. The
+    start of the open operations is moved by the edits of the other authors (see Operation.update_indices).
 
+    :param sequence: indices of the elementary operations to test, sorted
+    :type sequence: np.ndarray
+    :param event_indices: indices of the edits that may move open operations
+    :type event_indices: np.ndarray
+    :param starts: whether each elementary operation starts an operation, updated with the splits
+    :type starts: np.ndarray
+    :param ends: whether each elementary operation ends its group
+    :type ends: np.ndarray
+    :param positions: position of each elementary operation
+    :type positions: np.ndarray
+    :param lengths: number of characters added by each elementary operation (negative for deletions)
+    :type lengths: np.ndarray
+    :param authors: id of the author of each elementary operation
+    :type authors: np.ndarray
+    :param event_arrays: position before which each edit moves the operations and number of characters it moves them
+    :type event_arrays: np.ndarray
+    """
+    # The edits come after the elementary operations with the same index
+    steps = np.sort(np.concatenate((sequence * 2, event_indices * 2 + 1))).tolist()
+    is_start = starts.tolist()
+    is_end = ends.tolist()
+    position = positions.tolist()
+    length = lengths.tolist()
+    author = authors.tolist()
+    event_limit, event_shift = event_arrays.tolist()
+    splits = []
+    # Start and length of the open operation of each author
+    open_operations = dict()
+    for step in steps:
+        index = step >> 1
+        if step & 1:
+            limit = event_limit[index]
+            event_author = author[index]
+            for operation_author, operation in open_operations.items():
+                if operation_author != event_author and limit < operation[0]:
+                    operation[0] += event_shift[index]
+            continue
+        new_position = position[index]
+        if is_start[index]:
+            open_operations[author[index]] = [new_position, length[index]]
+        else:
+            operation = open_operations[author[index]]
+            if operation[0] - abs(length[index]) <= new_position <= operation[0] + abs(operation[1]):
+                operation[1] += length[index]
+                if new_position < operation[0]:
+                    operation[0] = new_position
             else:
-                # If it shouldn't be added to the operation. We push the operation and create a new operation
-                pad.add_operation(current_op)
-                dic_author_current_operations[elem_op.author] = Operation(elem_op)
-                return dic_author_current_operations
+                splits.append(index)
+                open_operations[author[index]] = [new_position, length[index]]
+        if is_end[index]:
+            del open_operations[author[index]]
+    starts[splits] = True
+
+
+def _replay_operation_positions(positions, authors, kinds, events, operation_indices, number_of_operations):
+    """
+    Find the position_start_of_op and position_first_op of each operation of a grouping, and the order in which an
+    OperationBuilder pushes the operations to the pad. The last operation of each author is moved by the edits of the
+    other authors until the author starts a new one, even once it can't be continued anymore, and it is pushed when it
+    is replaced (see OperationBuilder.last_operations), so the elementary operations and the edits are replayed in
+    order with plain ints.
+
+    :param positions: position of each elementary operation
+    :type positions: np.ndarray
+    :param authors: id of the author of each elementary operation
+    :type authors: np.ndarray
+    :param kinds: kind of each elementary operation (_CONTINUABLE, _ALONE or _RESTART)
+    :type kinds: np.ndarray
+    :param events: index of the last elementary operation of each edit, position before which the edit moves the
+        operations of the other authors and number of characters by which it moves them
+    :type events: (np.ndarray,np.ndarray,np.ndarray)
+    :param operation_indices: the index of the operation of each elementary operation
+    :type operation_indices: np.ndarray
+    :param number_of_operations: number of operations
+    :type number_of_operations: int
+    :return: position_start_of_op and position_first_op of each operation, and the indices of the operations in the
+        order they are pushed
+    :rtype: (np.ndarray,np.ndarray)
+    """
+    operation_positions = np.empty((2, number_of_operations), np.int64)
+    push_order = []
+    event_indices, event_limits, event_shifts = events
+    # The edits come after the elementary operations with the same index, those that don't move anything are skipped
+    event_arrays = np.zeros((2, len(positions)), np.int64)
+    event_arrays[0, event_indices] = event_limits
+    event_arrays[1, event_indices] = event_shifts
+    # Index, start and first position of the last operation of each author
+    last_operations = dict()
+    for new_position, author, alone, operation_index, limit, shift in zip(
+            positions.tolist(), authors.tolist(), (kinds == _ALONE).tolist(), operation_indices.tolist(),
+            *event_arrays.tolist()):
+        last_operation = last_operations.get(author)
+        if last_operation is not None and last_operation[0] == operation_index:
+            if new_position < last_operation[1]:
+                last_operation[1] = new_position
         else:
-            # If it shouldn't be added to the operation. We push the operation and create a new operation
-            pad.add_operation(current_op)
-            dic_author_current_operations[elem_op.author] = Operation(elem_op)
-            return dic_author_current_operations
-    else:
-        # New OP for this author
-        dic_author_current_operations[elem_op.author] = Operation(elem_op)
-        return dic_author_current_operations
+            if last_operation is not None:
+                operation_positions[:, last_operation[0]] = last_operation[1:]
+                push_order.append(last_operation[0])
+            if alone:
+                # A new line closes the last operation of its author and is an operation on its own
+                last_operations.pop(author, None)
+                operation_positions[:, operation_index] = new_position
+                push_order.append(operation_index)
+            else:
+                last_operations[author] = [operation_index, new_position, new_position]
+        if shift != 0:
+            for operation_author, last_operation in last_operations.items():
+                if operation_author != author and limit < last_operation[1]:
+                    last_operation[1] += shift
+                    last_operation[2] += shift
+    # The operations left are pushed at the end, in the order of their authors (see OperationBuilder.push_operations)
+    for last_operation in last_operations.values():
+        operation_positions[:, last_operation[0]] = last_operation[1:]
+        push_order.append(last_operation[0])
+    return operation_positions, np.array(push_order, np.int64)
+
+
+def create_operations(elem_ops, operation_indices, operation_positions):
+    """
+    Create the operations of a grouping of elementary operations (see group_elem_ops)
+
+    :param elem_ops: the elementary operations (once split)
+    :type elem_ops: list[ElementaryOperation]
+    :param operation_indices: the index of the operation of each elementary operation
+    :type operation_indices: np.ndarray
+    :param operation_positions: position_start_of_op and position_first_op of each operation
+    :type operation_positions: np.ndarray
+    :return: the operations, in the order of their index (the order they are pushed to the pad)
+    :rtype: list[Operation]
+    """
+    # The elementary operations of each operation, in the order of the operations
+    order = np.argsort(operation_indices, kind='stable')
+    elem_ops_sorted = [elem_ops[index] for index in order.tolist()]
+    bounds = np.flatnonzero(np.diff(operation_indices[order])) + 1
+    operations = []
+    start = 0
+    for end in bounds.tolist() + [len(order)] if len(order) != 0 else []:
+        operation = Operation(elem_ops_sorted[start])
+        if end - start > 1:
+            operation.add_elem_ops(elem_ops_sorted[start + 1:end])
+        operations.append(operation)
+        start = end
+    for operation, position_start_of_op, position_first_op in zip(operations, *operation_positions.tolist()):
+        operation.position_start_of_op = position_start_of_op
+        operation.position_first_op = position_first_op
+    return operations
+
+
+def build_operations_from_elem_ops_batch(list_of_elem_ops_per_pad, maximum_time_between_elem_ops):
+    """
+    Create a object Pad for each pad and create its operations with group_elem_ops. The operations are the same as
+    with build_operations_from_elem_ops but, since all the elementary operations are known, they are grouped with
+    arrays. For offline runs.
+
+    :param list_of_elem_ops_per_pad: dictionary of elementary operation per pad, sorted by timestamp
+    :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
+    :param maximum_time_between_elem_ops: maximum type idle so that it's part of the same op
+    :type maximum_time_between_elem_ops: int
+    :return: a dictionary of pads and the list of elem_ops (they might have changed if there were some new lines.
+    :rtype: (dict[str,Pad],dict[str,list[ElementaryOperation]])
+    """
+    pads = dict()
+    """:type: dict[str,Pad]"""
+    elem_ops_treated = dict()
+    """:type: dict[str,list[ElementaryOperation]]"""
+    for pad_name, elem_ops in list_of_elem_ops_per_pad.items():
+        pad = pads[pad_name] = Pad(pad_name)
+        elem_ops_treated[pad_name], operation_indices, operation_positions = group_elem_ops(
+            elem_ops, maximum_time_between_elem_ops)
+        pad.add_operations(create_operations(elem_ops_treated[pad_name], operation_indices, operation_positions))
+        pad.apply_elem_ops(elem_ops_treated[pad_name])
+    return pads, elem_ops_treated
 
 
 def sort_elem_ops_per_pad(list_of_elem_ops_per_pad):
     """
-    sort a list of ElementaryOperation based on the timestamp
+    sort a list of ElementaryOperation based on the timestamp. Each pad is sorted on its own (see
+    ElementaryOperation.sort_elem_ops, the lists that are already sorted are only checked). The pads are ordered by the
+    timestamp of their first ElementaryOperation and the pads without ElementaryOperation are dropped.
     
     :param list_of_elem_ops_per_pad: list of ElementaryOperation to sort
     :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
     :return: sorted list of ElementaryOperation by their timestamp
     :rtype: dict[str,list[ElementaryOperation]]
     """
-    list_of_elem_ops_sorted = Operations.ElementaryOperation.sort_elem_ops(
-        [item for sublist in list_of_elem_ops_per_pad.values() for item in sublist])
-    list_of_elem_ops_per_pad_sorted = dict()
+    sorted_per_pad = [(pad_name, Operations.ElementaryOperation.sort_elem_ops(elem_ops))
+                      for pad_name, elem_ops in list_of_elem_ops_per_pad.items() if len(elem_ops) != 0]
+    sorted_per_pad.sort(key=lambda pad_name_and_elem_ops: pad_name_and_elem_ops[1][0].timestamp)
+    list_of_elem_ops_per_pad_sorted = dict(sorted_per_pad)
     """:type: dict[str,list]"""
-    for elem_op in list_of_elem_ops_sorted:
-        if elem_op.pad_name in list_of_elem_ops_per_pad_sorted.keys():
-            list_of_elem_ops_per_pad_sorted[elem_op.pad_name].append(elem_op)
-        else:
-            list_of_elem_ops_per_pad_sorted[elem_op.pad_name] = [elem_op]
     return list_of_elem_ops_per_pad_sorted
@@ -1,145 +1,162 @@
+import array
+import collections
+import functools
+import glob
+import hashlib
+import heapq
+import itertools
+import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import re
 import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
 import config
 from analytics.Operations import ElementaryOperation
+from analytics.ElemOpStore import ElemOpStore
 import csv
-import ast
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# Decode the records with the fastest JSON decoder available
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
 
 MONGODB_PORT = None
 
+# Version of the parsing. It must be incremented when the ElementaryOperation produced from the logs change, so that
+# the elementary operations parsed by a previous version and saved in the cache are parsed again.
+PARSER_VERSION = 4
 
-def parse_changeset_etherpad(changeset):
+logger = logging.getLogger(__name__)
+
+
+# One token of the operation section of an etherpad changeset: either an attribute ('*N', ignored) or an
+# operation '|L=N', '|L+N', '|L-N', '=N', '+N', '-N'. The groups are (L, symbol, N) and are empty for attributes.
+CHANGESET_OP_REGEX = re.compile(r'\*[0-9a-zA-Z]+|(?:\|([0-9a-zA-Z]+))?([=+\-])([0-9a-zA-Z]+)')
+
+
+def tokenize_changeset_etherpad(changeset):
     """
-    Parse a changeset of type etherpad into a list of elementary operations. There will be missing the author,
-    timestamp... http://policypad.readthedocs.io/en/latest/changesets.html
+    Split an etherpad changeset into its operations and its char bank in a single forward pass. The header (Z:...)
+    and the attributes (*N) are skipped. http://policypad.readthedocs.io/en/latest/changesets.html
 
-    :param changeset: string to parse
+    :param changeset: string to tokenize
     :type changeset: str
+    :return: the list of operations as (number of lines, symbol, number of chars) with the numbers decoded from base
+        36 (number of lines is None if the operation has no '|L' prefix), and the char bank
+    :rtype: (list[(int,str,int)], str)
+    """
+    bank_idx = changeset.find('$')
+    if bank_idx == -1:
+        bank_idx = len(changeset)
+    ops = [(int(lines, 36) if lines else None, symbol, int(chars, 36))
+           for lines, symbol, chars in CHANGESET_OP_REGEX.findall(changeset, 0, bank_idx)
+           if symbol]
+    return ops, changeset[bank_idx + 1:]
 
-    :return : List of elem_ops contained in the changeset
-    :rtype: list[ElementaryOperation]
 
+def count_elem_ops_etherpad(changeset):
     """
+    Count the elementary operations of an etherpad changeset (its insertions and deletions) without parsing it. The
+    header only contains '>' or '<' and the attributes only digits and letters, so each '+' or '-' before the char bank
+    is an operation.
+
+    :param changeset: the changeset
+    :type changeset: str
+    :return: the number of elementary operations parse_changeset_etherpad creates from the changeset
+    :rtype: int
+    """
+    bank_idx = changeset.find('$')
+    if bank_idx == -1:
+        bank_idx = len(changeset)
+    return changeset.count('+', 0, bank_idx) + changeset.count('-', 0, bank_idx)
 
-    def find_next_symbol_idx(string, start):
-        """
-        Find the next symbol from start
-        """
-        symbols = ['|', '$', '+', '-', '=', '*']
-        for i in range(start, len(string)):
-            if string[i] in symbols:
-                return i
-        # We reached the end of the text
-        return len(string)
 
+def walk_changeset_etherpad(changeset):
+    """
+    Walk through a changeset of type etherpad and yield its insertions and deletions with their position.
+    http://policypad.readthedocs.io/en/latest/changesets.html
+
+    :param changeset: string to parse
+    :type changeset: str
+    :return: generator of (operation type, position, text to add or length to delete, line number, position inline)
+    :rtype: collections.Iterable[(str,int,str|int,int,int)]
+    """
     line_number = 0
-    line_abs_position = 0
     position = 0
     position_inline = 0
-    elementary_operations = []
+    # Offset of the first char of the char bank that has not been added yet
     used_databank = 0
-    # Finding the first operations. It's always a |
-    idx = find_next_symbol_idx(changeset, 0)
-    while idx < len(changeset):
-        if changeset[idx] == '|':
-            # It's going to be taken care of by elif changeset[idx].isalnum()
-            idx += 1
-        elif changeset[idx] == '$':
-            # Should have already been added with the '+'
-            return elementary_operations
-        elif changeset[idx].isalnum():
-            # Format is |L+N,|L-N or |L=N
-            symbol_idx = find_next_symbol_idx(changeset, idx)
-            if changeset[symbol_idx] == '=':
+    ops, data_bank = tokenize_changeset_etherpad(changeset)
+    for lines, symbol, chars in ops:
+        if symbol == '=':
+            if lines is not None:
                 # |L=N
                 # Keep N characters from the source text, containing L newlines.
                 # The last character kept MUST be a newline, and the final newline
                 # of the document is allowed.
-                # L
-                line_number += int(changeset[idx:symbol_idx], 36)
-                next_symbol_position = find_next_symbol_idx(changeset, symbol_idx + 1)
-                # N
-                line_abs_position += int(changeset[symbol_idx + 1:next_symbol_position], 36)
-                position += int(changeset[symbol_idx + 1:next_symbol_position], 36)
-                idx = next_symbol_position
-            elif changeset[symbol_idx] == '+':
-                # |L+N
-                # Insert N characters from the source text, containing L newlines.
-                # The last character inserted MUST be a newline, but not the (new)
-                # document's final newline.
-
-                next_symbol_position = find_next_symbol_idx(changeset, symbol_idx + 1)
-                # We care about  N (size of the addition) since we will date N chars from the databank.
-                # noinspection PyPep8Naming
-                N = int(changeset[symbol_idx + 1:next_symbol_position], 36)
-                data_bank = changeset[changeset.find('$') + 1:]
-                text_to_add = data_bank[used_databank:used_databank + N]
-                elementary_operations.append(ElementaryOperation("add",
-                                                                 position,
-                                                                 text_to_add=text_to_add,
-                                                                 line_number=line_number,
-                                                                 position_inline=position_inline,
-                                                                 changeset=changeset))
-                used_databank += N
-                position += N
-                idx = next_symbol_position
+                line_number += lines
             else:
-                assert (changeset[symbol_idx] == '-')
-
-                # |L-N
-                # Delete N characters from the source text, containing L newlines.
-                # The last character inserted MUST be a newline, but not the (old)
-                # document's final newline.
-                next_symbol_position = find_next_symbol_idx(changeset, symbol_idx + 1)
-                # N
-                chars_to_delete = int(changeset[symbol_idx + 1:next_symbol_position], 36)
-                idx = next_symbol_position
-                elementary_operations.append(ElementaryOperation("del",
-                                                                 position,
-                                                                 length_to_delete=chars_to_delete,
-                                                                 line_number=line_number,
-                                                                 position_inline=position_inline,
-                                                                 changeset=changeset))
-        elif changeset[idx] == '=':
-            # Keep N characters from the source text, none of them newlines
-            # (position inline)
-            next_symbol_position = find_next_symbol_idx(changeset, idx + 1)
-            # We add the inline offset
-            position += int(changeset[idx + 1:next_symbol_position], 36)
-            position_inline += int(changeset[idx + 1:next_symbol_position], 36)
-            idx = next_symbol_position
-        elif changeset[idx] == '+':
-            next_symbol_position = find_next_symbol_idx(changeset, idx + 1)
-            # We care about N (size of the addition). We only take N chars from the databank (not counting the
+                # =N
+                # Keep N characters from the source text, none of them newlines
+                # (position inline)
+                position_inline += chars
+            position += chars
+        elif symbol == '+':
+            # |L+N or +N
+            # Insert N characters from the char bank. We only take N chars from the databank (not counting the
             # already used ones)
-            N = int(changeset[idx + 1:next_symbol_position], 36)
-            data_bank = changeset[changeset.find('$') + 1:]
-            text_to_add = data_bank[used_databank:used_databank + N]
+            yield "add", position, data_bank[used_databank:used_databank + chars], line_number, position_inline
+            used_databank += chars
+            position += chars
+        else:
+            # |L-N or -N
+            # Delete N characters from the source text
+            yield "del", position, chars, line_number, position_inline
+
+
+def parse_changeset_etherpad(changeset):
+    """
+    Parse a changeset of type etherpad into a list of elementary operations. There will be missing the author,
+    timestamp... http://policypad.readthedocs.io/en/latest/changesets.html
+
+    :param changeset: string to parse
+    :type changeset: str
+
+    :return : List of elem_ops contained in the changeset
+    :rtype: list[ElementaryOperation]
+
+    """
+    elementary_operations = []
+    # The changeset is shared by all the elem_ops of the revision, and only kept for debugging
+    kept_changeset = changeset if config.keep_changesets else None
+    for operation_type, position, text_or_length, line_number, position_inline in walk_changeset_etherpad(changeset):
+        if operation_type == "add":
             elementary_operations.append(ElementaryOperation("add",
                                                              position,
-                                                             text_to_add=text_to_add,
+                                                             text_to_add=text_or_length,
                                                              line_number=line_number,
                                                              position_inline=position_inline,
-                                                             changeset=changeset))
-            used_databank += N
-            position += N
-            idx = next_symbol_position
-
-        elif changeset[idx] == '-':
-            # Remove the next n symbols
-            next_symbol_position = find_next_symbol_idx(changeset, idx + 1)
-            chars_to_delete = int(changeset[idx + 1:next_symbol_position], 36)
-            idx = next_symbol_position
+                                                             changeset=kept_changeset))
+        else:
             elementary_operations.append(ElementaryOperation("del",
                                                              position,
-                                                             length_to_delete=chars_to_delete,
+                                                             length_to_delete=text_or_length,
                                                              line_number=line_number,
                                                              position_inline=position_inline,
-                                                             changeset=changeset))
-        else:
-            # TODO: Format with '*'
-            assert changeset[idx] == '*'
-            idx = find_next_symbol_idx(changeset, idx + 1)
+                                                             changeset=kept_changeset))
+    return elementary_operations
 
 
 def parse_op_collab_react(op_array, editor):
@@ -174,44 +191,224 @@ def parse_op_collab_react(op_array, editor):
             elem_ops.append(ElementaryOperation(operation_type="del",
                                                 abs_position=position,
                                                 length_to_delete=length_to_delete,
-                                                changeset=op))
+                                                changeset=op if config.keep_changesets else None))
         if 'si' in op.keys():
             # Inserting some letters
             text_to_add = op['si']
             elem_ops.append(ElementaryOperation(operation_type="add",
                                                 abs_position=position,
                                                 text_to_add=text_to_add,
-                                                changeset=op))
+                                                changeset=op if config.keep_changesets else None))
 
     return elem_ops
 
 
-def extract_elem_ops_etherpad(line_dict, timestamp_offset, editor):
+def parse_revs_key(key):
+    """
+    Parse a key of an etherpad record. Only the revisions of a pad (keys pad:<pad name>:revs:<revision>) are
+    interesting to us.
+
+    :param key: key of the record
+    :type key: str
+    :return: the pad name and the revision number, or None if it is not the key of a revision
+    :rtype: (str, int)
+    """
+    if not key.startswith('pad:'):
+        return None
+    pad_name_end_idx = key.rfind(':revs:')
+    if pad_name_end_idx == -1:
+        return None
+    revs = key[pad_name_end_idx + len(':revs:'):]
+    if not revs.isdigit():
+        return None
+    return key[len('pad:'):pad_name_end_idx], int(revs)
+
+
+# Timestamp of the meta of an etherpad revision, found without decoding the record. Quotes inside the JSON strings are
+# escaped, so the pattern can only match the "timestamp" key itself.
+TIMESTAMP_REGEX = re.compile(r'"timestamp":(-?[0-9]+)[,}]')
+
+
+def normalize_pad_filter(pad_filter):
+    """
+    Put a pad filter in the form expected by match_pad_filter
+
+    :param pad_filter: name of a pad, collection of pad names, regular expression (compiled or not, searched in the pad
+        name) or None to keep all the pads
+    :type pad_filter: str|collections.Iterable[str]|typing.Pattern|None
+    :return: the pad name, the frozenset of pad names, the compiled regular expression or None
+    :rtype: str|frozenset[str]|typing.Pattern|None
+    """
+    if pad_filter is None or isinstance(pad_filter, (str, frozenset)) or hasattr(pad_filter, 'search'):
+        return pad_filter
+    return frozenset(pad_filter)
+
+
+def match_pad_filter(pad_name, pad_filter):
+    """
+    Check whether a pad is kept by a pad filter
+
+    :param pad_name: name of the pad
+    :type pad_name: str
+    :param pad_filter: pad filter as returned by normalize_pad_filter
+    :type pad_filter: str|frozenset[str]|typing.Pattern|None
+    :rtype: bool
+    """
+    if pad_filter is None:
+        return True
+    if isinstance(pad_filter, str):
+        return pad_name == pad_filter
+    if isinstance(pad_filter, frozenset):
+        return pad_name in pad_filter
+    return pad_filter.search(pad_name) is not None
+
+
+def in_timestamp_range(timestamp, timestamp_range):
+    """
+    Check whether a timestamp is in a time window
+
+    :param timestamp: the timestamp
+    :type timestamp: int
+    :param timestamp_range: (start, end) of the window. The start is included and the end excluded, either of them can
+        be None for no bound. None keeps all the timestamps.
+    :type timestamp_range: (int,int)|None
+    :rtype: bool
+    """
+    if timestamp_range is None:
+        return True
+    start, end = timestamp_range
+    return (start is None or start <= timestamp) and (end is None or timestamp < end)
+
+
+def decode_revision_record(key, value, pad_filter=None, timestamp_range=None):
+    """
+    Decode a record of an etherpad database (dirty.db line, SQLite entry or CSV line). The key is checked before
+    decoding the value so that we only decode the revisions of the pads. The value is decoded as JSON and we only keep
+    the changeset, the author and the timestamp of the revision.
+
+    :param key: key of the record
+    :type key: str
+    :param value: value of the record in JSON
+    :type value: str|bytes
+    :param pad_filter: only decode the revisions of the pads kept by this filter (see normalize_pad_filter)
+    :type pad_filter: str|frozenset[str]|typing.Pattern|None
+    :param timestamp_range: only decode the revisions in this time window (see in_timestamp_range)
+    :type timestamp_range: (int,int)|None
+    :return: the pad name, the revision number, the changeset, the author and the timestamp of the revision or None if
+        the record is not a revision or is filtered out
+    :rtype: (str, int, str, str, int)
+    """
+    pad_name_and_revs = parse_revs_key(key)
+    if pad_name_and_revs is None or not match_pad_filter(pad_name_and_revs[0], pad_filter):
+        return None
+    if timestamp_range is not None and isinstance(value, str):
+        # Skip the revisions out of the time window without decoding them
+        match = TIMESTAMP_REGEX.search(value)
+        if match is not None and value.find('"timestamp":', match.end()) == -1 \
+                and not in_timestamp_range(int(match.group(1)), timestamp_range):
+            return None
+    val = json_loads(value)
+    if val is None:
+        # The record has been deleted
+        return None
+    meta = val['meta']
+    if not in_timestamp_range(meta['timestamp'], timestamp_range):
+        return None
+    return pad_name_and_revs[0], pad_name_and_revs[1], val['changeset'], meta['author'], meta['timestamp']
+
+
+def split_dirty_db_line(line):
     """
-	extract the ElementaryOperation from a line in etherpad format
+    Split a line of the dirty.db file of etherpad in its key and its value without decoding the value. The lines are
+    of the form {"key":<key>,"val":<value>}. Only the lines of the pads are split.
 
-	:param line_dict: line we want to extrat the ElementaryOperation from
+    :param line: line of dirty.db
+    :type line: str
+    :return: the key and the value in JSON, or None if it is not the line of a pad or the record has been deleted
+    :rtype: (str,str)
+    """
+    if not line.startswith('{"key":"pad:'):
+        return None
+    key_end_idx = line.find('","val":')
+    if key_end_idx == -1:
+        # No value, the record has been deleted
+        return None
+    key = line[len('{"key":"'):key_end_idx]
+    if '\\' in key:
+        # The key has escaped characters
+        key = json_loads('"' + key + '"')
+    return key, line[key_end_idx + len('","val":'):line.rfind('}')]
+
+
+def parse_dirty_db_revision_write(line):
+    """
+    Get the pad name and the revision number of a line of the dirty.db file of etherpad writing or deleting a revision,
+    without decoding its value. A deleted record has no value ({"key":<key>}) or a null one.
+
+    :param line: line of dirty.db
+    :type line: bytes
+    :return: the pad name, the revision number and whether the revision is deleted, or None if it is not the line of a
+        revision
+    :rtype: (str, int, bool)
+    """
+    if not line.startswith(b'{"key":"pad:'):
+        return None
+    key_end_idx = line.find(b'","val":')
+    if key_end_idx == -1:
+        key_end_idx = line.rfind(b'"}')
+        if key_end_idx == -1:
+            return None
+        deleted = True
+    else:
+        deleted = line.endswith(b'","val":null}')
+    key = line[len(b'{"key":"'):key_end_idx].decode('utf-8')
+    if '\\' in key:
+        # The key has escaped characters
+        key = json_loads('"' + key + '"')
+    pad_name_and_revs = parse_revs_key(key)
+    if pad_name_and_revs is None:
+        return None
+    return pad_name_and_revs[0], pad_name_and_revs[1], deleted
+
+
+def decode_dirty_db_line(line, pad_filter=None, timestamp_range=None):
+    """
+    Decode a line of the dirty.db file of etherpad. We only decode the value if the key is the key of a revision.
+
+    :param line: line of dirty.db
+    :type line: str
+    :param pad_filter: see decode_revision_record
+    :param timestamp_range: see decode_revision_record
+    :return: see decode_revision_record
+    :rtype: (str, int, str, str, int)
+    """
+    key_and_value = split_dirty_db_line(line)
+    if key_and_value is None:
+        return None
+    return decode_revision_record(key_and_value[0], key_and_value[1], pad_filter, timestamp_range)
+
+
+def extract_elem_ops_etherpad(revision, timestamp_offset, editor):
+    """
+	extract the ElementaryOperation from a revision in etherpad format
+
+	:param revision: revision we want to extract the ElementaryOperation from, as returned by decode_revision_record
+	:type revision: (str, int, str, str, int)
 	:param timestamp_offset: offset we want to add to the timestamps. This is because sometimes we generate multiple elementary operations from a single line and we want to keep their order by changing a little bit the timestamp of the elem_op. This change is repercuted on all the following ElementaryOperation.
 	:param editor: name of editor
 	:return: the list of ElementaryOperation
 	"""
-    # Parsing
-    pad_name_idx = line_dict['key'].find("pad:") + len("pad:")
-    pad_name_end_idx = line_dict['key'].find(':revs:', pad_name_idx)
-    pad_name = line_dict['key'][pad_name_idx:pad_name_end_idx]
-    revs = int(line_dict['key'][pad_name_end_idx + len('revs:') + 1:])
-    changeset = line_dict['val']['changeset']
-    author_name = line_dict['val']['meta']['author']
-    timestamp = line_dict['val']['meta']['timestamp']
+    pad_name, revs, changeset, author_name, timestamp = revision
+
+    # Share the strings between all the elem_ops of the pad and of the author
+    pad_name = sys.intern(pad_name)
+    # if it's the line generated automatically by etherpad, the author is empty
+    author_name = sys.intern(author_name) if author_name != '' else 'Etherpad_admin'
 
     elem_ops = parse_changeset_etherpad(changeset)
     elem_ops_result = []
     for i, elem_op in enumerate(elem_ops):
-        if author_name == '':
-            # if it's the line generated automatically by etherpad
-            elem_op.author = 'Etherpad_admin'
-        else:
-            elem_op.author = author_name
+        elem_op.author = author_name
         elem_op.timestamp = timestamp + timestamp_offset
         timestamp_offset += 1
         elem_op.revs = revs
@@ -222,103 +419,1281 @@ def extract_elem_ops_etherpad(line_dict, timestamp_offset, editor):
     return pad_name, elem_ops_result, timestamp_offset
 
 
-def get_elem_ops_per_pad_from_db(path_to_db=None, editor=None, index_from_lines=0, revs_mongo=None, regex=None):
+def store_revision_etherpad(store, revision, timestamp_offset):
+    """
+    Same as extract_elem_ops_etherpad, but the elementary operations of the revision are appended to a columnar store
+    instead of being created as ElementaryOperation.
+
+    :param store: store to which we append the elementary operations
+    :type store: ElemOpStore
+    :param revision: revision as returned by decode_revision_record
+    :type revision: (str, int, str, str, int)
+    :param timestamp_offset: offset we want to add to the timestamps (see extract_elem_ops_etherpad)
+    :type timestamp_offset: int
+    :return: the new timestamp offset
+    :rtype: int
+    """
+    pad_name, revs, changeset, author_name, timestamp = revision
+    pad_id = store.get_pad_id(pad_name)
+    # if it's the line generated automatically by etherpad, the author is empty
+    author_id = store.get_author_id(author_name if author_name != '' else 'Etherpad_admin')
+    for operation_type, position, text_or_length, line_number, position_inline in walk_changeset_etherpad(changeset):
+        store.append(operation_type, position, text_or_length, timestamp + timestamp_offset, author_id, pad_id, revs,
+                     line_number, position_inline)
+        timestamp_offset += 1
+    return timestamp_offset
+
+
+class DirtyDbReader:
+    """
+    Tail reader of an Etherpad dirty.db file. dirty.db only grows by appending lines, so the reader remembers the byte
+    offset up to which the file has been read and each call only reads the complete lines appended since then. A
+    partial last line (still being written by Etherpad) is left for the next call. If the file has been truncated or
+    replaced (rotation), the reader starts again from the beginning of the file and sets rewound to True.
+
+    A key can be written several times in dirty.db, the last write wins. The reader keeps the byte offset of the last
+    write of each revision of each pad (revision_offsets), so the revisions of a pad can be read back directly from
+    their offsets (see iter_pad_revisions). A revision written again with the same value (e.g. when the database is
+    compacted) is not parsed again. If a revision already read is written again with another value or deleted (e.g.
+    the pad has been deleted and created again under the same name), its pad is added to changed_pads: the revisions
+    of the pad read so far are not valid anymore and all of its current revisions must be read again.
+    """
+
+    # Number of bytes read at once from the file
+    block_size = 1 << 20
+    # Number of bytes before the offset we remember to detect that the file has been rewritten
+    fingerprint_size = 64
+
+    def __init__(self, path_to_db, offset=0, missing_ok=False):
+        """
+        Create a reader of a dirty.db file
+
+        :param path_to_db: path to the dirty.db file
+        :type path_to_db: str
+        :param offset: byte offset from which we start reading (must be the start of a line)
+        :type offset: int
+        :param missing_ok: whether a missing file is read as an empty one (e.g. when polling a file that Etherpad has
+            not created yet) instead of raising FileNotFoundError
+        :type missing_ok: bool
+        """
+        self.path_to_db = path_to_db
+        self.missing_ok = missing_ok
+        """Whether a missing file is read as an empty one"""
+        self.offset = offset
+        """Byte offset of the first line that has not been read yet"""
+        self.lines_read = 0
+        """Number of complete lines read so far"""
+        self.timestamp_offset = 0
+        """Timestamp offset reached by the elementary operations parsed so far (see extract_elem_ops_etherpad)"""
+        self.rewound = False
+        """Whether the last read started again from the beginning of the file because it was truncated or replaced"""
+        self.revision_offsets = dict()
+        """Byte offset of the last write of each revision of each pad (-1 for the revisions not seen yet or deleted)
+
+        :type: dict[str,array.array]"""
+        self.changed_pads = set()
+        """Pads whose revisions already read have been written again with another value or deleted during the last
+        read
+
+        :type: set[str]"""
+        self.file_id = None
+        self.fingerprint = None
+
+    def reset(self):
+        """
+        Forget everything that has been read and start again from the beginning of the file
+        """
+        self.offset = 0
+        self.lines_read = 0
+        self.timestamp_offset = 0
+        self.revision_offsets = dict()
+        self.changed_pads = set()
+        self.file_id = None
+        self.fingerprint = None
+        self.rewound = True
+
+    def get_state(self):
+        """
+        Get what the reader needs to resume reading later on, in a form that can be serialized in JSON
+
+        :rtype: dict
+        """
+        return {'offset': self.offset,
+                'lines_read': self.lines_read,
+                'timestamp_offset': self.timestamp_offset,
+                'revision_offsets': {pad_name: offsets.tolist() for pad_name, offsets in self.revision_offsets.items()},
+                'fingerprint': self.fingerprint.decode('latin-1') if self.fingerprint is not None else None}
+
+    @classmethod
+    def from_state(cls, path_to_db, state, missing_ok=False):
+        """
+        Create a reader resuming from the state of a previous reader
+
+        :param path_to_db: path to the dirty.db file
+        :type path_to_db: str
+        :param state: state returned by get_state
+        :type state: dict
+        :param missing_ok: see __init__
+        :type missing_ok: bool
+        :rtype: DirtyDbReader
+        """
+        reader = cls(path_to_db, state['offset'], missing_ok)
+        reader.lines_read = state['lines_read']
+        reader.timestamp_offset = state['timestamp_offset']
+        reader.revision_offsets = {pad_name: array.array('q', offsets)
+                                   for pad_name, offsets in state['revision_offsets'].items()}
+        if state['fingerprint'] is not None:
+            reader.fingerprint = state['fingerprint'].encode('latin-1')
+        return reader
+
+    def has_changed(self):
+        """
+        Check, without reading anything, whether the file is not the one we have been reading anymore (the next read
+        would start again from the beginning of the file).
+
+        :rtype: bool
+        """
+        try:
+            f = open(self.path_to_db, 'rb')
+        except FileNotFoundError:
+            return True
+        with f:
+            return self._file_changed(f, os.fstat(f.fileno()))
+
+    def _file_changed(self, f, stat):
+        """
+        Check whether the file is not the one we have been reading (rotation) or if it has been truncated/rewritten.
+        """
+        if self.file_id is not None and self.file_id != (stat.st_dev, stat.st_ino):
+            return True
+        if stat.st_size < self.offset:
+            return True
+        if self.fingerprint is not None:
+            f.seek(self.offset - len(self.fingerprint))
+            return f.read(len(self.fingerprint)) != self.fingerprint
+        return False
+
+    def iter_new_lines(self):
+        """
+        Iterate over the complete lines appended to the file since the last call. The offset is updated as the lines
+        are consumed.
+
+        :return: generator of the new lines (without the trailing newline)
+        :rtype: collections.Iterable[str]
+        """
+        lines = self._iter_new_raw_lines()
+        try:
+            for _, line in lines:
+                yield line.decode('utf-8')
+        finally:
+            lines.close()
+
+    def iter_new_revisions(self, pad_filter=None, timestamp_range=None, skip_lines=0):
+        """
+        Iterate over the revisions appended to the file since the last call, decoded with decode_revision_record. The
+        revisions already seen are skipped, the pads whose revisions have changed are added to changed_pads (see
+        revision_offsets).
+
+        :param pad_filter: see decode_revision_record
+        :param timestamp_range: see decode_revision_record
+        :param skip_lines: number of new lines whose revisions are not decoded (they are still indexed)
+        :type skip_lines: int
+        :return: generator of the new revisions
+        :rtype: collections.Iterable[(str, int, str, str, int)]
+        """
+        lines = self._iter_new_raw_lines()
+        try:
+            for i, (offset, line) in enumerate(lines):
+                write = parse_dirty_db_revision_write(line)
+                if write is None:
+                    continue
+                pad_name, revs, deleted = write
+                if not self.index_revision(pad_name, revs, offset if not deleted else None, line):
+                    continue
+                if i < skip_lines:
+                    continue
+                revision = decode_dirty_db_line(line.decode('utf-8'), pad_filter, timestamp_range)
+                if revision is not None:
+                    yield revision
+        finally:
+            lines.close()
+
+    def index_revision(self, pad_name, revs, offset, line=None):
+        """
+        Remember the offset of the last write of a revision of a pad. If the revision had already been read and is
+        deleted or written with another value, the pad is added to changed_pads.
+
+        :param pad_name: name of the pad
+        :type pad_name: str
+        :param revs: revision number
+        :type revs: int
+        :param offset: byte offset of the line of the revision, None if the revision is deleted
+        :type offset: int
+        :param line: the line of the revision (read from the file if None)
+        :type line: bytes
+        :return: whether the revision has to be parsed: it has not been read yet (or it has been deleted since)
+        :rtype: bool
+        """
+        offsets = self.revision_offsets.get(pad_name)
+        if offsets is None:
+            offsets = self.revision_offsets[pad_name] = array.array('q')
+        if revs >= len(offsets):
+            offsets.extend(itertools.repeat(-1, revs + 1 - len(offsets)))
+        previous_offset = offsets[revs]
+        offsets[revs] = offset if offset is not None else -1
+        if previous_offset == -1:
+            return offset is not None
+        if offset is None or (line if line is not None else self._read_line(offset)) != self._read_line(
+                previous_offset):
+            self.changed_pads.add(pad_name)
+        return False
+
+    def iter_changed_pads_revisions(self, pad_filter=None, timestamp_range=None):
+        """
+        Read again all the current revisions of the pads changed during the last read (see changed_pads)
+
+        :param pad_filter: see decode_revision_record
+        :param timestamp_range: see decode_revision_record
+        :return: generator of the name of each changed pad kept by the filter and of its revisions, in the order of
+            their revision numbers (a pad deleted has no revision)
+        :rtype: collections.Iterable[(str,list[(str, int, str, str, int)])]
+        """
+        for pad_name in sorted(self.changed_pads):
+            if match_pad_filter(pad_name, pad_filter):
+                yield pad_name, list(self.iter_pad_revisions(pad_name, timestamp_range=timestamp_range))
+
+    def _read_line(self, offset):
+        """
+        Read a line of the file
+
+        :param offset: byte offset of the line
+        :type offset: int
+        :return: the line, without the trailing newline
+        :rtype: bytes
+        """
+        with open(self.path_to_db, 'rb') as f:
+            f.seek(offset)
+            return f.readline().rstrip(b'\n')
+
+    def iter_pad_revisions(self, pad_name, start_revs=0, end_revs=None, timestamp_range=None):
+        """
+        Read the revisions of a pad directly from their offsets, without reading the rest of the file. Only the
+        revisions already seen by the reader can be read.
+
+        :param pad_name: name of the pad
+        :type pad_name: str
+        :param start_revs: first revision read
+        :type start_revs: int
+        :param end_revs: revision after the last one read (None to read up to the last revision seen)
+        :type end_revs: int
+        :param timestamp_range: see decode_revision_record
+        :return: generator of the revisions, decoded with decode_revision_record
+        :rtype: collections.Iterable[(str, int, str, str, int)]
+        """
+        offsets = self.revision_offsets.get(pad_name, array.array('q'))
+        with open(self.path_to_db, 'rb') as f:
+            for offset in offsets[start_revs:end_revs]:
+                if offset == -1:
+                    continue
+                f.seek(offset)
+                revision = decode_dirty_db_line(f.readline().rstrip(b'\n').decode('utf-8'),
+                                                timestamp_range=timestamp_range)
+                if revision is not None:
+                    yield revision
+
+    def _iter_new_raw_lines(self):
+        """
+        Same as iter_new_lines, but the lines are not decoded and are given with their byte offset
+
+        :rtype: collections.Iterable[(int,bytes)]
+        """
+        self.rewound = False
+        self.changed_pads = set()
+        try:
+            f = open(self.path_to_db, 'rb')
+        except FileNotFoundError:
+            if not self.missing_ok:
+                raise
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if self._file_changed(f, stat):
+                self.reset()
+            self.file_id = (stat.st_dev, stat.st_ino)
+            f.seek(self.offset)
+            pending = b''
+            try:
+                while True:
+                    block = f.read(self.block_size)
+                    if not block:
+                        # What remains in pending is a partial line, we will read it again next time
+                        return
+                    block = pending + block
+                    end = block.rfind(b'\n') + 1
+                    pending = block[end:]
+                    for line in block[:end].split(b'\n')[:-1]:
+                        offset = self.offset
+                        self.offset += len(line) + 1
+                        self.lines_read += 1
+                        yield offset, line
+            finally:
+                # Remember the end of what we read to check next time that it has not been rewritten
+                start = max(0, self.offset - self.fingerprint_size)
+                f.seek(start)
+                self.fingerprint = f.read(self.offset - start)
+
+    def split_new_lines(self, number_of_ranges):
+        """
+        Split the complete lines appended to the file since the last read in byte ranges of about the same size, each
+        of them starting at the start of a line, so that they can be read in parallel (see scan_dirty_db_range). The
+        reader is not moved, move_to must be called once the ranges have been read.
+
+        :param number_of_ranges: number of ranges we want (there can be less of them if there are only a few lines)
+        :type number_of_ranges: int
+        :return: the start and the end of each range, in the order of the file
+        :rtype: list[(int,int)]
+        """
+        self.rewound = False
+        self.changed_pads = set()
+        try:
+            f = open(self.path_to_db, 'rb')
+        except FileNotFoundError:
+            if not self.missing_ok:
+                raise
+            return []
+        with f:
+            stat = os.fstat(f.fileno())
+            if self._file_changed(f, stat):
+                self.reset()
+            self.file_id = (stat.st_dev, stat.st_ino)
+            if stat.st_size == self.offset:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # A partial last line is left for the next read
+                end = mm.rfind(b'\n', self.offset) + 1
+                if end == 0:
+                    return []
+                ranges = []
+                start = self.offset
+                for i in range(1, number_of_ranges + 1):
+                    if start >= end:
+                        break
+                    range_end = self.offset + (end - self.offset) * i // number_of_ranges
+                    range_end = mm.find(b'\n', max(start, range_end - 1), end) + 1 if range_end < end else end
+                    ranges.append((start, range_end))
+                    start = range_end
+                return ranges
+
+    def move_to(self, offset, lines_read):
+        """
+        Move the reader after lines read without it (see split_new_lines)
+
+        :param offset: byte offset of the end of the lines read
+        :type offset: int
+        :param lines_read: number of lines read
+        :type lines_read: int
+        """
+        self.offset = offset
+        self.lines_read += lines_read
+        start = max(0, offset - self.fingerprint_size)
+        with open(self.path_to_db, 'rb') as f:
+            f.seek(start)
+            self.fingerprint = f.read(offset - start)
+
+
+def scan_dirty_db_range(path_to_db, start, end, pad_filter=None, timestamp_range=None):
+    """
+    Parse the revisions of a byte range of a dirty.db file in a columnar store. The file is memory mapped and the lines
+    of the revisions are found by searching their bytes, only them are decoded. Used by the worker processes of
+    scan_dirty_db_parallel.
+
+    :param path_to_db: path to the dirty.db file
+    :type path_to_db: str
+    :param start: start of the range (start of a line)
+    :type start: int
+    :param end: end of the range (just after a newline)
+    :type end: int
+    :param pad_filter: see decode_revision_record
+    :param timestamp_range: see decode_revision_record
+    :return: the store of the elementary operations of the range, with the timestamp offsets starting at 0, the number
+        of lines of the range, the timestamp offset reached at the end of the range and the pad name, the revision
+        number and the offset (None for a deletion) of each write of a revision in the range, in the order of the file.
+        The revisions written several times in the range are only parsed the first time.
+    :rtype: (ElemOpStore,int,int,list[(str,int,int)])
+    """
+    store = ElemOpStore('etherpad')
+    timestamp_offset = 0
+    lines = 0
+    writes = []
+    parsed = set()
+    with open(path_to_db, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Count the lines by blocks so that the whole range is never copied at once
+        for block_start in range(start, end, DirtyDbReader.block_size):
+            lines += mm[block_start:min(end, block_start + DirtyDbReader.block_size)].count(b'\n')
+        position = start
+        while True:
+            line_start = mm.find(b'{"key":"pad:', position, end)
+            if line_start == -1:
+                break
+            line_end = mm.find(b'\n', line_start, end)
+            position = line_end + 1
+            if line_start != start and mm[line_start - 1] != ord('\n'):
+                # Not the start of a line
+                position = line_start + 1
+                continue
+            # Only the lines of the revisions are decoded, not the text of the pads nor their other records
+            key_end = mm.find(b'","val":', line_start, line_end)
+            if mm.rfind(b':revs:', line_start, key_end if key_end != -1 else line_end) == -1:
+                continue
+            line = mm[line_start:line_end]
+            write = parse_dirty_db_revision_write(line)
+            if write is None:
+                continue
+            pad_name, revs, deleted = write
+            writes.append((pad_name, revs, line_start if not deleted else None))
+            if deleted or (pad_name, revs) in parsed:
+                continue
+            parsed.add((pad_name, revs))
+            revision = decode_dirty_db_line(line.decode('utf-8'), pad_filter, timestamp_range)
+            if revision is not None:
+                timestamp_offset = store_revision_etherpad(store, revision, timestamp_offset)
+    return store, lines, timestamp_offset, writes
+
+
+def scan_dirty_db_parallel(store, reader, jobs, pad_filter=None, timestamp_range=None):
+    """
+    Parse the lines appended to a dirty.db file since the last read of the reader with several processes. The file is
+    split in byte ranges parsed in parallel (see scan_dirty_db_range) and their stores are appended to the store in
+    the order of the file. The timestamp offsets of each range are shifted by the offset reached at the end of the
+    previous ranges, so the elementary operations are the same as if the file was parsed sequentially. The revisions
+    already parsed in a previous range (or by a previous read) are dropped from the store of a range and the timestamp
+    offsets of the following elementary operations of the range are shifted back accordingly.
+
+    :param store: store to which we append the elementary operations
+    :type store: ElemOpStore
+    :param reader: reader of the dirty.db file, moved at the end of the lines parsed
+    :type reader: DirtyDbReader
+    :param jobs: number of worker processes
+    :type jobs: int
+    :param pad_filter: see decode_revision_record
+    :param timestamp_range: see decode_revision_record
+    """
+    # A few ranges per worker so that the workers stay busy if some ranges have more revisions than others
+    ranges = reader.split_new_lines(4 * jobs)
+    if not ranges:
+        return
+    scan_range = functools.partial(scan_dirty_db_range, reader.path_to_db, pad_filter=pad_filter,
+                                   timestamp_range=timestamp_range)
+    timestamp_offset = reader.timestamp_offset
+    lines_read = 0
+    with multiprocessing.Pool(jobs) as pool:
+        for range_store, range_lines, range_timestamp_offset, writes in pool.starmap(scan_range, ranges,
+                                                                                      chunksize=1):
+            # The range parsed the first write of each revision, it is dropped if the revision was already read
+            rewritten = set()
+            parsed = set()
+            for pad_name, revs, offset in writes:
+                to_parse = reader.index_revision(pad_name, revs, offset)
+                if offset is not None and (pad_name, revs) not in parsed:
+                    parsed.add((pad_name, revs))
+                    if not to_parse:
+                        rewritten.add((pad_name, revs))
+            if rewritten:
+                pads = range_store.pads
+                dropped = np.array([(pads[pad_id], revs) in rewritten
+                                    for pad_id, revs in zip(range_store.column('pad_id').tolist(),
+                                                            range_store.column('revs').tolist())], dtype=bool)
+                # Each elementary operation dropped would have incremented the timestamp offset
+                store.extend(range_store, timestamp_offset=timestamp_offset - np.cumsum(dropped),
+                             rows=np.flatnonzero(~dropped))
+                timestamp_offset += range_timestamp_offset - int(dropped.sum())
+            else:
+                store.extend(range_store, timestamp_offset=timestamp_offset)
+                timestamp_offset += range_timestamp_offset
+            lines_read += range_lines
+    reader.timestamp_offset = timestamp_offset
+    reader.move_to(ranges[-1][1], lines_read)
+
+
+def replace_changed_pads_etherpad(store, reader, pad_filter=None, timestamp_range=None):
+    """
+    Replace the elementary operations of the pads changed during the last read of a dirty.db file (see
+    DirtyDbReader.changed_pads) by the ones of their current revisions
+
+    :param store: store of the elementary operations read so far
+    :type store: ElemOpStore
+    :param reader: reader of the dirty.db file
+    :type reader: DirtyDbReader
+    :param pad_filter: see decode_revision_record
+    :param timestamp_range: see decode_revision_record
+    :return: the store without the elementary operations of the previous revisions of the changed pads (the same store
+        if no pad has changed)
+    :rtype: ElemOpStore
+    """
+    changed_pads = list(reader.iter_changed_pads_revisions(pad_filter, timestamp_range))
+    if not changed_pads:
+        return store
+    changed_pad_ids = [store.pad_ids[pad_name] for pad_name, _ in changed_pads if pad_name in store.pad_ids]
+    new_store = ElemOpStore(store.editor)
+    new_store.extend(store, rows=np.flatnonzero(~np.isin(store.column('pad_id'), changed_pad_ids)))
+    timestamp_offset = reader.timestamp_offset
+    for _, revisions in changed_pads:
+        for revision in revisions:
+            timestamp_offset = store_revision_etherpad(new_store, revision, timestamp_offset)
+    reader.timestamp_offset = timestamp_offset
+    return new_store
+
+
+class SQLiteStoreReader:
+    """
+    Incremental reader of the store table of an Etherpad SQLite database. Only the revisions of the pads are read, the
+    filtering is done by SQLite. The rows are read in the order of their rowid, the reader remembers the highest rowid
+    read so far (high-water mark) and each call only reads the rows added since then. The rows are streamed by batches
+    so that the whole store is never loaded in memory.
+
+    Etherpad writes the store with REPLACE INTO, so a revision written again gets a new rowid and comes back after the
+    high-water mark. The reader remembers the revisions of each pad it has read (revisions_read) and skips them: the
+    revisions of a pad don't change once written, so only its first write is read.
+    """
+
+    # Maximum number of pad names whose key ranges are given to SQLite. Beyond, the pads are only filtered by Python
+    max_pad_names_in_query = 100
+
+    def __init__(self, path_to_db, last_rowid=0, batch_size=1000, pad_filter=None):
+        """
+        Create a reader of an Etherpad SQLite database
+
+        :param path_to_db: path to the SQLite database
+        :type path_to_db: str
+        :param last_rowid: rowid of the last row already read. Pass the last_rowid of a previous reader to resume.
+        :type last_rowid: int
+        :param batch_size: number of rows fetched at once
+        :type batch_size: int
+        :param pad_filter: if it is a pad name or a set of pad names (see normalize_pad_filter), only the entries of
+            these pads are read, using the index of the keys. Other filters are left to decode_revision_record.
+        :type pad_filter: str|frozenset[str]|typing.Pattern|None
+        """
+        self.path_to_db = path_to_db
+        self.last_rowid = last_rowid
+        """Highest rowid read so far"""
+        self.batch_size = batch_size
+        self.pad_filter = pad_filter
+        self.timestamp_offset = 0
+        """Timestamp offset reached by the elementary operations parsed so far (see extract_elem_ops_etherpad)"""
+        self.rewound = False
+        """Whether the last read started again from the first row because the store has been rebuilt"""
+        self.revisions_read = dict()
+        """Whether each revision of each pad has already been read (1) or not (0)
+
+        :type: dict[str,bytearray]"""
+
+    def get_state(self):
+        """
+        Get what the reader needs to resume reading later on, in a form that can be serialized in JSON
+
+        :rtype: dict
+        """
+        return {'last_rowid': self.last_rowid,
+                'timestamp_offset': self.timestamp_offset,
+                'revisions_read': {pad_name: revisions.hex() for pad_name, revisions in self.revisions_read.items()}}
+
+    @classmethod
+    def from_state(cls, path_to_db, state):
+        """
+        Create a reader resuming from the state of a previous reader
+
+        :param path_to_db: path to the SQLite database
+        :type path_to_db: str
+        :param state: state returned by get_state
+        :type state: dict
+        :rtype: SQLiteStoreReader
+        """
+        reader = cls(path_to_db, state['last_rowid'])
+        reader.timestamp_offset = state['timestamp_offset']
+        reader.revisions_read = {pad_name: bytearray.fromhex(revisions)
+                                 for pad_name, revisions in state['revisions_read'].items()}
+        return reader
+
+    def has_changed(self):
+        """
+        Check, without reading anything, whether the store has been rebuilt since the last read (the next read would
+        start again from the first row).
+
+        :rtype: bool
+        """
+        conn = sqlite3.connect(self.path_to_db)
+        try:
+            max_rowid = conn.execute("SELECT max(rowid) FROM store;").fetchone()[0] or 0
+        finally:
+            conn.close()
+        return max_rowid < self.last_rowid
+
+    def iter_new_entries(self):
+        """
+        Iterate over the revision entries added to the store since the last call. The high-water mark is updated as
+        the entries are consumed. The revisions already read are skipped (see revisions_read).
+
+        :return: generator of (key, value)
+        :rtype: collections.Iterable[(str,str)]
+        """
+        self.rewound = False
+        conn = sqlite3.connect(self.path_to_db)
+        try:
+            max_rowid = conn.execute("SELECT max(rowid) FROM store;").fetchone()[0] or 0
+            if max_rowid < self.last_rowid:
+                # Rows we already read have disappeared, the store has been rebuilt. We start again from scratch
+                self.last_rowid = 0
+                self.timestamp_offset = 0
+                self.revisions_read = dict()
+                self.rewound = True
+            query = "SELECT rowid, key, value FROM store WHERE key LIKE 'pad:%:revs:%' AND rowid > ?"
+            parameters = [self.last_rowid]
+            if isinstance(self.pad_filter, str):
+                pad_names = [self.pad_filter]
+            elif isinstance(self.pad_filter, frozenset) and len(self.pad_filter) <= self.max_pad_names_in_query:
+                pad_names = sorted(self.pad_filter)
+            else:
+                pad_names = None
+            if pad_names is not None:
+                # The keys of the revisions of a pad are between 'pad:<pad name>:revs:' and 'pad:<pad name>:revs;'
+                # (';' comes right after ':'), which SQLite finds with the index of the primary key
+                query += " AND (" + " OR ".join(["(key >= ? AND key < ?)"] * len(pad_names)) + ")"
+                for pad_name in pad_names:
+                    parameters += ['pad:' + pad_name + ':revs:', 'pad:' + pad_name + ':revs;']
+            c = conn.execute(query + " ORDER BY rowid;", parameters)
+            while True:
+                entries = c.fetchmany(self.batch_size)
+                if not entries:
+                    return
+                for rowid, key, value in entries:
+                    self.last_rowid = rowid
+                    pad_name_and_revs = parse_revs_key(key)
+                    if pad_name_and_revs is not None:
+                        pad_name, revs = pad_name_and_revs
+                        revisions = self.revisions_read.get(pad_name)
+                        if revisions is None:
+                            revisions = self.revisions_read[pad_name] = bytearray()
+                        if revs >= len(revisions):
+                            revisions.extend(bytes(revs + 1 - len(revisions)))
+                        elif revisions[revs]:
+                            # Written again with REPLACE INTO
+                            continue
+                        revisions[revs] = 1
+                    yield key, value
+        finally:
+            conn.close()
+
+
+def decode_stian_logs_rows(rows, timestamp_range=None):
+    """
+    Decode a chunk of rows of Stian's logs. Run by the worker processes of get_elem_ops_per_pad_from_stian_logs.
+
+    :param rows: list of (index of the row, key, value)
+    :type rows: list[(int,str,str)]
+    :param timestamp_range: only keep the revisions in this time window (see in_timestamp_range)
+    :type timestamp_range: (int,int)|None
+    :return: list of (pad name, (timestamp, index of the row, revision number, changeset, author)). The second element
+        is ordered by timestamp and then by position in the file.
+    :rtype: list[(str,(int,int,int,str,str))]
+    """
+    revisions = []
+    for row_idx, key, value in rows:
+        revision = decode_revision_record(key, value, timestamp_range=timestamp_range)
+        if revision is not None:
+            pad_name, revs, changeset, author_name, timestamp = revision
+            revisions.append((pad_name, (int(timestamp), row_idx, revs, changeset, author_name)))
+    return revisions
+
+
+def extract_elem_ops_stian_logs(pad_revisions):
+    """
+    Create the ElementaryOperation of a pad from its revisions sorted by timestamp. Run by the worker processes of
+    get_elem_ops_per_pad_from_stian_logs.
+
+    :param pad_revisions: pad name and its sorted revisions as returned by iter_sorted_revisions_stian_logs (their
+        timestamp already includes the timestamp offset of the revision)
+    :type pad_revisions: (str,list[(int,int,int,str,str)])
+    :return: the pad name and its list of ElementaryOperation
+    :rtype: (str,list[ElementaryOperation])
+    """
+    pad_name, revisions = pad_revisions
+    pad_elem_ops = []
+    pad_name = sys.intern(pad_name)
+    for timestamp, _, revs, changeset, author_name in revisions:
+        # if it's the line generated automatically by etherpad, the author is empty
+        author_name = sys.intern(author_name) if author_name != '' else 'Etherpad_admin'
+        elem_ops = parse_changeset_etherpad(changeset)
+        # The elem_ops of a revision are given consecutive timestamps (see sort_revisions_stian_logs)
+        for timestamp_offset, elem_op in enumerate(elem_ops):
+            elem_op.author = author_name
+            elem_op.timestamp = timestamp + timestamp_offset
+            elem_op.revs = revs
+            elem_op.pad_name = pad_name
+        pad_elem_ops += elem_ops
+    return pad_name, pad_elem_ops
+
+
+def sort_revisions_stian_logs(path_to_db, index_from_lines, imap, chunk_size, memory_budget, spill_file,
+                              pad_filter=None, timestamp_range=None):
+    """
+    First pass of the external merge sort of Stian's logs. The file is streamed by chunks of rows that are decoded
+    with imap (in parallel if it is the imap of a pool of processes). The revisions are grouped by pad. When the
+    revisions kept in memory exceed memory_budget, the revisions of each pad are sorted and spilled to spill_file.
+
+    Sometimes, we will get multiple elem_ops when we parse the changeset. We need to give them different timestamps.
+    So we add an offset to the timestamp of each elem_op to differentiate them: the number of elem_ops of all the
+    revisions (of all the pads) before it, in the order of the timestamps. The elem_ops of each revision are counted
+    during this pass (see count_elem_ops_etherpad), so the offset of each revision is known before the changesets are
+    parsed pad by pad.
+
+    :param path_to_db: path to the CSV file
+    :type path_to_db: str
+    :param index_from_lines: number of revisions already treated, in the order of their timestamps. They are skipped.
+    :type index_from_lines: int
+    :param imap: map function used to decode the chunks
+    :param chunk_size: number of rows decoded at once
+    :type chunk_size: int
+    :param memory_budget: approximate number of bytes of revisions we keep in memory before spilling them to disk
+    :type memory_budget: int
+    :param spill_file: binary file in which the sorted runs are spilled
+    :param pad_filter: only keep the revisions of the pads kept by this filter (see normalize_pad_filter). The rows of
+        the other pads are not decoded.
+    :type pad_filter: str|frozenset[str]|typing.Pattern|None
+    :param timestamp_range: only keep the revisions in this time window (see in_timestamp_range)
+    :type timestamp_range: (int,int)|None
+    :return: the revisions of each pad still in memory (not sorted), the offsets in spill_file of the sorted runs of
+        each pad, the timestamp offset of each revision row of the file (-1 for the ones skipped or filtered out, see
+        iter_sorted_revisions_stian_logs) and the number of revisions
+    :rtype: (dict[str,list[(int,int,int,str,str)]],dict[str,list[int]],array.array,int)
+    """
+
+    def iter_chunks():
+        """
+        Read the CSV file and yield the chunks of revision rows. Only the key is looked at here.
+        """
+        nonlocal revision_rows
+        chunk = []
+        with open(path_to_db, encoding="utf8", newline='') as f:
+            rows = csv.reader(f)
+            header = next(rows)
+            key_idx = header.index('key')
+            value_idx = header.index('value')
+            for row in rows:
+                pad_name_and_revs = parse_revs_key(row[key_idx])
+                if pad_name_and_revs is not None:
+                    revision_rows += 1
+                    if match_pad_filter(pad_name_and_revs[0], pad_filter):
+                        chunk.append((revision_rows, row[key_idx], row[value_idx]))
+                        if len(chunk) == chunk_size:
+                            yield chunk
+                            chunk = []
+        if chunk:
+            yield chunk
+
+    revision_rows = 0
+    # Timestamp, row and number of elem_ops of each revision
+    revision_timestamps = array.array('q')
+    revision_indices = array.array('q')
+    revision_lengths = array.array('q')
+    # Revisions per pad kept in memory, and their approximate size in bytes
+    buffered_revisions = dict()
+    """:type: dict[str,list]"""
+    buffered_size = 0
+    # Sorted runs of each pad that have been spilled to disk: list of offsets in the spill file
+    spilled_runs = dict()
+    """:type: dict[str,list[int]]"""
+    decode = decode_stian_logs_rows
+    if timestamp_range is not None:
+        decode = functools.partial(decode_stian_logs_rows, timestamp_range=timestamp_range)
+    for revisions in imap(decode, iter_chunks()):
+        for pad_name, revision in revisions:
+            if pad_name not in buffered_revisions:
+                buffered_revisions[pad_name] = []
+            buffered_revisions[pad_name].append(revision)
+            revision_timestamps.append(revision[0])
+            revision_indices.append(revision[1])
+            revision_lengths.append(count_elem_ops_etherpad(revision[3]))
+            buffered_size += len(revision[3]) + len(pad_name) + len(revision[4]) + 200
+        if buffered_size > memory_budget:
+            # Spill the sorted runs of each pad to disk
+            for pad_name, pad_revisions in buffered_revisions.items():
+                pad_revisions.sort()
+                spilled_runs.setdefault(pad_name, []).append(spill_file.tell())
+                pickle.dump(pad_revisions, spill_file, pickle.HIGHEST_PROTOCOL)
+            buffered_revisions = dict()
+            buffered_size = 0
+
+    # Order all the revisions by timestamp (and position in the file), skip the first index_from_lines ones and count
+    # the elem_ops of the ones before each revision
+    revision_indices = np.frombuffer(revision_indices, np.int64)
+    order = np.lexsort((revision_indices, np.frombuffer(revision_timestamps, np.int64)))
+    lengths = np.frombuffer(revision_lengths, np.int64)[order]
+    lengths[:index_from_lines] = 0
+    timestamp_offsets = np.full(revision_rows + 1, -1, np.int64)
+    timestamp_offsets[revision_indices[order[index_from_lines:]]] = (np.cumsum(lengths) - lengths)[index_from_lines:]
+    # Kept in a Python array so that looking them up gives plain ints
+    timestamp_offsets_array = array.array('q')
+    timestamp_offsets_array.frombytes(timestamp_offsets.tobytes())
+    return buffered_revisions, spilled_runs, timestamp_offsets_array, len(order)
+
+
+def iter_sorted_revisions_stian_logs(buffered_revisions, spilled_runs, spill_file, timestamp_offsets):
+    """
+    Second pass of the external merge sort of Stian's logs. Yield the revisions of each pad sorted by timestamp,
+    merging the runs spilled to disk if any. The timestamp offset of each revision is added to its timestamp and the
+    revisions skipped are dropped.
+
+    :param buffered_revisions: revisions of each pad still in memory, as returned by sort_revisions_stian_logs
+    :type buffered_revisions: dict[str,list[(int,int,int,str,str)]]
+    :param spilled_runs: offsets of the sorted runs of each pad, as returned by sort_revisions_stian_logs
+    :type spilled_runs: dict[str,list[int]]
+    :param spill_file: binary file in which the sorted runs have been spilled
+    :param timestamp_offsets: timestamp offset of each revision row, as returned by sort_revisions_stian_logs
+    :type timestamp_offsets: array.array
+    :return: generator of (pad name, sorted revisions)
+    :rtype: collections.Iterable[(str,list[(int,int,int,str,str)])]
+    """
+    for pad_name in list(spilled_runs.keys() | buffered_revisions.keys()):
+        runs = []
+        for offset in spilled_runs.pop(pad_name, []):
+            spill_file.seek(offset)
+            runs.append(pickle.load(spill_file))
+        runs.append(sorted(buffered_revisions.pop(pad_name, [])))
+        revisions = [(timestamp + timestamp_offsets[row_idx], row_idx, revs, changeset, author_name)
+                     for timestamp, row_idx, revs, changeset, author_name in
+                     (heapq.merge(*runs) if len(runs) > 1 else runs[0])
+                     if timestamp_offsets[row_idx] != -1]
+        if revisions:
+            yield pad_name, revisions
+
+
+def get_elem_ops_per_pad_from_stian_logs(path_to_db, index_from_lines=0, jobs=1, chunk_size=10000,
+                                         memory_budget=None, pad_filter=None, timestamp_range=None):
+    """
+    Get the ElementaryOperation of each pad from Stian's logs (CSV export of an etherpad store, not sorted).
+
+    The file is streamed by chunks of rows that are decoded in parallel by jobs worker processes. The revisions are
+    grouped by pad and only sorted within their pad. When the revisions kept in memory exceed memory_budget, they are
+    sorted and spilled to a temporary file; the sorted runs of each pad are merged back at the end (external merge
+    sort). Finally the changesets of each pad are parsed in parallel.
+
+    :param path_to_db: path to the CSV file
+    :type path_to_db: str
+    :param index_from_lines: number of revisions already treated, in the order of their timestamps. They are skipped.
+    :type index_from_lines: int
+    :param jobs: number of worker processes
+    :type jobs: int
+    :param chunk_size: number of rows sent at once to a worker process
+    :type chunk_size: int
+    :param memory_budget: approximate number of bytes of revisions we keep in memory before spilling them to disk
+    :type memory_budget: int
+    :param pad_filter: only parse the pads kept by this filter (see normalize_pad_filter)
+    :type pad_filter: str|frozenset[str]|typing.Pattern|None
+    :param timestamp_range: only parse the revisions in this time window (see in_timestamp_range)
+    :type timestamp_range: (int,int)|None
+    :return: the list of ElementaryOperation of each pad and the number of revisions treated
+    :rtype: (dict[str,list[ElementaryOperation]],int)
+    """
+    if memory_budget is None:
+        memory_budget = config.parser_memory_budget
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    imap = pool.imap if pool is not None else map
+    with tempfile.TemporaryFile() as spill_file:
+        try:
+            buffered_revisions, spilled_runs, timestamp_offsets, number_of_revisions = sort_revisions_stian_logs(
+                path_to_db, index_from_lines, imap, chunk_size, memory_budget, spill_file, pad_filter, timestamp_range)
+            sorted_pads = iter_sorted_revisions_stian_logs(buffered_revisions, spilled_runs, spill_file,
+                                                           timestamp_offsets)
+            list_of_elem_ops_per_pad = dict(imap(extract_elem_ops_stian_logs, sorted_pads))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    return list_of_elem_ops_per_pad, number_of_revisions
+
+
+class MongoOpsReader:
+    """
+    Long-lived reader of the ops of the collab-react-components and FROG editors stored in MongoDB by ShareDB. The
+    client, and therefore its pool of connections, is kept between polls instead of connecting again each time. Only
+    the fields of the ops we use are fetched, by batches of batch_size documents.
+
+    If cursor_field is specified, the reader follows a single monotone cursor instead of querying each pad: each poll
+    fetches all the ops whose cursor_field is after the last one read, with one range scan on the index of this field,
+    and the ops are routed to their pad by the caller. The cost of a poll no longer depends on the number of pads. The
+    cursor is either '_id' (always indexed) or 'm.ts' (see index_recommendation). Both are set before the insert (the
+    ObjectIds are generated by the client), so ops inserted concurrently can be committed out of the order of the
+    cursor: an op committed after a poll has read a later one is behind the cursor and never read. The cursor is only
+    safe when the ops are inserted one at a time, otherwise the pads are queried after the last version read of each.
+    """
+
+    # Fields of the ShareDB ops we need
+    projection = {'_id': False, 'd': True, 'v': True, 'src': True, 'm.ts': True, 'op': True, 'create': True}
+    # How long each getMore of the change stream waits for new ops. Kept short so that we stop shortly after the last op.
+    change_stream_await_ms = 50
+
+    def __init__(self, port=None, database_name=None, collection_name=None, batch_size=None, client=None,
+                 cursor_field=None, use_change_stream=False, await_time=None):
+        """
+        Connect to the collection of ops
+
+        :param port: port of mongod. config.mongodb_port by default
+        :param database_name: name of the database. config.mongodb_database_name by default
+        :param collection_name: name of the collection of ops. config.mongodb_collection_name by default
+        :param batch_size: number of documents fetched at once. config.mongodb_batch_size by default
+        :param client: client to use instead of creating a new one
+        :type client: MongoClient
+        :param cursor_field: field of the ops used as a monotone cursor ('_id' or 'm.ts'). None to query the pads one by
+            one.
+        :type cursor_field: str
+        :param use_change_stream: whether to subscribe to the change stream of the collection instead of polling it
+            (needs a replica set, a single node one is enough). We fall back to polling if it is not available.
+        :type use_change_stream: bool
+        :param await_time: how many seconds we wait for new ops on the change stream. config.server_update_delay by
+            default
+        :type await_time: float
+        """
+        self.client = client if client is not None else MongoClient(
+            port=port if port is not None else config.mongodb_port)
+        self.collection = self.client[database_name if database_name is not None else config.mongodb_database_name][
+            collection_name if collection_name is not None else config.mongodb_collection_name]
+        self.batch_size = batch_size if batch_size is not None else config.mongodb_batch_size
+        self.cursor_field = cursor_field
+        if cursor_field is not None:
+            self.projection = dict(self.projection)
+            self.projection[cursor_field] = True
+        self.last_cursor = None
+        """Value of cursor_field of the last op read"""
+        # (pad name, version) of the ops read whose cursor_field is last_cursor. Needed because m.ts is not unique
+        self.read_at_last_cursor = set()
+        self.use_change_stream = use_change_stream
+        self.await_time = await_time if await_time is not None else config.server_update_delay
+        self.change_stream = None
+        """Change stream of the inserted ops, once it has been opened"""
+
+    def find(self, query):
+        """
+        Find the ops matching the query
+
+        :param query: mongo query
+        :type query: dict
+        :return: cursor over the ops, with only the fields we need
+        """
+        logger.debug("Mongo query: %s", query)
+        return self.collection.find(query, self.projection, batch_size=self.batch_size)
+
+    def find_new_ops(self):
+        """
+        Find all the ops after the cursor, in the order of the cursor, and move the cursor forward as they are consumed.
+
+        :return: generator of the new ops, with only the fields we need
+        """
+        query = dict()
+        if self.last_cursor is not None:
+            # $gte and not $gt since m.ts is not unique. The ops already read are skipped below.
+            query = {self.cursor_field: {'$gte': self.last_cursor}}
+        logger.debug("Mongo query: %s", query)
+        for item in self.collection.find(query, self.projection, batch_size=self.batch_size).sort(self.cursor_field, 1):
+            if self._move_cursor(item):
+                yield item
+
+    def _move_cursor(self, item):
+        """
+        Move the cursor to the op if it is after the cursor.
+
+        :return: False if the op has already been read
+        :rtype: bool
+        """
+        if self.cursor_field is None:
+            return True
+        value = item
+        for field in self.cursor_field.split('.'):
+            value = value[field]
+        op_id = (item['d'], item['v'])
+        if value == self.last_cursor:
+            if op_id in self.read_at_last_cursor:
+                return False
+        elif self.last_cursor is None or value > self.last_cursor:
+            self.last_cursor = value
+            self.read_at_last_cursor = set()
+        self.read_at_last_cursor.add(op_id)
+        return True
+
+    def open_change_stream(self):
+        """
+        Subscribe to the inserts in the collection of ops. It should be opened before fetching the ops already in the
+        collection so that no op is missed between the two. If change streams are not available (mongod is not part of
+        a replica set), we fall back to polling.
+
+        :return: whether the change stream is open
+        :rtype: bool
+        """
+        pipeline = [{'$match': {'operationType': 'insert'}},
+                    {'$project': {'fullDocument.' + field: True
+                                  for field, included in self.projection.items() if included}}]
+        try:
+            self.change_stream = self.collection.watch(pipeline, batch_size=self.batch_size,
+                                                       max_await_time_ms=self.change_stream_await_ms)
+        except PyMongoError as e:
+            logger.warning("Change stream not available (%s), falling back to polling", e)
+            self.use_change_stream = False
+            self.change_stream = None
+        return self.change_stream is not None
+
+    def watch_new_ops(self):
+        """
+        Wait up to await_time seconds for new ops on the change stream and return all the ops that arrived. If the
+        change stream fails, we fall back to polling and return None.
+
+        :return: the new ops, with only the fields we need, or None if the change stream is not available anymore
+        :rtype: list[dict]
+        """
+        items = []
+        deadline = time.monotonic() + self.await_time
+        try:
+            while True:
+                change = self.change_stream.try_next()
+                if change is not None:
+                    item = change['fullDocument']
+                    if self._move_cursor(item):
+                        items.append(item)
+                elif items or time.monotonic() >= deadline:
+                    # Nothing more arrived
+                    return items
+        except PyMongoError as e:
+            logger.warning("Change stream failed (%s), falling back to polling", e)
+            self.close_change_stream()
+            self.use_change_stream = False
+            return None
+
+    def close_change_stream(self):
+        """
+        Unsubscribe from the change stream
+        """
+        if self.change_stream is not None:
+            self.change_stream.close()
+            self.change_stream = None
+
+    def index_recommendation(self):
+        """
+        Check that the collection has an index allowing the range scans on cursor_field. If not, log a warning with
+        the index to create.
+
+        :return: the recommended index (None if we are not following a cursor)
+        :rtype: list[(str,int)]
+        """
+        if self.cursor_field is None:
+            return None
+        index = [(self.cursor_field, 1)]
+        indexed = [info['key'][0][0] for info in self.collection.index_information().values()]
+        if self.cursor_field not in indexed:
+            logger.warning("No index on %s in %s, each poll will scan the whole collection. "
+                           "Create it with collection.create_index(%s)", self.cursor_field, self.collection.name, index)
+        return index
+
+    def close(self):
+        """
+        Close the change stream, the client and its connections
+        """
+        self.close_change_stream()
+        self.client.close()
+
+
+def mongo_filter_conditions(pad_filter, timestamp_range):
+    """
+    Translate a pad filter and a time window in conditions of a mongo query on the ShareDB ops
+
+    :param pad_filter: pad filter (see normalize_pad_filter)
+    :type pad_filter: str|frozenset[str]|typing.Pattern|None
+    :param timestamp_range: time window (see in_timestamp_range)
+    :type timestamp_range: (int,int)|None
+    :return: the list of conditions, to be combined with $and
+    :rtype: list[dict]
+    """
+    conditions = []
+    if isinstance(pad_filter, str):
+        conditions.append({'d': pad_filter})
+    elif isinstance(pad_filter, frozenset):
+        conditions.append({'d': {'$in': sorted(pad_filter)}})
+    elif pad_filter is not None:
+        conditions.append({'d': {'$regex': pad_filter.pattern}})
+    if timestamp_range is not None:
+        start, end = timestamp_range
+        timestamp_condition = dict()
+        if start is not None:
+            timestamp_condition['$gte'] = start
+        if end is not None:
+            timestamp_condition['$lt'] = end
+        if timestamp_condition:
+            conditions.append({'m.ts': timestamp_condition})
+    return conditions
+
+
+def get_elem_ops_per_pad_from_db(path_to_db=None, editor=None, index_from_lines=0, revs_mongo=None, regex=None,
+                                 reader=None, jobs=1, cache_location=None, pad_filter=None, timestamp_range=None):
     """
     Get the list of ElementaryOperation parsed from the db file
 
-    :param index_from_lines:
-    :param editor: 'etherpad' or 'collab-react-components' or 'stian_logs'
+    :param index_from_lines: from where to start parsing: the number of lines already treated for etherpad, the
+        rowid of the last row already treated for etherpadSQLite3, the number of revisions already treated (in the
+        order of their timestamps) for stian_logs
+    :param editor: 'etherpad' or 'etherpadSQLite3' or 'collab-react-components' or 'stian_logs'
     :param path_to_db: path to the db file containing the operations
-    :return: list of ElementaryOperation
+    :param reader: for etherpad and etherpadSQLite3, reader keeping track of what has already been read in the
+        database. If specified, only the records added since the last call are parsed (index_from_lines is ignored)
+        and the position of the reader (byte offset for etherpad, rowid for etherpadSQLite3) is returned instead of
+        index_from_lines. For etherpad, the pads whose revisions already read have changed (see
+        DirtyDbReader.changed_pads) are given with all the elementary operations of their current revisions, which
+        replace the ones given before. For collab-react-components and FROG, long-lived reader to use instead of
+        connecting to mongo for this call only.
+    :type reader: DirtyDbReader|SQLiteStoreReader|MongoOpsReader
+    :param jobs: for stian_logs and etherpad, number of worker processes used to parse the file (for etherpad, only
+        used when the whole file or the lines appended since the last call of the reader are parsed)
+    :type jobs: int
+    :param cache_location: for etherpad, etherpadSQLite3 and stian_logs, directory where the parsed elementary
+        operations are cached (see get_elem_op_store_cached). Only used when the whole file is parsed (no reader and
+        index_from_lines is 0) and no filter is given.
+    :type cache_location: str
+    :param pad_filter: only parse the pads kept by this filter: name of a pad, collection of pad names or regular
+        expression searched in the pad names. The filter is applied before decoding the records (on the key for the
+        etherpad logs, in the query for mongo).
+    :type pad_filter: str|collections.Iterable[str]|typing.Pattern|None
+    :param timestamp_range: only parse the revisions whose timestamp is in this time window: (start, end), the start is
+        included and the end excluded, either of them can be None for no bound.
+    :type timestamp_range: (int,int)|None
+    :return: list of ElementaryOperation of each pad, in the order of the logs (see
+        operation_builder.sort_elem_ops_per_pad)
     :rtype: dict[str,list[ElementaryOperation]]
     """
-    # todo add the selective parsing
+    pad_filter = normalize_pad_filter(pad_filter)
+    if cache_location is not None and reader is None and index_from_lines == 0 and pad_filter is None \
+            and timestamp_range is None and editor in ('etherpad', 'etherpadSQLite3', 'stian_logs'):
+        store, index_from_lines = get_elem_op_store_cached(path_to_db, editor, cache_location, jobs=jobs)
+        return store.get_elem_ops_per_pad(), index_from_lines
+
     list_of_elem_ops_per_pad = dict()
 
-    if editor == 'etherpad':
-        # todo add the sorted algorithm here too
-        with open(path_to_db) as f:
-            lines = f.readlines()
+    if editor == 'etherpad' and jobs > 1 and (reader is not None or index_from_lines == 0):
+        # Big files are split and parsed in parallel, see scan_dirty_db_parallel
+        store, index_from_lines = get_elem_op_store_from_db(path_to_db, editor, reader=reader, jobs=jobs,
+                                                            pad_filter=pad_filter, timestamp_range=timestamp_range)
+        list_of_elem_ops_per_pad = store.get_elem_ops_per_pad(sorted_=False)
+        if reader is not None:
+            index_from_lines = reader.offset
+
+    elif editor == 'etherpad':
+        if reader is None:
+            # Read the whole file, skipping the lines that have already been treated
+            reader = DirtyDbReader(path_to_db)
+            revisions = reader.iter_new_revisions(pad_filter, timestamp_range, skip_lines=index_from_lines)
+        else:
+            revisions = reader.iter_new_revisions(pad_filter, timestamp_range)
+            index_from_lines = None
         # Sometimes, we will get multiple elem_ops when we parse the changeset. We need to give them different
         # timestamps. So we add an offset to the timestamp of each elem_op to differentiate them. We keep track of this
         # offset to apply it to the following ops
-        timestamp_offset = 0
-        for line in lines[index_from_lines:]:
-            # We look at relevant log lines
-            if '{"key":"pad:' in line:
-                line_changed = line.replace("false", "False").replace("null", "None")
-                line_dict = dict(eval(line_changed))
-                if 'revs' in line_dict['key']:
-                    pad_name, elem_ops, timestamp_offset = extract_elem_ops_etherpad(line_dict,
-                                                                                     timestamp_offset,
-                                                                                     editor)
-                    if not (pad_name in list_of_elem_ops_per_pad.keys()):
-                        list_of_elem_ops_per_pad[pad_name] = []
-                    list_of_elem_ops_per_pad[pad_name] += elem_ops
-            index_from_lines += 1
+        timestamp_offset = reader.timestamp_offset
+        # The revisions written several times are only given once by the reader
+        for revision in revisions:
+            pad_name, elem_ops, timestamp_offset = extract_elem_ops_etherpad(revision, timestamp_offset, editor)
+            if not (pad_name in list_of_elem_ops_per_pad.keys()):
+                list_of_elem_ops_per_pad[pad_name] = []
+            list_of_elem_ops_per_pad[pad_name] += elem_ops
+        # The last write of a revision wins: the pads whose revisions have changed are read again
+        for pad_name, pad_revisions in reader.iter_changed_pads_revisions(pad_filter, timestamp_range):
+            list_of_elem_ops_per_pad.pop(pad_name, None)
+            for revision in pad_revisions:
+                _, elem_ops, timestamp_offset = extract_elem_ops_etherpad(revision, timestamp_offset, editor)
+                if not (pad_name in list_of_elem_ops_per_pad.keys()):
+                    list_of_elem_ops_per_pad[pad_name] = []
+                list_of_elem_ops_per_pad[pad_name] += elem_ops
+        reader.timestamp_offset = timestamp_offset
+        if index_from_lines is None:
+            index_from_lines = reader.offset
+        else:
+            index_from_lines = reader.lines_read
 
     elif editor == 'etherpadSQLite3':
-        # TODO: add the sorted algorithm
-        # Connect to the db file.
-        conn = sqlite3.connect(path_to_db)
-        c = conn.cursor()
-        c.execute("SELECT * FROM store;")
-        # Fetch all the entries.
-        entries = c.fetchall()
-        conn.close()
-        timestamp_offset = 0
+        if reader is None:
+            reader = SQLiteStoreReader(path_to_db, last_rowid=index_from_lines, pad_filter=pad_filter)
+        timestamp_offset = reader.timestamp_offset
         # For each entry, parse it and extrat the elem_op
-        for entry in entries[index_from_lines:]:
-            if "pad:" in entry[0] and "revs" in entry[0]:
-                data = eval(entry[1].replace("false", "False").replace("null", "None"))
-                line_dict = dict()
-                line_dict['key'] = entry[0]
-                line_dict['val'] = data
-
-                pad_name, elem_ops, timestamp_offset = extract_elem_ops_etherpad(line_dict, timestamp_offset, editor)
+        for key, value in reader.iter_new_entries():
+            revision = decode_revision_record(key, value, pad_filter, timestamp_range)
+            if revision is not None:
+                pad_name, elem_ops, timestamp_offset = extract_elem_ops_etherpad(revision, timestamp_offset, editor)
                 if not (pad_name in list_of_elem_ops_per_pad.keys()):
                     list_of_elem_ops_per_pad[pad_name] = []
                 list_of_elem_ops_per_pad[pad_name] += elem_ops
-            index_from_lines += 1
+        reader.timestamp_offset = timestamp_offset
+        index_from_lines = reader.last_rowid
 
     elif editor == 'collab-react-components' or editor == 'FROG':
-        # Connect to the DB
-        client = MongoClient(port=config.mongodb_port)
-        db = client[config.mongodb_database_name]
-        o_docs = db[config.mongodb_collection_name]
-        # If we have revs_mongo, that mean we will look for the editor ops whose revs is after the revs specified in revs_mongo
-        if revs_mongo is not None and len(revs_mongo) != 0:
-            list_or = []
-            for pad_name in revs_mongo:
-                # Fetching only the new operations. (Whose revs is after revs_mongo[pad_name])
-                list_or.append({'d': pad_name, 'v': {'$gt': revs_mongo[pad_name]}})
-            if regex:
-                # If a regex is specified, keep listening also for new pads that are not in revs_mongo but match the regex
-                list_or.append({'$and': [
-                    {'d': {'$regex': regex}},
-                    {'d': {'$not': {'$in': list(revs_mongo.keys())}}}]})
-            query = {'$or': list_or}
+        if reader is None:
+            # Connect to the DB only for this call
+            mongo_reader = MongoOpsReader()
         else:
-            if regex:
-                # Fetch all the documents that match the regex
-                query = {'d': {'$regex': regex}}
-            else:
-                # Fetch everything
-                query = {}
+            mongo_reader = reader
+        if revs_mongo is None:
             revs_mongo = dict()
+        filter_conditions = mongo_filter_conditions(pad_filter, timestamp_range)
+        ops = None
+        if mongo_reader.change_stream is not None:
+            # The ops are pushed to us by the change stream as they are inserted
+            ops = mongo_reader.watch_new_ops()
+        if ops is None:
+            if mongo_reader.use_change_stream:
+                # Subscribe before fetching the ops already in the DB so that we don't miss any op in between
+                mongo_reader.open_change_stream()
+            if mongo_reader.cursor_field is not None:
+                # We fetch all the new ops with a single range scan
+                ops = mongo_reader.find_new_ops()
+            else:
+                # If we have revs_mongo, that mean we will look for the editor ops whose revs is after the revs specified in revs_mongo
+                if len(revs_mongo) != 0:
+                    list_or = []
+                    for pad_name in revs_mongo:
+                        # Fetching only the new operations. (Whose revs is after revs_mongo[pad_name])
+                        list_or.append({'d': pad_name, 'v': {'$gt': revs_mongo[pad_name]}})
+                    if regex:
+                        # If a regex is specified, keep listening also for new pads that are not in revs_mongo but match the regex
+                        list_or.append({'$and': [
+                            {'d': {'$regex': regex}},
+                            {'d': {'$not': {'$in': list(revs_mongo.keys())}}}]})
+                    query = {'$or': list_or}
+                elif regex:
+                    # Fetch all the documents that match the regex
+                    query = {'d': {'$regex': regex}}
+                else:
+                    # Fetch everything
+                    query = {}
+                if filter_conditions:
+                    # Only fetch the pads and the time window we are asked for
+                    query = {'$and': [query] + filter_conditions}
+                ops = mongo_reader.find(query)
+        if mongo_reader.cursor_field is not None or mongo_reader.change_stream is not None:
+            # We route the ops to the pads we follow here, the same way the queries above do
+            regex_compiled = re.compile(regex) if regex else None
+            follow_all_pads = len(revs_mongo) == 0 and regex_compiled is None
+            ops = [item for item in ops
+                   if (item['d'] in revs_mongo and item['v'] > revs_mongo[item['d']])
+                   or (item['d'] not in revs_mongo
+                       and (follow_all_pads or (regex_compiled is not None and regex_compiled.search(item['d']))))]
+            if filter_conditions:
+                ops = [item for item in ops
+                       if match_pad_filter(item['d'], pad_filter)
+                       and ('create' in item or in_timestamp_range(item['m']['ts'], timestamp_range))]
 
-        print(query)
         # For each operation we find, we parse it and create the ElementaryOperation
-        o_docs_find = o_docs.find(query)
-        for item in o_docs_find:
-            print(item)
+        for item in ops:
+            logger.debug("Mongo op: %s", item)
             # Parsing
             if 'create' not in item.keys():
-                pad_name = item['d']
+                pad_name = sys.intern(item['d'])
                 timestamp = item['m']['ts']
                 op = item['op']
                 revs = item['v']
-                author_name = item['src']
+                author_name = sys.intern(item['src'])
                 elem_ops = parse_op_collab_react(op, editor)
                 for elem_op in elem_ops:
                     elem_op.author = author_name
@@ -332,73 +1707,358 @@ def get_elem_ops_per_pad_from_db(path_to_db=None, editor=None, index_from_lines=
                     else:
                         list_of_elem_ops_per_pad[pad_name].append(elem_op)
 
-        client.close()
+        if reader is None:
+            mongo_reader.close()
         # Shouldn't be necessary
         for pad_name in list_of_elem_ops_per_pad:
             list_of_elem_ops_per_pad[pad_name] = sorted(list_of_elem_ops_per_pad[pad_name], key=(lambda x: x.timestamp))
             revs_mongo[pad_name] = max(map((lambda x: x.revs), list_of_elem_ops_per_pad[pad_name]))
 
-        # TODO remove Assertions for release
-        for pad_name in list_of_elem_ops_per_pad:
-            assert list_of_elem_ops_per_pad[pad_name] == sorted(list_of_elem_ops_per_pad[pad_name],
-                                                                key=(lambda x: x.timestamp))
-
         return list_of_elem_ops_per_pad, revs_mongo
     elif editor == 'stian_logs':
-        sorted_lines = []
-        with open(path_to_db, encoding="utf8") as f:
-            lines = csv.DictReader(f)
-            # We need them sorted
-            for i, line_dict in enumerate(lines):
-                # We look at relevant log lines
-                if 'pad:' in line_dict['key']:
-                    line_dict['value'] = line_dict['value'].replace("false", "False").replace("null", "None")
-                    if 'revs' in line_dict['key']:
-                        val_dict = ast.literal_eval(line_dict['value'])
-                        timestamp = val_dict['meta']['timestamp']
-                        sorted_lines.append((int(timestamp), line_dict))
-            sorted_lines = sorted(sorted_lines, key=lambda tup: tup[0])
-
-            # Sometimes, we will get multiple elem_ops when we parse the changeset. We need to give them different
-            # timestamps. So we add an offset to the timestamp of each elem_op to differentiate them. We keep track
-            # of this offset to apply it to the following ops
-            timestamp_offset = 0
-            list_of_elem_ops_per_pad = dict()
-
-            for timestamp, line_dict in sorted_lines[index_from_lines:]:
-                # TODO check if we can do just eval ()
-                val_dict = ast.literal_eval(line_dict['value'])
-                pad_name_idx = line_dict['key'].find("pad:") + len("pad:")
-                pad_name_end_idx = line_dict['key'].find(':revs:', pad_name_idx)
-                pad_name = line_dict['key'][pad_name_idx:pad_name_end_idx]
-                revs = int(line_dict['key'][pad_name_end_idx + len('revs:') + 1:])
-
-                changeset = val_dict['changeset']
-
-                author_name = val_dict['meta']['author']
-                if not (pad_name in list_of_elem_ops_per_pad.keys()):
-                    list_of_elem_ops_per_pad[pad_name] = []
+        list_of_elem_ops_per_pad, index_from_lines = get_elem_ops_per_pad_from_stian_logs(path_to_db,
+                                                                                          index_from_lines,
+                                                                                          jobs=jobs,
+                                                                                          pad_filter=pad_filter,
+                                                                                          timestamp_range=timestamp_range)
+    else:
+        raise ValueError("Undefined editor")
+
+    return list_of_elem_ops_per_pad, index_from_lines
 
-                elem_ops = parse_changeset_etherpad(changeset)
-                for i, elem_op in enumerate(elem_ops):
-                    if author_name == '':
-                        # if it's the line generated automatically by etherpad
-                        elem_op.author = 'Etherpad_admin'
-                    else:
-                        elem_op.author = author_name
-                    elem_op.timestamp = timestamp + timestamp_offset
-                    timestamp_offset += 1
-                    elem_op.revs = revs
-                    elem_op.pad_name = pad_name
 
-                    list_of_elem_ops_per_pad[pad_name].append(elem_op)
-            index_from_lines = len(sorted_lines)
+def get_elem_op_store_from_db(path_to_db, editor, index_from_lines=0, store=None, reader=None, jobs=1,
+                              memory_budget=None, pad_filter=None, timestamp_range=None):
+    """
+    Same as get_elem_ops_per_pad_from_db for the logs stored in files, but the elementary operations are appended to a
+    columnar store instead of being created as ElementaryOperation objects. Used for the batch analysis of big corpora.
+
+    :param path_to_db: path to the logs
+    :type path_to_db: str
+    :param editor: type of logs: etherpad, etherpadSQLite3 or stian_logs
+    :type editor: str
+    :param index_from_lines: for etherpad, number of lines of dirty.db already treated. For etherpadSQLite3, rowid of
+        the last entry already treated. For stian_logs, number of revisions already treated, in the order of their
+        timestamps.
+    :type index_from_lines: int
+    :param store: store to which we append the elementary operations. A new one is created if None.
+    :type store: ElemOpStore
+    :param reader: for etherpad and etherpadSQLite3, reader keeping track of what has already been read in the
+        database. If specified, only the records added since the last call are parsed (index_from_lines is ignored).
+    :type reader: DirtyDbReader|SQLiteStoreReader
+    :param jobs: for stian_logs and etherpad, number of worker processes used to decode the file (see
+        get_elem_ops_per_pad_from_db)
+    :type jobs: int
+    :param memory_budget: for stian_logs, approximate number of bytes of revisions we keep in memory before spilling
+        them to disk
+    :type memory_budget: int
+    :param pad_filter: only parse the pads kept by this filter (see get_elem_ops_per_pad_from_db)
+    :type pad_filter: str|collections.Iterable[str]|typing.Pattern|None
+    :param timestamp_range: only parse the revisions in this time window (see get_elem_ops_per_pad_from_db)
+    :type timestamp_range: (int,int)|None
+    :return: the store and the index from which the next call should start (number of lines read for etherpad)
+    :rtype: (ElemOpStore,int)
+    """
+    if store is None:
+        store = ElemOpStore(editor)
+    pad_filter = normalize_pad_filter(pad_filter)
+    if editor == 'etherpad':
+        if jobs > 1 and (reader is not None or index_from_lines == 0):
+            if reader is None:
+                reader = DirtyDbReader(path_to_db)
+            scan_dirty_db_parallel(store, reader, jobs, pad_filter, timestamp_range)
+        else:
+            if reader is None:
+                reader = DirtyDbReader(path_to_db)
+                revisions = reader.iter_new_revisions(pad_filter, timestamp_range, skip_lines=index_from_lines)
+            else:
+                revisions = reader.iter_new_revisions(pad_filter, timestamp_range)
+            timestamp_offset = reader.timestamp_offset
+            for revision in revisions:
+                timestamp_offset = store_revision_etherpad(store, revision, timestamp_offset)
+            reader.timestamp_offset = timestamp_offset
+        # The last write of a revision wins
+        store = replace_changed_pads_etherpad(store, reader, pad_filter, timestamp_range)
+        index_from_lines = reader.lines_read
+    elif editor == 'etherpadSQLite3':
+        if reader is None:
+            reader = SQLiteStoreReader(path_to_db, last_rowid=index_from_lines, pad_filter=pad_filter)
+        timestamp_offset = reader.timestamp_offset
+        for key, value in reader.iter_new_entries():
+            revision = decode_revision_record(key, value, pad_filter, timestamp_range)
+            if revision is not None:
+                timestamp_offset = store_revision_etherpad(store, revision, timestamp_offset)
+        reader.timestamp_offset = timestamp_offset
+        index_from_lines = reader.last_rowid
+    elif editor == 'stian_logs':
+        if memory_budget is None:
+            memory_budget = config.parser_memory_budget
+        pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+        imap = pool.imap if pool is not None else map
+        with tempfile.TemporaryFile() as spill_file:
+            try:
+                buffered_revisions, spilled_runs, timestamp_offsets, index_from_lines = sort_revisions_stian_logs(
+                    path_to_db, index_from_lines, imap, 10000, memory_budget, spill_file, pad_filter, timestamp_range)
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+            for pad_name, revisions in iter_sorted_revisions_stian_logs(buffered_revisions, spilled_runs, spill_file,
+                                                                        timestamp_offsets):
+                # The timestamps of the revisions already include their offset, see sort_revisions_stian_logs
+                for timestamp, _, revs, changeset, author_name in revisions:
+                    store_revision_etherpad(store, (pad_name, revs, changeset, author_name, timestamp), 0)
+    else:
+        raise ValueError("Undefined editor or editor not stored in files: " + str(editor))
+    return store, index_from_lines
+
+
+def get_pad_names_from_db(path_to_db=None, editor=None):
+    """
+    List the pads of a database, in the order of their first revision in the database. Only the keys of the records
+    are looked at (the ops for mongo), nothing is decoded, so it is much cheaper than parsing the database.
+
+    :param path_to_db: path to the db file containing the operations
+    :type path_to_db: str
+    :param editor: 'etherpad' or 'etherpadSQLite3' or 'collab-react-components' or 'FROG' or 'stian_logs'
+    :type editor: str
+    :return: the names of the pads
+    :rtype: list[str]
+    """
+    pad_names = dict()
+    if editor == 'etherpad':
+        for line in DirtyDbReader(path_to_db).iter_new_lines():
+            key_and_value = split_dirty_db_line(line)
+            if key_and_value is not None:
+                pad_name_and_revs = parse_revs_key(key_and_value[0])
+                if pad_name_and_revs is not None:
+                    pad_names[pad_name_and_revs[0]] = True
+    elif editor == 'etherpadSQLite3':
+        conn = sqlite3.connect(path_to_db)
+        try:
+            for key, in conn.execute("SELECT key FROM store WHERE key LIKE 'pad:%:revs:%' ORDER BY rowid;"):
+                pad_name_and_revs = parse_revs_key(key)
+                if pad_name_and_revs is not None:
+                    pad_names[pad_name_and_revs[0]] = True
+        finally:
+            conn.close()
+    elif editor == 'stian_logs':
+        with open(path_to_db, encoding="utf8", newline='') as f:
+            rows = csv.reader(f)
+            key_idx = next(rows).index('key')
+            for row in rows:
+                pad_name_and_revs = parse_revs_key(row[key_idx])
+                if pad_name_and_revs is not None:
+                    pad_names[pad_name_and_revs[0]] = True
+    elif editor == 'collab-react-components' or editor == 'FROG':
+        mongo_reader = MongoOpsReader()
+        try:
+            for item in mongo_reader.collection.find({}, {'_id': False, 'd': True}, batch_size=mongo_reader.batch_size):
+                pad_names[item['d']] = True
+        finally:
+            mongo_reader.close()
     else:
         raise ValueError("Undefined editor")
+    return list(pad_names)
 
-    # TODO remove Assertions for release
-    for pad_name in list_of_elem_ops_per_pad:
-        assert list_of_elem_ops_per_pad[pad_name] == sorted(list_of_elem_ops_per_pad[pad_name],
-                                                            key=(lambda x: x.timestamp))
 
-    return list_of_elem_ops_per_pad, index_from_lines
+def get_elem_op_store_cached(path_to_db, editor, cache_location, jobs=1):
+    """
+    Get the store of the elementary operations of a file of logs, using a cache. The parsed elementary operations are
+    saved in a binary file of cache_location along with the size and the modification time of the logs, the version of
+    the parser and the state of the reader. If the logs have not changed since, the store is loaded from the cache
+    without parsing anything. If records have been appended to dirty.db or to the SQLite store, only the new records
+    are parsed. Otherwise (e.g. Stian's logs have changed, the file has been rewritten, or the parser has changed)
+    everything is parsed again.
+
+    :param path_to_db: path to the logs
+    :type path_to_db: str
+    :param editor: type of logs: etherpad, etherpadSQLite3 or stian_logs
+    :type editor: str
+    :param cache_location: directory of the cache files
+    :type cache_location: str
+    :param jobs: for stian_logs and etherpad, number of worker processes used to decode the file
+    :type jobs: int
+    :return: the store and the index from which a next call to get_elem_ops_per_pad_from_db should start
+    :rtype: (ElemOpStore,int)
+    """
+    path_to_db = os.path.abspath(path_to_db)
+    stat = os.stat(path_to_db)
+    os.makedirs(cache_location, exist_ok=True)
+    cache_key = hashlib.sha1((editor + ':' + path_to_db).encode('utf8')).hexdigest()
+    cache_file = os.path.join(cache_location, cache_key + '.npz')
+
+    store = None
+    reader = None
+    try:
+        store, meta = ElemOpStore.load(cache_file)
+    except (OSError, ValueError, KeyError):
+        # No cache yet (or not readable)
+        meta = None
+    if meta is not None and (meta['parser_version'] != PARSER_VERSION or meta['path'] != path_to_db
+                             or meta['editor'] != editor):
+        meta = None
+    if meta is not None:
+        if meta['size'] == stat.st_size and meta['mtime'] == stat.st_mtime_ns:
+            logger.info("Elementary operations of %s loaded from the cache", path_to_db)
+            return store, meta['index_from_lines']
+        # Only the new records are parsed if the logs have only been appended
+        if editor == 'etherpad':
+            reader = DirtyDbReader.from_state(path_to_db, meta['reader'])
+        elif editor == 'etherpadSQLite3':
+            reader = SQLiteStoreReader.from_state(path_to_db, meta['reader'])
+        if reader is not None and reader.has_changed():
+            reader = None
+    if reader is not None:
+        logger.info("Parsing the records appended to %s since it has been cached", path_to_db)
+    else:
+        # Everything is parsed again
+        store = None
+        if editor == 'etherpad':
+            reader = DirtyDbReader(path_to_db)
+        elif editor == 'etherpadSQLite3':
+            reader = SQLiteStoreReader(path_to_db)
+
+    store, index_from_lines = get_elem_op_store_from_db(path_to_db, editor, store=store, reader=reader, jobs=jobs)
+
+    meta = {'path': path_to_db,
+            'editor': editor,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'parser_version': PARSER_VERSION,
+            'index_from_lines': index_from_lines,
+            'reader': reader.get_state() if reader is not None else None}
+    # Write the new cache file next to the old one and replace it at once, so that it is never left half written
+    with tempfile.NamedTemporaryFile(dir=cache_location, suffix='.npz', delete=False) as f:
+        store.save(f, meta)
+    os.replace(f.name, cache_file)
+    return store, index_from_lines
+
+
+def list_corpus_files(path_or_glob, editor):
+    """
+    List the files of logs of a corpus: all the files of a directory tree with the extension of the logs of the editor,
+    or all the files matching a glob pattern (** matches any number of subdirectories).
+
+    :param path_or_glob: directory containing the logs or glob pattern
+    :type path_or_glob: str
+    :param editor: type of logs: etherpad, etherpadSQLite3 or stian_logs
+    :type editor: str
+    :return: the paths of the files, sorted
+    :rtype: list[str]
+    """
+    if not os.path.isdir(path_or_glob):
+        return sorted(path for path in glob.glob(path_or_glob, recursive=True) if os.path.isfile(path))
+    extension = '.csv' if editor == 'stian_logs' else '.db'
+    paths = []
+    for dirpath, _, filenames in os.walk(path_or_glob):
+        paths.extend(os.path.join(dirpath, filename) for filename in filenames if filename.endswith(extension))
+    return sorted(paths)
+
+
+def _parse_corpus_file(path_to_db, editor, cache_location, pad_filter, timestamp_range):
+    """
+    Parse one file of a corpus in a worker process (see get_elem_op_store_from_corpus)
+
+    :return: the path of the file and the store of its elementary operations
+    :rtype: (str,ElemOpStore)
+    """
+    if cache_location is not None and pad_filter is None and timestamp_range is None:
+        store, _ = get_elem_op_store_cached(path_to_db, editor, cache_location)
+    else:
+        store, _ = get_elem_op_store_from_db(path_to_db, editor, pad_filter=pad_filter,
+                                             timestamp_range=timestamp_range)
+    return path_to_db, store
+
+
+def get_elem_op_store_from_corpus(path_or_glob, editor='etherpadSQLite3', pad_naming=None, jobs=1, cache_location=None,
+                                  pad_filter=None, timestamp_range=None, progress=None):
+    """
+    Parse all the files of logs of a corpus (e.g. one SQLite store per session of an experiment) and merge their
+    elementary operations in a single store. The files are parsed in worker processes, each worker sends back the
+    columnar store of its file (much smaller than the ElementaryOperation objects) and the stores are merged in the
+    order of the files as soon as they come back. At most two files per worker are parsed or waiting to be merged at
+    any time, so the memory used does not depend on the number of files.
+
+    :param path_or_glob: directory containing the logs or glob pattern (see list_corpus_files)
+    :type path_or_glob: str
+    :param editor: type of logs: etherpad, etherpadSQLite3 or stian_logs
+    :type editor: str
+    :param pad_naming: function giving the name of a pad in the merged store from the path of its file and its name in
+        the file. By default the name is the path of the file relative to the corpus directory (without extension)
+        followed by the name of the pad.
+    :type pad_naming: (str,str)->str
+    :param jobs: number of worker processes
+    :type jobs: int
+    :param cache_location: directory where the elementary operations of each file are cached (see
+        get_elem_op_store_cached). Not used when a filter is given.
+    :type cache_location: str
+    :param pad_filter: only parse the pads kept by this filter, applied to the names of the pads in their file (see
+        get_elem_ops_per_pad_from_db)
+    :type pad_filter: str|collections.Iterable[str]|typing.Pattern|None
+    :param timestamp_range: only parse the revisions in this time window (see get_elem_ops_per_pad_from_db)
+    :type timestamp_range: (int,int)|None
+    :param progress: function called after each file is merged with the number of files merged and the total number
+        of files
+    :type progress: (int,int)->None
+    :return: the store of the elementary operations of all the files
+    :rtype: ElemOpStore
+    """
+    paths = list_corpus_files(path_or_glob, editor)
+    if pad_naming is None:
+        root = path_or_glob if os.path.isdir(path_or_glob) else os.path.dirname(path_or_glob.split('*')[0])
+
+        def pad_naming(path, pad_name):
+            return os.path.splitext(os.path.relpath(path, root))[0] + '/' + pad_name
+    pad_filter = normalize_pad_filter(pad_filter)
+    parse_file = functools.partial(_parse_corpus_file, editor=editor, cache_location=cache_location,
+                                   pad_filter=pad_filter, timestamp_range=timestamp_range)
+
+    corpus_store = ElemOpStore(editor)
+    # File from which each pad name of the merged store comes, two files must not give the same name to their pads
+    pad_files = dict()
+    files_merged = 0
+
+    def merge(path_to_db, store):
+        nonlocal files_merged
+        pad_names = dict()
+        for pad_name in store.pads:
+            new_pad_name = pad_naming(path_to_db, pad_name)
+            if pad_files.setdefault(new_pad_name, path_to_db) != path_to_db:
+                raise ValueError("The pads of {} and {} are both named {}".format(pad_files[new_pad_name], path_to_db,
+                                                                                  new_pad_name))
+            pad_names[pad_name] = new_pad_name
+        corpus_store.extend(store, pad_names)
+        files_merged += 1
+        logger.info("Parsed %s (%d/%d files)", path_to_db, files_merged, len(paths))
+        if progress is not None:
+            progress(files_merged, len(paths))
+
+    if jobs > 1 and len(paths) > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            # Sliding window of files being parsed, merged in order when the oldest one is done
+            pending = collections.deque()
+            for path_to_db in paths:
+                if len(pending) >= 2 * jobs:
+                    merge(*pending.popleft().get())
+                pending.append(pool.apply_async(parse_file, (path_to_db,)))
+            while pending:
+                merge(*pending.popleft().get())
+    else:
+        for path_to_db in paths:
+            merge(*parse_file(path_to_db))
+    return corpus_store
+
+
+def get_elem_ops_per_pad_from_corpus(path_or_glob, editor='etherpadSQLite3', pad_naming=None, jobs=1,
+                                     cache_location=None, pad_filter=None, timestamp_range=None, progress=None):
+    """
+    Same as get_elem_op_store_from_corpus but the elementary operations are returned as ElementaryOperation objects,
+    sorted by timestamp in each pad, in the format returned by get_elem_ops_per_pad_from_db
+
+    :return: dictionary of elementary operation per pad
+    :rtype: dict[str,list[ElementaryOperation]]
+    """
+    store = get_elem_op_store_from_corpus(path_or_glob, editor, pad_naming, jobs, cache_location, pad_filter,
+                                          timestamp_range, progress)
+    return store.get_elem_ops_per_pad()
@@ -0,0 +1,207 @@
+import functools
+import multiprocessing
+
+import config
+from analytics import operation_builder
+from analytics.Operations import ElementaryOperation
+from analytics.Pad import Pad
+
+# Keys of the texts in the results of run_pipeline
+TEXT_KEYS = ('text', 'text_colored_by_authors', 'text_colored_by_ops')
+# Key of the grouping of the elementary operations in the results of run_sweep
+OPERATIONS_KEY = 'operation_indices'
+
+
+def get_metrics(pad):
+    """
+    Compute the metrics of a pad whose paragraphs, operation types and operation contexts have been built
+
+    :param pad: the pad
+    :type pad: Pad
+    :return: the value of each metric
+    :rtype: dict[str,object]
+    """
+    metrics = dict()
+    metrics['User proportion per paragraph score'] = pad.user_participation_paragraph_score()
+    metrics['Proportion score'] = pad.prop_score()
+    metrics['Synchronous score'] = pad.sync_score()[0]
+    metrics['Alternating score'] = pad.alternating_score()
+    metrics['Break score day'] = pad.break_score('day')
+    metrics['Break score short'] = pad.break_score('short')
+    metrics['Overall write type score'] = pad.type_overall_score('write')
+    metrics['Overall paste type score'] = pad.type_overall_score('paste')
+    metrics['Overall delete type score'] = pad.type_overall_score('delete')
+    metrics['Overall edit type score'] = pad.type_overall_score('edit')
+    metrics['User write score'] = pad.user_type_score('write')
+    metrics['User paste score'] = pad.user_type_score('paste')
+    metrics['User delete score'] = pad.user_type_score('delete')
+    metrics['User edit score'] = pad.user_type_score('edit')
+    return metrics
+
+
+def get_texts(pad):
+    """
+    Get the text of a pad, colored by authors and by operations
+
+    :param pad: the pad
+    :type pad: Pad
+    :return: the text, the text colored by authors and the text colored by operations
+    :rtype: dict[str,str]
+    """
+    return {'text': pad.get_text(),
+            'text_colored_by_authors': pad.display_text_colored_by_authors(),
+            'text_colored_by_ops': pad.display_text_colored_by_ops()}
+
+
+def build_pad(pad_name, elem_ops):
+    """
+    Build a pad from its elementary operations: create its operations and its paragraphs, classify its operations and
+    find their context.
+
+    :param pad_name: name of the pad
+    :type pad_name: str
+    :param elem_ops: elementary operations of the pad sorted by timestamp
+    :type elem_ops: list[ElementaryOperation]
+    :return: the pad
+    :rtype: Pad
+    """
+    # All the elementary operations are known, they are grouped at once
+    pads, elem_ops_treated = operation_builder.build_operations_from_elem_ops_batch({pad_name: elem_ops},
+                                                                                    config.maximum_time_between_elem_ops)
+    pad = pads[pad_name]
+    # create the paragraphs, in an order that doesn't depend on the operations (see analyse_pad_for_thresholds)
+    pad.create_paragraphs_from_ops(ElementaryOperation.sort_elem_ops(elem_ops_treated[pad_name]))
+    # classify the operations of the pad
+    pad.classify_operations(length_edit=config.length_edit, length_delete=config.length_delete)
+    # find the context of the operation of the pad
+    pad.build_operation_context(config.delay_sync, config.time_to_reset_day, config.time_to_reset_break)
+    return pad
+
+
+def analyse_pad(pad_name_and_elem_ops, texts=False, pad_callback=None):
+    """
+    Build a pad and compute its metrics (see run_pipeline)
+
+    :param pad_name_and_elem_ops: name of the pad and its elementary operations sorted by timestamp
+    :type pad_name_and_elem_ops: (str,list[ElementaryOperation])
+    :param texts: also get the texts of the pad (see get_texts)
+    :type texts: bool
+    :param pad_callback: function called with the pad once it is built
+    :type pad_callback: (Pad)->None
+    :return: the name of the pad and its results
+    :rtype: (str,dict[str,object])
+    """
+    pad_name, elem_ops = pad_name_and_elem_ops
+    pad = build_pad(pad_name, elem_ops)
+    result = get_metrics(pad)
+    if texts:
+        result.update(get_texts(pad))
+    if pad_callback is not None:
+        pad_callback(pad)
+    return pad_name, result
+
+
+def analyse_pad_for_thresholds(pad_name_and_elem_ops, maximum_times):
+    """
+    Compute the metrics of a pad for several maximum_time_between_elem_ops (see run_sweep). The elementary operations
+    are grouped for all the maximum times at once and the paragraphs, which don't depend on the operations, are only
+    built for the first one. The other maximum times reuse them (see Pad.reuse_paragraphs).
+
+    :param pad_name_and_elem_ops: name of the pad and its elementary operations sorted by timestamp
+    :type pad_name_and_elem_ops: (str,list[ElementaryOperation])
+    :param maximum_times: the values of maximum_time_between_elem_ops
+    :type maximum_times: list[int]
+    :return: the name of the pad and its results for each maximum time
+    :rtype: (str,dict[int,dict[str,object]])
+    """
+    pad_name, elem_ops = pad_name_and_elem_ops
+    elem_ops_treated, operation_indices, operation_positions = operation_builder.group_elem_ops_for_thresholds(
+        elem_ops, maximum_times)
+    paragraphs = None
+    results = dict()
+    for maximum_time in maximum_times:
+        pad = Pad(pad_name)
+        pad.add_operations(operation_builder.create_operations(elem_ops_treated, operation_indices[maximum_time],
+                                                               operation_positions[maximum_time]))
+        pad.apply_elem_ops(elem_ops_treated)
+        if paragraphs is None:
+            pad.create_paragraphs_from_ops(ElementaryOperation.sort_elem_ops(elem_ops_treated))
+            paragraphs = pad.paragraphs
+        else:
+            pad.reuse_paragraphs(paragraphs)
+        pad.classify_operations(length_edit=config.length_edit, length_delete=config.length_delete)
+        pad.build_operation_context(config.delay_sync, config.time_to_reset_day, config.time_to_reset_break)
+        results[maximum_time] = get_metrics(pad)
+        results[maximum_time][OPERATIONS_KEY] = operation_indices[maximum_time]
+    return pad_name, results
+
+
+def _map_pads(analyse, list_of_elem_ops_per_pad, jobs):
+    """
+    Apply analyse to each pad, in jobs worker processes
+
+    :param analyse: function taking the name of a pad and its elementary operations and returning the name of the pad
+        and its results. It must be defined at the top level of a module so that it can be sent to the workers.
+    :type analyse: ((str,list[ElementaryOperation]))->(str,object)
+    :param list_of_elem_ops_per_pad: elementary operations of each pad sorted by timestamp
+    :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
+    :param jobs: number of worker processes
+    :type jobs: int
+    :return: the results of each pad, in the order of list_of_elem_ops_per_pad
+    :rtype: dict[str,object]
+    """
+    if jobs <= 1 or len(list_of_elem_ops_per_pad) <= 1:
+        return dict(map(analyse, list_of_elem_ops_per_pad.items()))
+    # The biggest pads are sent first so that a big pad does not end up alone at the end
+    items = sorted(list_of_elem_ops_per_pad.items(), key=lambda item: len(item[1]), reverse=True)
+    with multiprocessing.Pool(jobs) as pool:
+        results = dict(pool.imap_unordered(analyse, items))
+    return {pad_name: results[pad_name] for pad_name in list_of_elem_ops_per_pad}
+
+
+def run_pipeline(list_of_elem_ops_per_pad, jobs=1, texts=False, pad_callback=None):
+    """
+    Run the analytics on each pad: build its operations and its paragraphs, classify its operations, find their
+    context and compute its metrics. The pads are independent, so they are shared between jobs worker processes. Only
+    the results are sent back from the workers, not the pads.
+
+    :param list_of_elem_ops_per_pad: elementary operations of each pad sorted by timestamp (see
+        operation_builder.sort_elem_ops_per_pad)
+    :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
+    :param jobs: number of worker processes
+    :type jobs: int
+    :param texts: also get the texts of each pad (see get_texts)
+    :type texts: bool
+    :param pad_callback: function called in the worker with each pad once it is built (e.g. to save its
+        visualizations). It must be defined at the top level of a module so that it can be sent to the workers.
+    :type pad_callback: (Pad)->None
+    :return: the metrics (and the texts) of each pad, in the order of list_of_elem_ops_per_pad
+    :rtype: dict[str,dict[str,object]]
+    """
+    analyse = functools.partial(analyse_pad, texts=texts, pad_callback=pad_callback)
+    return _map_pads(analyse, list_of_elem_ops_per_pad, jobs)
+
+
+def run_sweep(list_of_elem_ops_per_pad, maximum_times, jobs=1):
+    """
+    Run the analytics on each pad for several values of maximum_time_between_elem_ops, e.g. to tune it. The
+    elementary operations are parsed, sorted and split only once and the paragraphs are only built once per pad, so a
+    sweep costs much less than a run of the pipeline per value.
+
+    :param list_of_elem_ops_per_pad: elementary operations of each pad sorted by timestamp (see
+        operation_builder.sort_elem_ops_per_pad)
+    :type list_of_elem_ops_per_pad: dict[str,list[ElementaryOperation]]
+    :param maximum_times: the values of maximum_time_between_elem_ops
+    :type maximum_times: list[int]
+    :param jobs: number of worker processes
+    :type jobs: int
+    :return: for each maximum time, the metrics of each pad and the grouping of its elementary operations (under
+        OPERATIONS_KEY, the index of the operation of each elementary operation once split, see
+        operation_builder.group_elem_ops)
+    :rtype: dict[int,dict[str,dict[str,object]]]
+    """
+    maximum_times = list(maximum_times)
+    analyse = functools.partial(analyse_pad_for_thresholds, maximum_times=maximum_times)
+    results = _map_pads(analyse, list_of_elem_ops_per_pad, jobs)
+    return {maximum_time: {pad_name: results[pad_name][maximum_time] for pad_name in results}
+            for maximum_time in maximum_times}
@@ -7,6 +7,13 @@ time_to_reset_break = 600000  # time to reset first op after a break (10min)
 length_edit = 15  # Threshold in length to differentiate a Write type from an Edit or an edit from a Deletion.
 length_delete = 15  # Threshold in length to consider the op as a deletion
 figs_save_location = './figures'
+# Where the parsed elementary operations are cached between two runs (None to disable the cache)
+parser_cache_location = './parser_cache'
+# Approximate number of bytes of revisions kept in memory when parsing big logs before spilling them to disk
+parser_memory_budget = 512 * 1024 * 1024
+# Keep the original changeset (or OT op) in each ElementaryOperation. Only useful to debug the parser, it costs a lot of
+# memory on big logs
+keep_changesets = False
 
 # Mongo configuration
 # mongodb_port = None
@@ -15,6 +22,15 @@ figs_save_location = './figures'
 mongodb_port = 30000
 mongodb_database_name = 'sharedb'
 mongodb_collection_name = 'o_rz'
+# Number of ops fetched at once from mongo
+mongodb_batch_size = 1000
+# Field of the ops used as a cursor to fetch all the new ops with a single range scan ('_id' or 'm.ts'). None to
+# query each pad after the last version read. The ops inserted concurrently can be committed out of the order of the
+# cursor, an op committed behind the cursor is then never read: only use a cursor if the ops are inserted one at a time
+mongodb_cursor_field = None
+# Whether to get the new ops from the change stream of the collection instead of polling it (needs mongod to run as a
+# replica set, a single node one is enough). We fall back to polling if it is not available
+mongodb_use_change_stream = False
 
 # To which url should the program send its metrics updates
 update_post_url = 'http://35.229.83.91:5000/'
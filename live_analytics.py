@@ -1,30 +1,48 @@
 import config
 from analytics import operation_builder
 from analytics import parser
+from analytics import pipeline
 import time
 
-index_from = 0
-dic_author_current_operations_per_pad = dict()
+# Keeps track of the byte offset up to which dirty.db has been read so that we only read the new lines. dirty.db may
+# not exist yet, it is then polled until Etherpad creates it
+dirty_db_reader = parser.DirtyDbReader(config.path_to_db, missing_ok=True)
+# Connection to mongo kept open between the polls
+mongo_reader = None
+if config.editor != 'etherpad':
+    mongo_reader = parser.MongoOpsReader(cursor_field=config.mongodb_cursor_field,
+                                         use_change_stream=config.mongodb_use_change_stream)
+    mongo_reader.index_recommendation()
+builders_per_pad = dict()
 pads = dict()
 revs_mongo = None
 while True:
     if config.editor == 'etherpad':
-        new_list_of_elem_ops_per_pad, index_from = parser.get_elem_ops_per_pad_from_db(config.path_to_db,
-                                                                                       'etherpad',
-                                                                                       index_from_lines=index_from)
+        new_list_of_elem_ops_per_pad, _ = parser.get_elem_ops_per_pad_from_db(config.path_to_db,
+                                                                              'etherpad',
+                                                                              reader=dirty_db_reader)
+        if dirty_db_reader.rewound:
+            # The file has been truncated or replaced, we start again from scratch
+            builders_per_pad = dict()
+            pads = dict()
+        for pad_name in dirty_db_reader.changed_pads:
+            # The revisions of the pad have been rewritten or deleted, it is built again from its current revisions
+            builders_per_pad.pop(pad_name, None)
+            pads.pop(pad_name, None)
     else:
         new_list_of_elem_ops_per_pad, revs_mongo = parser.get_elem_ops_per_pad_from_db(None,
                                                                                        editor=config.editor,
                                                                                        revs_mongo=revs_mongo,
-                                                                                       regex='^editor')
+                                                                                       regex='^editor',
+                                                                                       reader=mongo_reader)
 
     if len(new_list_of_elem_ops_per_pad) != 0:
         # sort them by their timestamps, even though they should already be sorted
         new_list_of_elem_ops_per_pad_sorted = operation_builder.sort_elem_ops_per_pad(new_list_of_elem_ops_per_pad)
         # Create the operations from the elementary operations
-        pads, dic_author_current_operations_per_pad, elem_ops_treated = operation_builder.build_operations_from_elem_ops(
+        pads, builders_per_pad, elem_ops_treated = operation_builder.build_operations_from_elem_ops(
             new_list_of_elem_ops_per_pad_sorted, config.maximum_time_between_elem_ops,
-            dic_author_current_operations_per_pad, pads)
+            builders_per_pad, pads)
         # For each pad, create the paragraphs, classify the operations and create the context
         for pad_name in elem_ops_treated:
             pad = pads[pad_name]
@@ -48,20 +66,10 @@ while True:
             print(pad.display_text_colored_by_ops())
 
             print('\nSCORES')
-            print('User proportion per paragraph score', pad.user_participation_paragraph_score())
-            print('Proportion score:', pad.prop_score())
-            print('Synchronous score:', pad.sync_score()[0])
-            print('Alternating score:', pad.alternating_score())
-            print('Break score day:', pad.break_score('day'))
-            print('Break score short:', pad.break_score('short'))
-            print('Overall write type score:', pad.type_overall_score('write'))
-            print('Overall paste type score:', pad.type_overall_score('paste'))
-            print('Overall delete type score:', pad.type_overall_score('delete'))
-            print('Overall edit type score:', pad.type_overall_score('edit'))
-            print('User write score:', pad.user_type_score('write'))
-            print('User paste score:', pad.user_type_score('paste'))
-            print('User delete score:', pad.user_type_score('delete'))
-            print('User edit score:', pad.user_type_score('edit'))
+            for metric_name, value in pipeline.get_metrics(pad).items():
+                print(metric_name + ':', value)
             print('\n\n\n')
 
-    time.sleep(config.server_update_delay)
+    if mongo_reader is None or mongo_reader.change_stream is None:
+        # When we follow the change stream, we already waited for new ops while parsing
+        time.sleep(config.server_update_delay)
@@ -5,7 +5,7 @@ from flask import request as flask_request
 import threading
 from multiprocessing import Queue
 import time
-from analytics import parser, operation_builder
+from analytics import parser, operation_builder, pipeline
 import config
 
 app = Flask(__name__)
@@ -50,21 +50,27 @@ class AnalyticThread(threading.Thread):
             # At first we want the pads from the begining.
             revs_mongo[pad_name] = 0
 
-        dic_author_current_operations_per_pad = dict()
+        builders_per_pad = dict()
         pads = dict()
+        # Keep the connection to mongo open between the polls
+        mongo_reader = parser.MongoOpsReader(cursor_field=config.mongodb_cursor_field,
+                                             use_change_stream=config.mongodb_use_change_stream,
+                                             await_time=self.update_delay)
+        mongo_reader.index_recommendation()
         while analytics_started:
             # Parse the elementary operations from the FROG database
             new_list_of_elem_ops_per_pad, revs_mongo = parser.get_elem_ops_per_pad_from_db(None,
                                                                                            'FROG',
                                                                                            revs_mongo=revs_mongo,
-                                                                                           regex=self.regex)
+                                                                                           regex=self.regex,
+                                                                                           reader=mongo_reader)
             if len(new_list_of_elem_ops_per_pad) != 0:
                 # If we have new ops
                 new_list_of_elem_ops_per_pad_sorted = operation_builder.sort_elem_ops_per_pad(
                     new_list_of_elem_ops_per_pad)
-                pads, dic_author_current_operations_per_pad, elem_ops_treated = operation_builder.build_operations_from_elem_ops(
+                pads, builders_per_pad, elem_ops_treated = operation_builder.build_operations_from_elem_ops(
                     new_list_of_elem_ops_per_pad_sorted, config.maximum_time_between_elem_ops,
-                    dic_author_current_operations_per_pad, pads)
+                    builders_per_pad, pads)
                 # For each pad, create the paragraphs, classify the operations and create the context
                 for pad_name in elem_ops_treated:
                     pad = pads[pad_name]
@@ -79,28 +85,14 @@ class AnalyticThread(threading.Thread):
                 for pad_name in elem_ops_treated:
                     print(pad_name)
                     pad = pads[pad_name]
-                    answer_per_pad = dict()
-                    answer_per_pad['User proportion per paragraph score'] = pad.user_participation_paragraph_score()
-                    answer_per_pad['Proportion score'] = pad.prop_score()
-                    answer_per_pad['Synchronous score'] = pad.sync_score()[0]
-                    answer_per_pad['Alternating score'] = pad.alternating_score()
-                    answer_per_pad['Break score day'] = pad.break_score('day')
-                    answer_per_pad['Break score short'] = pad.break_score('short')
-                    answer_per_pad['Overall write type score'] = pad.type_overall_score('write')
-                    answer_per_pad['Overall paste type score'] = pad.type_overall_score('paste')
-                    answer_per_pad['Overall delete type score'] = pad.type_overall_score('delete')
-                    answer_per_pad['Overall edit type score'] = pad.type_overall_score('edit')
-                    answer_per_pad['User write score'] = pad.user_type_score('write')
-                    answer_per_pad['User paste score'] = pad.user_type_score('paste')
-                    answer_per_pad['User delete score'] = pad.user_type_score('delete')
-                    answer_per_pad['User edit score'] = pad.user_type_score('edit')
+                    answer_per_pad = pipeline.get_metrics(pad)
                     pprint(answer_per_pad)
-                    answer_per_pad['text'] = pad.get_text()
-                    answer_per_pad['text_colored_by_authors'] = pad.display_text_colored_by_authors()
-                    answer_per_pad['text_colored_by_ops'] = pad.display_text_colored_by_ops()
+                    answer_per_pad.update(pipeline.get_texts(pad))
                     print(answer_per_pad['text'])
                     answer[pad_name] = answer_per_pad
-            time.sleep(self.update_delay)
+            if mongo_reader.change_stream is None:
+                # When we follow the change stream, we already waited for new ops while parsing
+                time.sleep(self.update_delay)
             self.queueLock.acquire()
             if self.workQueue.full():
                 queuer = self.workQueue.get()
@@ -110,6 +102,7 @@ class AnalyticThread(threading.Thread):
             else:
                 self.workQueue.put(answer)
             self.queueLock.release()
+        mongo_reader.close()
         print('exiting', self.name)
 
 
@@ -0,0 +1,271 @@
+"""
+Synthetic logs for the tests: revisions of Etherpad pads (written as dirty.db lines or in a SQLite store) and
+keystrokes of several authors typing concurrently in the same pads.
+"""
+import json
+import random
+import sqlite3
+
+from analytics.Operations import ElementaryOperation
+
+_BASE_36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+# Texts inserted in the pads, with the characters that are special in the changesets or in JSON
+_WORDS = ['hello', 'world', 'data $ money', 'a|b', 'x+y=z', '*star*', 'café', '"quoted"', 'back\\slash']
+
+
+def to_base_36(number):
+    """
+    Write a number in base 36, as in the changesets of Etherpad
+
+    :type number: int
+    :rtype: str
+    """
+    digits = ''
+    while True:
+        number, digit = divmod(number, 36)
+        digits = _BASE_36[digit] + digits
+        if number == 0:
+            return digits
+
+
+def _changeset_ops(symbol, text):
+    """
+    Write the ops keeping, deleting or inserting a text: the lines first (with their number) and then the characters
+    after the last new line
+    """
+    ops = ''
+    end_of_lines = text.rfind('\n') + 1
+    if end_of_lines != 0:
+        ops += '|' + to_base_36(text.count('\n')) + symbol + to_base_36(end_of_lines)
+    if len(text) != end_of_lines:
+        ops += symbol + to_base_36(len(text) - end_of_lines)
+    return ops
+
+
+def make_changeset(text, position, length_to_delete, text_to_add):
+    """
+    Write the changeset of Etherpad replacing length_to_delete characters of text at position by text_to_add
+
+    :rtype: str
+    """
+    difference = len(text_to_add) - length_to_delete
+    return 'Z:' + to_base_36(len(text)) \
+        + ('>' + to_base_36(difference) if difference >= 0 else '<' + to_base_36(-difference)) \
+        + _changeset_ops('=', text[:position]) \
+        + _changeset_ops('-', text[position:position + length_to_delete]) \
+        + _changeset_ops('+', text_to_add) + '$' + text_to_add
+
+
+def generate_revisions(number_of_revisions, number_of_pads=3, seed=0):
+    """
+    Generate the revisions of a few pads, edited by several authors (and by Etherpad itself, with an empty author)
+
+    :param number_of_revisions: number of revisions after the first revision of each pad
+    :type number_of_revisions: int
+    :param number_of_pads: number of pads
+    :type number_of_pads: int
+    :param seed: seed of the random generator
+    :type seed: int
+    :return: the revisions (pad name, revision number, changeset, author, timestamp) in the order they were made, and
+        the text of each pad at the end
+    :rtype: (list[(str,int,str,str,int)],dict[str,str])
+    """
+    rnd = random.Random(seed)
+    timestamp = 1500000000000
+    authors = ['a.%d' % i for i in range(3)] + ['']
+    revisions = []
+    texts = dict()
+    number_of_revisions_per_pad = dict()
+    for pad_index in range(number_of_pads):
+        pad_name = 'pad%d' % pad_index
+        texts[pad_name] = '\n'
+        number_of_revisions_per_pad[pad_name] = 1
+        revisions.append((pad_name, 0, 'Z:1>0$', '', timestamp))
+        timestamp += 1
+    for _ in range(number_of_revisions):
+        pad_name = 'pad%d' % rnd.randrange(number_of_pads)
+        text = texts[pad_name]
+        # The last new line of the pad is never edited
+        position = rnd.randrange(len(text))
+        draw = rnd.random()
+        if draw < .6 or position == len(text) - 1:
+            text_to_add = rnd.choice(_WORDS) + rnd.choice(['', ' ', '\n', '\n\n', ' line\nnext'])
+            if rnd.random() < .05:
+                # Paste of several lines
+                text_to_add = '\n'.join(rnd.choice(_WORDS) for _ in range(rnd.randint(3, 10))) + '\n'
+            length_to_delete = 0
+        else:
+            text_to_add = rnd.choice(_WORDS) if draw > .85 else ''
+            length_to_delete = rnd.randint(1, min(15, len(text) - 1 - position))
+        changeset = make_changeset(text, position, length_to_delete, text_to_add)
+        texts[pad_name] = text[:position] + text_to_add + text[position + length_to_delete:]
+        timestamp += rnd.choice([50, 200, 1000, 5000, 30000, 600000, 30000000])
+        revisions.append((pad_name, number_of_revisions_per_pad[pad_name], changeset, rnd.choice(authors), timestamp))
+        number_of_revisions_per_pad[pad_name] += 1
+    return revisions, texts
+
+
+def revision_record(revision):
+    """
+    Get the key and the value of a revision, as Etherpad stores them
+
+    :param revision: pad name, revision number, changeset, author and timestamp
+    :type revision: (str,int,str,str,int)
+    :rtype: (str,dict)
+    """
+    pad_name, revs, changeset, author, timestamp = revision
+    return 'pad:%s:revs:%d' % (pad_name, revs), {'changeset': changeset, 'meta': {'author': author,
+                                                                                 'timestamp': timestamp}}
+
+
+def dirty_db_line(key, value):
+    """
+    Write a line of dirty.db
+
+    :rtype: str
+    """
+    return json.dumps({'key': key, 'val': value}, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def dirty_db_lines(revisions):
+    """
+    Write the lines of dirty.db of the revisions, with the other records Etherpad writes in between
+
+    :param revisions: revisions as returned by generate_revisions
+    :type revisions: list[(str,int,str,str,int)]
+    :rtype: list[str]
+    """
+    lines = []
+    for i, revision in enumerate(revisions):
+        lines.append(dirty_db_line(*revision_record(revision)))
+        if i % 7 == 0:
+            lines.append(dirty_db_line('globalAuthor:a.%d' % (i % 3), {'colorId': 1, 'name': None, 'timestamp': 1}))
+        if i % 11 == 0:
+            lines.append(dirty_db_line('pad:' + revision[0], {'atext': {'text': 'x', 'attribs': ''}, 'head': i}))
+    return lines
+
+
+def write_dirty_db(path, lines, mode='w'):
+    """
+    Write (or append) lines to a dirty.db file
+    """
+    with open(path, mode, encoding='utf-8', newline='') as f:
+        f.writelines(lines)
+
+
+def write_sqlite_store(path, revisions):
+    """
+    Write the revisions in the store table of an Etherpad SQLite database (created if needed), with REPLACE INTO as
+    Etherpad does, along with the records of the pads
+
+    :param path: path to the SQLite database
+    :type path: str
+    :param revisions: revisions as returned by generate_revisions
+    :type revisions: list[(str,int,str,str,int)]
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('CREATE TABLE IF NOT EXISTS store (key TEXT PRIMARY KEY, value TEXT)')
+        for i, revision in enumerate(revisions):
+            key, value = revision_record(revision)
+            conn.execute('REPLACE INTO store VALUES (?, ?)', (key, json.dumps(value)))
+            if i % 9 == 0:
+                conn.execute('REPLACE INTO store VALUES (?, ?)', ('pad:' + revision[0], json.dumps({'head': i})))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def generate_keystrokes(number_of_elem_ops, number_of_pads=2, number_of_authors=3, seed=0):
+    """
+    Generate the elementary operations of several authors typing concurrently in the same pads: mostly one character
+    at a time next to their cursor, with a few new lines, pastes, deletions and jumps in the text
+
+    :param number_of_elem_ops: number of elementary operations of each pad
+    :type number_of_elem_ops: int
+    :param number_of_pads: number of pads
+    :type number_of_pads: int
+    :param number_of_authors: number of authors of each pad
+    :type number_of_authors: int
+    :param seed: seed of the random generator
+    :type seed: int
+    :return: elementary operations of each pad sorted by timestamp
+    :rtype: dict[str,list[ElementaryOperation]]
+    """
+    rnd = random.Random(seed)
+    list_of_elem_ops_per_pad = dict()
+    for pad_index in range(number_of_pads):
+        pad_name = 'tpad%d' % pad_index
+        authors = ['t.%d' % i for i in range(number_of_authors)]
+        cursors = dict.fromkeys(authors, 0)
+        length = 0
+        timestamp = 1500000000000 + pad_index
+        author = authors[0]
+        elem_ops = []
+        while len(elem_ops) < number_of_elem_ops:
+            if rnd.random() < .2:
+                author = rnd.choice(authors)
+            timestamp += rnd.choice([80, 150, 300, 1500, 4000]) if rnd.random() > .01 else rnd.choice([25000, 700000])
+            if rnd.random() < .02:
+                cursors[author] = rnd.randint(0, length)
+            position = cursors[author]
+            if rnd.random() < .8 or position == 0:
+                text_to_add = rnd.choice('abcdefgh ij') if rnd.random() > .05 else rnd.choice(
+                    ['\n', 'word\n', 'a\nb\n\nc', '\n\nxy'])
+                elem_ops.append(ElementaryOperation('add', position, author=author, timestamp=timestamp,
+                                                    pad_name=pad_name, text_to_add=text_to_add))
+                for other_author in authors:
+                    if cursors[other_author] > position or other_author == author:
+                        cursors[other_author] += len(text_to_add)
+                length += len(text_to_add)
+            else:
+                length_to_delete = 1 if rnd.random() < .9 else rnd.randint(1, position)
+                position -= length_to_delete
+                elem_ops.append(ElementaryOperation('del', position, author=author, timestamp=timestamp,
+                                                    pad_name=pad_name, length_to_delete=length_to_delete))
+                for other_author in authors:
+                    if cursors[other_author] > position:
+                        cursors[other_author] = max(position, cursors[other_author] - length_to_delete)
+                length -= length_to_delete
+        list_of_elem_ops_per_pad[pad_name] = elem_ops
+    return list_of_elem_ops_per_pad
+
+
+def apply_elem_ops_to_text(elem_ops, text=''):
+    """
+    Apply elementary operations to a str, one after the other
+
+    :type elem_ops: list[ElementaryOperation]
+    :type text: str
+    :rtype: str
+    """
+    for elem_op in elem_ops:
+        if elem_op.operation_type == 'add':
+            text = text[:elem_op.abs_position] + elem_op.text_to_add + text[elem_op.abs_position:]
+        else:
+            text = text[:elem_op.abs_position] + text[elem_op.abs_position + elem_op.length_to_delete:]
+    return text
+
+
+def describe_elem_op(elem_op):
+    """
+    Get what identifies an elementary operation (the ones parsed twice are different objects)
+
+    :type elem_op: ElementaryOperation
+    :rtype: tuple
+    """
+    return (elem_op.operation_type, elem_op.abs_position,
+            elem_op.text_to_add if elem_op.operation_type == 'add' else elem_op.length_to_delete,
+            elem_op.author, elem_op.timestamp, elem_op.pad_name)
+
+
+def describe_operation(operation):
+    """
+    Get what identifies an operation: its author, its elementary operations and its positions
+
+    :type operation: analytics.Operations.Operation
+    :rtype: tuple
+    """
+    return (operation.author, tuple(map(describe_elem_op, operation.elem_ops)), operation.position_start_of_op,
+            operation.position_first_op)
@@ -0,0 +1,260 @@
+import numpy as np
+import pytest
+
+from analytics import operation_builder, parser
+from analytics.operation_builder import OperationBuilder
+from analytics.Operations import ElementaryOperation
+from analytics.Pad import Pad
+from tests import synthetic_logs
+
+MAXIMUM_TIME = 2000
+
+
+class ReferenceOperation:
+    """
+    Operation as built by the first operation builder, before OperationBuilder and the grouping with arrays
+    """
+
+    def __init__(self, elem_op):
+        self.author = elem_op[3]
+        self.position_start_of_op = elem_op[1]
+        self.position_first_op = elem_op[1]
+        self.timestamp_end = elem_op[4]
+        self.elem_ops = [elem_op]
+        self.pushed = False
+
+    def get_length_of_op(self):
+        return sum(len(text_or_length) if operation_type == 'add' else -text_or_length
+                   for operation_type, _, text_or_length, _, _, _ in self.elem_ops)
+
+    def add_elem_op(self, elem_op):
+        self.timestamp_end = elem_op[4]
+        self.elem_ops.append(elem_op)
+        self.position_start_of_op = min(self.position_start_of_op, elem_op[1])
+
+    def update_indices(self, elem_op):
+        operation_type, position, text_or_length, _, _, _ = elem_op
+        if operation_type == 'add' and position < self.position_start_of_op:
+            self.position_start_of_op += len(text_or_length)
+            self.position_first_op += len(text_or_length)
+        elif operation_type == 'del' and position + text_or_length < self.position_start_of_op:
+            self.position_start_of_op -= text_or_length
+            self.position_first_op -= text_or_length
+
+    def describe(self):
+        return self.author, tuple(self.elem_ops), self.position_start_of_op, self.position_first_op
+
+
+def build_reference_operations(elem_ops, maximum_time_between_elem_ops):
+    """
+    Build the operations of a pad the way the first operation builder did, on the descriptions of the elementary
+    operations (see synthetic_logs.describe_elem_op). The parts of an elementary operation split on its new lines keep
+    its timestamp.
+
+    :return: the descriptions of the operations (see ReferenceOperation.describe), in the order they are pushed to the
+        pad
+    :rtype: list[tuple]
+    """
+    operations = []
+    current_operations = dict()
+
+    def push(operation):
+        if not operation.pushed:
+            operation.pushed = True
+            operations.append(operation)
+
+    def treat_op(elem_op):
+        author = elem_op[3]
+        current_op = current_operations.get(author)
+        if current_op is not None:
+            length = len(elem_op[2]) if elem_op[0] == 'add' else elem_op[2]
+            if elem_op[4] - current_op.timestamp_end < maximum_time_between_elem_ops \
+                    and current_op.position_start_of_op - length <= elem_op[1] \
+                    <= current_op.position_start_of_op + abs(current_op.get_length_of_op()):
+                current_op.add_elem_op(elem_op)
+                return
+            push(current_op)
+        current_operations[author] = ReferenceOperation(elem_op)
+
+    for elem_op in map(synthetic_logs.describe_elem_op, elem_ops):
+        operation_type, position, text, author, timestamp, pad_name = elem_op
+        if operation_type == 'add' and '\n' in text:
+            lines = text.split('\n')
+            if lines[0]:
+                treat_op(('add', position, lines[0], author, timestamp, pad_name))
+                position += len(lines[0])
+            if author in current_operations:
+                push(current_operations.pop(author))
+            for line in lines[1:-1]:
+                for part in ('\n', line) if line else ('\n',):
+                    push(ReferenceOperation(('add', position, part, author, timestamp, pad_name)))
+                    position += len(part)
+            push(ReferenceOperation(('add', position, '\n', author, timestamp, pad_name)))
+            position += 1
+            if lines[-1]:
+                current_operations[author] = ReferenceOperation(('add', position, lines[-1], author, timestamp,
+                                                                 pad_name))
+        else:
+            treat_op(elem_op)
+        for other_author, operation in current_operations.items():
+            if other_author != author:
+                operation.update_indices(elem_op)
+    for operation in current_operations.values():
+        push(operation)
+    return [operation.describe() for operation in operations]
+
+
+def keystrokes():
+    return synthetic_logs.generate_keystrokes(1500, seed=3)
+
+
+def etherpad_elem_ops(tmp_path):
+    path = str(tmp_path / 'dirty.db')
+    synthetic_logs.write_dirty_db(path, synthetic_logs.dirty_db_lines(synthetic_logs.generate_revisions(300)[0]))
+    return operation_builder.sort_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, 'etherpad')[0])
+
+
+@pytest.fixture(params=['keystrokes', 'etherpad'])
+def make_elem_ops(request, tmp_path):
+    """
+    Make the elementary operations of a few pads, new ones at each call since the operations built keep their
+    elementary operations
+    """
+    if request.param == 'keystrokes':
+        return keystrokes
+    return lambda: etherpad_elem_ops(tmp_path)
+
+
+def describe_operations(pads):
+    return {pad_name: list(map(synthetic_logs.describe_operation, pad.operations)) for pad_name, pad in pads.items()}
+
+
+def elem_op(operation_type, position, author, timestamp, text_or_length):
+    if operation_type == 'add':
+        return ElementaryOperation('add', position, author=author, timestamp=timestamp, pad_name='pad',
+                                   text_to_add=text_or_length)
+    return ElementaryOperation('del', position, author=author, timestamp=timestamp, pad_name='pad',
+                               length_to_delete=text_or_length)
+
+
+# OperationBuilder
+
+def test_builder_watermark_closes_operations():
+    builder = OperationBuilder(Pad('pad'), MAXIMUM_TIME)
+    assert builder.add_elem_op(elem_op('add', 0, 'b', 0, 'bb')) == []
+    operation_b = builder.open_operations['b']
+    assert builder.add_elem_op(elem_op('add', 2, 'a', 10, 'x')) == []
+    assert builder.add_elem_op(elem_op('add', 3, 'a', 100, 'y')) == []
+    operation_a = builder.open_operations['a']
+    # The watermark passes the end of the operation of b plus the maximum time, but not the one of a
+    assert builder.add_elem_op(elem_op('add', 0, 'b', MAXIMUM_TIME + 99, 'z')) == [operation_b]
+    assert builder.add_elem_op(elem_op('add', 0, 'b', MAXIMUM_TIME + 100, 'w')) == [operation_a]
+    assert 'a' not in builder.open_operations
+    assert builder.last_operations['a'] is operation_a
+    # Still moved by the edits of the others once closed
+    assert operation_a.position_start_of_op == 4
+    assert builder.advance_watermark(50) == []
+    assert builder.watermark == MAXIMUM_TIME + 100
+
+
+def test_builder_late_elem_op_does_not_reopen():
+    builder = OperationBuilder(Pad('pad'), MAXIMUM_TIME)
+    builder.add_elem_op(elem_op('add', 0, 'a', 0, 'x'))
+    operation_a = builder.open_operations['a']
+    assert builder.add_elem_op(elem_op('add', 0, 'b', 10 * MAXIMUM_TIME, 'y')) == [operation_a]
+    # Late elementary operation of a, within the maximum time of its operation and at its end
+    builder.add_elem_op(elem_op('add', 2, 'a', MAXIMUM_TIME // 2, 'z'))
+    assert len(operation_a.elem_ops) == 1
+    assert builder.open_operations['a'] is not operation_a
+    assert builder.pad.operations == [operation_a]
+
+
+def test_builder_flush_and_push_operations():
+    builder = OperationBuilder(Pad('pad'), MAXIMUM_TIME)
+    builder.add_elem_op(elem_op('add', 0, 'a', 0, 'x'))
+    builder.add_elem_op(elem_op('add', 0, 'b', 10, 'y'))
+    operation_a, operation_b = builder.open_operations['a'], builder.open_operations['b']
+    # a starts a new operation somewhere else: its last operation is pushed
+    builder.add_elem_op(elem_op('add', 2, 'a', 20, 'z'))
+    assert builder.pad.operations == [operation_a]
+    new_operation_a = builder.open_operations['a']
+    assert builder.flush() == [new_operation_a, operation_b]
+    assert builder.open_operations == dict()
+    assert builder.pad.operations == [operation_a]
+    builder.push_operations()
+    assert builder.pad.operations == [operation_a, new_operation_a, operation_b]
+    builder.push_operations()
+    assert len(builder.pad.operations) == 3
+    assert builder.pad.get_text() == 'yxz'
+
+
+def test_builder_new_lines():
+    builder = OperationBuilder(Pad('pad'), MAXIMUM_TIME)
+    elem_ops_treated = []
+    builder.add_elem_op(elem_op('add', 0, 'a', 0, 'ab'), elem_ops_treated)
+    builder.add_elem_op(elem_op('add', 2, 'a', 10, 'c\nd\n\ne'), elem_ops_treated)
+    assert [e.text_to_add for e in elem_ops_treated] == ['ab', 'c', '\n', 'd', '\n', '\n', 'e']
+    assert [e.abs_position for e in elem_ops_treated] == [0, 2, 3, 4, 5, 6, 7]
+    builder.push_operations()
+    assert [[e.text_to_add for e in operation.elem_ops] for operation in builder.pad.operations] \
+        == [['ab', 'c'], ['\n'], ['d'], ['\n'], ['\n'], ['e']]
+    assert builder.pad.get_text() == 'abc\nd\n\ne'
+
+
+# Builder, batch grouping and first operation builder
+
+def test_builder_same_as_batch(make_elem_ops):
+    pads, _, elem_ops_treated = operation_builder.build_operations_from_elem_ops(make_elem_ops(), MAXIMUM_TIME)
+    pads_batch, elem_ops_treated_batch = operation_builder.build_operations_from_elem_ops_batch(make_elem_ops(),
+                                                                                               MAXIMUM_TIME)
+    assert describe_operations(pads) == describe_operations(pads_batch)
+    for pad_name, pad in pads.items():
+        assert list(map(synthetic_logs.describe_elem_op, elem_ops_treated[pad_name])) \
+            == list(map(synthetic_logs.describe_elem_op, elem_ops_treated_batch[pad_name]))
+        assert pad.get_text() == pads_batch[pad_name].get_text()
+
+
+def test_same_as_first_operation_builder(make_elem_ops):
+    list_of_elem_ops_per_pad = make_elem_ops()
+    pads, _, _ = operation_builder.build_operations_from_elem_ops(list_of_elem_ops_per_pad, MAXIMUM_TIME)
+    for pad_name, elem_ops in list_of_elem_ops_per_pad.items():
+        assert list(map(synthetic_logs.describe_operation, pads[pad_name].operations)) \
+            == build_reference_operations(elem_ops, MAXIMUM_TIME)
+        assert pads[pad_name].get_text() == synthetic_logs.apply_elem_ops_to_text(elem_ops)
+
+
+def test_group_elem_ops_for_thresholds(make_elem_ops):
+    maximum_times = [0, 100, 1000, MAXIMUM_TIME, 60000, 10 ** 9]
+    for pad_name, elem_ops in make_elem_ops().items():
+        elem_ops_treated, operation_indices, operation_positions = operation_builder.group_elem_ops_for_thresholds(
+            elem_ops, maximum_times)
+        for maximum_time in maximum_times:
+            pad = Pad(pad_name)
+            pad.add_operations(operation_builder.create_operations(elem_ops_treated, operation_indices[maximum_time],
+                                                                   operation_positions[maximum_time]))
+            reference = build_reference_operations(elem_ops, maximum_time)
+            assert list(map(synthetic_logs.describe_operation, pad.operations)) == reference
+            _, single_indices, single_positions = operation_builder.group_elem_ops(elem_ops, maximum_time)
+            assert np.array_equal(single_indices, operation_indices[maximum_time])
+            assert np.array_equal(single_positions, operation_positions[maximum_time])
+
+
+def test_streamed_dirty_db_same_as_batch(tmp_path):
+    path = str(tmp_path / 'growing.db')
+    lines = synthetic_logs.dirty_db_lines(synthetic_logs.generate_revisions(300)[0])
+    reader = parser.DirtyDbReader(path, missing_ok=True)
+    pads = dict()
+    builders_per_pad = dict()
+    # dirty.db is polled while it grows, the builders continue the operations of the previous polls
+    for start in range(0, len(lines), 37):
+        synthetic_logs.write_dirty_db(path, lines[start:start + 37], 'a')
+        new_elem_ops, _ = parser.get_elem_ops_per_pad_from_db(path, 'etherpad', reader=reader)
+        pads, builders_per_pad, _ = operation_builder.build_operations_from_elem_ops(
+            operation_builder.sort_elem_ops_per_pad(new_elem_ops), MAXIMUM_TIME, builders_per_pad, pads)
+    pads_batch, _ = operation_builder.build_operations_from_elem_ops_batch(etherpad_elem_ops(tmp_path), MAXIMUM_TIME)
+    assert pads.keys() == pads_batch.keys()
+    for pad_name, pad in pads.items():
+        # The operations pushed at the end of each poll are pushed earlier than in a single batch
+        assert sorted(map(synthetic_logs.describe_operation, pad.operations)) \
+            == sorted(map(synthetic_logs.describe_operation, pads_batch[pad_name].operations))
+        assert pad.get_text() == pads_batch[pad_name].get_text()
@@ -0,0 +1,401 @@
+import json
+import os
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from analytics import parser
+from analytics.operation_builder import sort_elem_ops_per_pad
+from tests import synthetic_logs
+
+
+def describe_elem_ops_per_pad(list_of_elem_ops_per_pad):
+    return {pad_name: list(map(synthetic_logs.describe_elem_op, elem_ops))
+            for pad_name, elem_ops in sort_elem_ops_per_pad(list_of_elem_ops_per_pad).items()}
+
+
+@pytest.fixture
+def revisions():
+    return synthetic_logs.generate_revisions(200)[0]
+
+
+@pytest.fixture
+def dirty_db(tmp_path, revisions):
+    path = str(tmp_path / 'dirty.db')
+    synthetic_logs.write_dirty_db(path, synthetic_logs.dirty_db_lines(revisions))
+    return path
+
+
+# DirtyDbReader
+
+def test_dirty_db_reader_reads_complete_lines_only(tmp_path):
+    path = str(tmp_path / 'dirty.db')
+    synthetic_logs.write_dirty_db(path, ['{"key":"a","val":1}\n', '{"key":"b","val":2}\n'])
+    reader = parser.DirtyDbReader(path)
+    assert list(reader.iter_new_lines()) == ['{"key":"a","val":1}', '{"key":"b","val":2}']
+    assert reader.offset == os.path.getsize(path)
+    assert reader.lines_read == 2
+
+    # A line still being written is left for the next read
+    synthetic_logs.write_dirty_db(path, ['{"key":"c",'], 'a')
+    assert list(reader.iter_new_lines()) == []
+    offset = reader.offset
+    synthetic_logs.write_dirty_db(path, ['"val":3}\n'], 'a')
+    assert list(reader.iter_new_lines()) == ['{"key":"c","val":3}']
+    assert reader.offset == offset + len('{"key":"c","val":3}\n')
+    assert reader.lines_read == 3
+    assert not reader.rewound
+
+
+def test_dirty_db_reader_reads_by_blocks(dirty_db, monkeypatch):
+    monkeypatch.setattr(parser.DirtyDbReader, 'block_size', 100)
+    with open(dirty_db, encoding='utf-8') as f:
+        assert list(parser.DirtyDbReader(dirty_db).iter_new_lines()) == f.read().splitlines()
+
+
+@pytest.mark.parametrize('rewrite', ['truncate', 'replace', 'same_size'])
+def test_dirty_db_reader_starts_again_when_the_file_is_rewritten(tmp_path, rewrite):
+    path = str(tmp_path / 'dirty.db')
+    synthetic_logs.write_dirty_db(path, ['{"key":"a","val":1}\n', '{"key":"b","val":2}\n'])
+    reader = parser.DirtyDbReader(path)
+    list(reader.iter_new_lines())
+    assert not reader.has_changed()
+    if rewrite == 'truncate':
+        # Same file, shorter
+        with open(path, 'r+b') as f:
+            f.truncate(0)
+        synthetic_logs.write_dirty_db(path, ['{"key":"x","val":9}\n'])
+        new_lines = ['{"key":"x","val":9}']
+    elif rewrite == 'replace':
+        # Another file renamed over the first one (rotation), longer
+        synthetic_logs.write_dirty_db(path + '.new', ['{"key":"x","val":9}\n'] * 3)
+        os.replace(path + '.new', path)
+        new_lines = ['{"key":"x","val":9}'] * 3
+    else:
+        # Same file and same size, but the end of what was read has changed
+        synthetic_logs.write_dirty_db(path, ['{"key":"a","val":1}\n', '{"key":"b","val":3}\n'])
+        new_lines = ['{"key":"a","val":1}', '{"key":"b","val":3}']
+    assert reader.has_changed()
+    assert list(reader.iter_new_lines()) == new_lines
+    assert reader.rewound
+    list(reader.iter_new_lines())
+    assert not reader.rewound
+
+
+def test_dirty_db_reader_missing_file(tmp_path):
+    path = str(tmp_path / 'dirty.db')
+    with pytest.raises(FileNotFoundError):
+        list(parser.DirtyDbReader(path).iter_new_lines())
+    with pytest.raises(FileNotFoundError):
+        parser.get_elem_ops_per_pad_from_db(path, 'etherpad')
+    # When polling, the file may not have been created yet
+    reader = parser.DirtyDbReader(path, missing_ok=True)
+    assert parser.get_elem_ops_per_pad_from_db(path, 'etherpad', reader=reader) == (dict(), 0)
+    synthetic_logs.write_dirty_db(path, [synthetic_logs.dirty_db_line(
+        *synthetic_logs.revision_record(('pad', 0, 'Z:1>1*0+1$a', 'a.0', 1)))])
+    assert list(parser.get_elem_ops_per_pad_from_db(path, 'etherpad', reader=reader)[0]) == ['pad']
+
+
+def test_dirty_db_reader_revisions_written_again(tmp_path):
+    path = str(tmp_path / 'dirty.db')
+    first = synthetic_logs.dirty_db_line(*synthetic_logs.revision_record(('pad', 0, 'Z:1>1+1$a', 'a.0', 1)))
+    second = synthetic_logs.dirty_db_line(*synthetic_logs.revision_record(('pad', 1, 'Z:2>1+1$b', 'a.0', 2)))
+    synthetic_logs.write_dirty_db(path, [first, second])
+    reader = parser.DirtyDbReader(path)
+    assert [revision[1] for revision in reader.iter_new_revisions()] == [0, 1]
+
+    # Written again with the same value (e.g. compaction): not read again
+    synthetic_logs.write_dirty_db(path, [first], 'a')
+    assert list(reader.iter_new_revisions()) == []
+    assert reader.changed_pads == set()
+
+    # Written again with another value: the pad has to be read again
+    synthetic_logs.write_dirty_db(path, [synthetic_logs.dirty_db_line(
+        *synthetic_logs.revision_record(('pad', 1, 'Z:2>1+1$c', 'a.0', 3)))], 'a')
+    assert list(reader.iter_new_revisions()) == []
+    assert reader.changed_pads == {'pad'}
+    assert [revision[2] for _, revisions in reader.iter_changed_pads_revisions()
+            for revision in revisions] == ['Z:1>1+1$a', 'Z:2>1+1$c']
+
+
+def test_dirty_db_reader_state(dirty_db, tmp_path):
+    with open(dirty_db, encoding='utf-8') as f:
+        lines = f.readlines()
+    path = str(tmp_path / 'growing.db')
+    synthetic_logs.write_dirty_db(path, lines[:len(lines) // 2])
+    reader = parser.DirtyDbReader(path)
+    first_revisions = list(reader.iter_new_revisions())
+    # The state goes through JSON, as in the cache of the parser
+    reader = parser.DirtyDbReader.from_state(path, json.loads(json.dumps(reader.get_state())))
+    synthetic_logs.write_dirty_db(path, lines[len(lines) // 2:], 'a')
+    assert not reader.has_changed()
+    assert first_revisions + list(reader.iter_new_revisions()) == list(parser.DirtyDbReader(dirty_db)
+                                                                       .iter_new_revisions())
+    assert reader.offset == os.path.getsize(path)
+
+
+def test_dirty_db_reader_split_new_lines(dirty_db):
+    reader = parser.DirtyDbReader(dirty_db)
+    ranges = reader.split_new_lines(4)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(dirty_db)
+    with open(dirty_db, 'rb') as f:
+        data = f.read()
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start and data[end - 1:end] == b'\n'
+
+
+def test_dirty_db_polled_by_chunks(dirty_db, tmp_path):
+    with open(dirty_db, encoding='utf-8') as f:
+        content = f.read()
+    path = str(tmp_path / 'growing.db')
+    reader = parser.DirtyDbReader(path, missing_ok=True)
+    list_of_elem_ops_per_pad = dict()
+    # The file grows by chunks which don't end at the end of a line
+    for start in range(0, len(content) + 1, 997):
+        synthetic_logs.write_dirty_db(path, [content[start:start + 997]], 'a')
+        new_elem_ops, offset = parser.get_elem_ops_per_pad_from_db(path, 'etherpad', reader=reader)
+        assert offset == reader.offset
+        for pad_name, elem_ops in new_elem_ops.items():
+            list_of_elem_ops_per_pad.setdefault(pad_name, []).extend(elem_ops)
+    assert describe_elem_ops_per_pad(list_of_elem_ops_per_pad) == describe_elem_ops_per_pad(
+        parser.get_elem_ops_per_pad_from_db(dirty_db, 'etherpad')[0])
+
+
+def test_dirty_db_parsed_in_parallel(dirty_db):
+    assert describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(dirty_db, 'etherpad', jobs=2)[0]) \
+        == describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(dirty_db, 'etherpad')[0])
+
+
+# SQLiteStoreReader
+
+def test_sqlite_store_reader_high_water_mark(tmp_path, revisions):
+    path = str(tmp_path / 'store.db')
+    synthetic_logs.write_sqlite_store(path, revisions[:100])
+    reader = parser.SQLiteStoreReader(path, batch_size=7)
+    keys = [key for key, _ in reader.iter_new_entries()]
+    assert keys == [synthetic_logs.revision_record(revision)[0] for revision in revisions[:100]]
+    assert list(reader.iter_new_entries()) == []
+
+    synthetic_logs.write_sqlite_store(path, revisions[100:])
+    assert [key for key, _ in reader.iter_new_entries()] == [synthetic_logs.revision_record(revision)[0]
+                                                            for revision in revisions[100:]]
+    assert not reader.rewound
+
+
+def test_sqlite_store_reader_skips_revisions_replaced(tmp_path, revisions):
+    path = str(tmp_path / 'store.db')
+    synthetic_logs.write_sqlite_store(path, revisions)
+    reader = parser.SQLiteStoreReader(path)
+    list(reader.iter_new_entries())
+    # REPLACE INTO gives a new rowid to the revisions written again
+    synthetic_logs.write_sqlite_store(path, revisions[:10])
+    reader = parser.SQLiteStoreReader.from_state(path, json.loads(json.dumps(reader.get_state())))
+    assert list(reader.iter_new_entries()) == []
+    new_revision = ('pad0', max(revs for pad_name, revs, _, _, _ in revisions if pad_name == 'pad0') + 1,
+                    'Z:1>1+1$a', 'a.0', revisions[-1][4] + 1)
+    synthetic_logs.write_sqlite_store(path, revisions[:10] + [new_revision])
+    assert [key for key, _ in reader.iter_new_entries()] == [synthetic_logs.revision_record(new_revision)[0]]
+
+
+def test_sqlite_store_reader_rebuilt_store(tmp_path, revisions):
+    path = str(tmp_path / 'store.db')
+    synthetic_logs.write_sqlite_store(path, revisions)
+    reader = parser.SQLiteStoreReader(path)
+    list(reader.iter_new_entries())
+    os.remove(path)
+    synthetic_logs.write_sqlite_store(path, revisions[:20])
+    assert reader.has_changed()
+    assert len(list(reader.iter_new_entries())) == 20
+    assert reader.rewound
+
+
+def test_sqlite_store_pad_filter(tmp_path, revisions):
+    path = str(tmp_path / 'store.db')
+    synthetic_logs.write_sqlite_store(path, revisions)
+    reader = parser.SQLiteStoreReader(path, pad_filter=parser.normalize_pad_filter(['pad1']))
+    assert {key.split(':')[1] for key, _ in reader.iter_new_entries()} == {'pad1'}
+
+
+def test_sqlite_store_same_elem_ops_as_dirty_db(tmp_path, dirty_db, revisions):
+    path = str(tmp_path / 'store.db')
+    synthetic_logs.write_sqlite_store(path, revisions)
+    assert describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, 'etherpadSQLite3')[0]) \
+        == describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(dirty_db, 'etherpad')[0])
+
+
+# MongoOpsReader
+
+class FakeChangeStream:
+    """
+    Change stream of the inserts in a collection, fed by the test (mongomock has no change streams)
+    """
+
+    def __init__(self, fail=False):
+        self.changes = []
+        self.fail = fail
+        self.closed = False
+
+    def try_next(self):
+        if self.fail:
+            raise OperationFailure("change stream lost")
+        return self.changes.pop(0) if self.changes else None
+
+    def close(self):
+        self.closed = True
+
+
+def sharedb_op(pad_name, version, timestamp, op, author='u.0'):
+    return {'d': pad_name, 'v': version, 'src': author, 'm': {'ts': timestamp}, 'op': op}
+
+
+@pytest.fixture
+def mongo_reader(request):
+    mongomock = pytest.importorskip('mongomock')
+    options = getattr(request, 'param', dict())
+    reader = parser.MongoOpsReader(client=mongomock.MongoClient(), database_name='sharedb', collection_name='o_pads',
+                                   batch_size=2, await_time=0.01, **options)
+    yield reader
+    reader.close()
+
+
+def poll(reader, revs_mongo):
+    list_of_elem_ops_per_pad, revs_mongo = parser.get_elem_ops_per_pad_from_db(
+        editor='collab-react-components', reader=reader, revs_mongo=revs_mongo)
+    return {pad_name: [(elem_op.operation_type, elem_op.abs_position, elem_op.revs) for elem_op in elem_ops]
+            for pad_name, elem_ops in list_of_elem_ops_per_pad.items()}, revs_mongo
+
+
+@pytest.mark.parametrize('mongo_reader', [dict(), {'cursor_field': '_id'}, {'cursor_field': 'm.ts'}],
+                         indirect=True)
+def test_mongo_reader_polls_new_ops(mongo_reader):
+    collection = mongo_reader.collection
+    collection.insert_many([{'d': 'p1', 'v': 0, 'm': {'ts': 9}, 'create': {'type': 'text'}},
+                            sharedb_op('p1', 1, 10, [{'p': [0], 'si': 'ab'}]),
+                            sharedb_op('p2', 1, 11, [{'p': [0], 'si': 'c'}]),
+                            sharedb_op('p1', 2, 12, [{'p': [1], 'sd': 'b'}])])
+    new_elem_ops, revs_mongo = poll(mongo_reader, None)
+    assert new_elem_ops == {'p1': [('add', 0, 1), ('del', 1, 2)], 'p2': [('add', 0, 1)]}
+    assert revs_mongo == {'p1': 2, 'p2': 1}
+    assert poll(mongo_reader, revs_mongo)[0] == dict()
+
+    # m.ts is not unique: an op with the same timestamp as the last one read is still read
+    collection.insert_many([sharedb_op('p2', 2, 12, [{'p': [1], 'si': 'd'}]),
+                            sharedb_op('p1', 3, 13, [{'p': [1], 'si': 'e'}])])
+    new_elem_ops, revs_mongo = poll(mongo_reader, revs_mongo)
+    assert new_elem_ops == {'p1': [('add', 1, 3)], 'p2': [('add', 1, 2)]}
+    assert revs_mongo == {'p1': 3, 'p2': 2}
+
+
+@pytest.mark.parametrize('mongo_reader', [{'cursor_field': '_id', 'use_change_stream': True}], indirect=True)
+def test_mongo_reader_change_stream(mongo_reader, monkeypatch):
+    collection = mongo_reader.collection
+    change_stream = FakeChangeStream()
+    monkeypatch.setattr(collection, 'watch', lambda *args, **kwargs: change_stream, raising=False)
+
+    def insert(item):
+        collection.insert_one(item)
+        change_stream.changes.append({'fullDocument': dict(item)})
+
+    insert(sharedb_op('p1', 1, 10, [{'p': [0], 'si': 'ab'}]))
+    # The change stream is opened before the ops already in the collection are fetched
+    new_elem_ops, revs_mongo = poll(mongo_reader, None)
+    assert new_elem_ops == {'p1': [('add', 0, 1)]}
+    assert mongo_reader.change_stream is change_stream
+
+    # The op fetched by the query is also in the change stream, it is only read once
+    insert(sharedb_op('p1', 2, 11, [{'p': [2], 'si': 'c'}]))
+    new_elem_ops, revs_mongo = poll(mongo_reader, revs_mongo)
+    assert new_elem_ops == {'p1': [('add', 2, 2)]}
+    assert poll(mongo_reader, revs_mongo)[0] == dict()
+
+    # The change stream fails: we fall back to polling
+    change_stream.fail = True
+    collection.insert_one(sharedb_op('p1', 3, 12, [{'p': [3], 'si': 'd'}]))
+    new_elem_ops, revs_mongo = poll(mongo_reader, revs_mongo)
+    assert new_elem_ops == {'p1': [('add', 3, 3)]}
+    assert change_stream.closed
+    assert mongo_reader.change_stream is None and not mongo_reader.use_change_stream
+
+
+@pytest.mark.parametrize('mongo_reader', [{'use_change_stream': True}], indirect=True)
+def test_mongo_reader_without_change_stream(mongo_reader, monkeypatch):
+    def watch(*args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets")
+
+    monkeypatch.setattr(mongo_reader.collection, 'watch', watch, raising=False)
+    mongo_reader.collection.insert_one(sharedb_op('p1', 1, 10, [{'p': [0], 'si': 'ab'}]))
+    assert poll(mongo_reader, None)[0] == {'p1': [('add', 0, 1)]}
+    assert mongo_reader.change_stream is None and not mongo_reader.use_change_stream
+
+
+@pytest.mark.parametrize('mongo_reader', [{'cursor_field': 'm.ts'}], indirect=True)
+def test_mongo_reader_index_recommendation(mongo_reader):
+    assert mongo_reader.index_recommendation() == [('m.ts', 1)]
+
+
+# Cache of the parser
+
+@pytest.mark.parametrize('editor', ['etherpad', 'etherpadSQLite3'])
+def test_parser_cache(tmp_path, revisions, editor, monkeypatch):
+    path = str(tmp_path / ('dirty.db' if editor == 'etherpad' else 'store.db'))
+    cache_location = str(tmp_path / 'cache')
+
+    def write(revisions_written):
+        if editor == 'etherpad':
+            synthetic_logs.write_dirty_db(path, synthetic_logs.dirty_db_lines(revisions_written), 'a')
+        else:
+            synthetic_logs.write_sqlite_store(path, revisions_written)
+
+    def parse_without_cache():
+        return describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, editor)[0])
+
+    def parse_with_cache():
+        return describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, editor,
+                                                                             cache_location=cache_location)[0])
+
+    # Where the reader starts parsing, at each parse
+    starts = []
+    get_elem_op_store_from_db = parser.get_elem_op_store_from_db
+
+    def spy(*args, **kwargs):
+        reader = kwargs['reader']
+        starts.append(reader.offset if editor == 'etherpad' else reader.last_rowid)
+        return get_elem_op_store_from_db(*args, **kwargs)
+
+    monkeypatch.setattr(parser, 'get_elem_op_store_from_db', spy)
+
+    write(revisions[:100])
+    assert parse_with_cache() == parse_without_cache()
+    assert starts == [0]
+    # Nothing has changed: loaded from the cache without parsing
+    assert parse_with_cache() == parse_without_cache()
+    assert starts == [0]
+
+    # Records appended: only these are parsed
+    write(revisions[100:])
+    assert parse_with_cache() == parse_without_cache()
+    assert len(starts) == 2 and starts[1] > 0
+
+
+def test_parser_cache_rewritten_file(tmp_path):
+    path = str(tmp_path / 'dirty.db')
+    cache_location = str(tmp_path / 'cache')
+    for seed in range(2):
+        revisions = synthetic_logs.generate_revisions(50, seed=seed)[0]
+        synthetic_logs.write_dirty_db(path, synthetic_logs.dirty_db_lines(revisions))
+        assert describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, 'etherpad',
+                                                                             cache_location=cache_location)[0]) \
+            == describe_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, 'etherpad')[0])
+
+
+def test_parser_cache_other_parser_version(tmp_path, dirty_db, monkeypatch):
+    cache_location = str(tmp_path / 'cache')
+    parser.get_elem_op_store_cached(dirty_db, 'etherpad', cache_location)
+    monkeypatch.setattr(parser, 'PARSER_VERSION', parser.PARSER_VERSION + 1)
+    calls = []
+    monkeypatch.setattr(parser, 'get_elem_op_store_from_db',
+                        lambda *args, **kwargs: calls.append(kwargs['reader'].offset) or (parser.ElemOpStore(
+                            'etherpad'), 0))
+    parser.get_elem_op_store_cached(dirty_db, 'etherpad', cache_location)
+    assert calls == [0]
@@ -0,0 +1,42 @@
+import pytest
+
+import config
+from analytics import operation_builder, parser, pipeline
+from tests import synthetic_logs
+
+MAXIMUM_TIMES = [500, 2000, 20000, 600000]
+
+
+@pytest.fixture
+def elem_ops(tmp_path):
+    """
+    Make the elementary operations of the pads of a dirty.db, new ones at each call since the pads built keep their
+    elementary operations
+    """
+    path = str(tmp_path / 'dirty.db')
+    revisions = synthetic_logs.generate_revisions(400)[0]
+    synthetic_logs.write_dirty_db(path, synthetic_logs.dirty_db_lines(revisions))
+    return lambda: operation_builder.sort_elem_ops_per_pad(parser.get_elem_ops_per_pad_from_db(path, 'etherpad')[0])
+
+
+def test_sweep_same_as_pipeline(elem_ops, monkeypatch):
+    results = pipeline.run_sweep(elem_ops(), MAXIMUM_TIMES)
+    assert list(results) == MAXIMUM_TIMES
+    for maximum_time in MAXIMUM_TIMES:
+        monkeypatch.setattr(config, 'maximum_time_between_elem_ops', maximum_time)
+        expected = pipeline.run_pipeline(elem_ops())
+        assert list(results[maximum_time]) == list(expected)
+        for pad_name, metrics in expected.items():
+            result = dict(results[maximum_time][pad_name])
+            operation_indices = result.pop(pipeline.OPERATIONS_KEY)
+            # The metrics are computed the same way, so they are exactly equal (repr also compares the nan)
+            assert repr(result) == repr(metrics)
+            assert operation_indices.dtype.kind == 'i'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_pipeline_texts(elem_ops, jobs):
+    list_of_elem_ops_per_pad = elem_ops()
+    results = pipeline.run_pipeline(elem_ops(), jobs=jobs, texts=True)
+    for pad_name, elem_ops_of_pad in list_of_elem_ops_per_pad.items():
+        assert results[pad_name]['text'] == synthetic_logs.apply_elem_ops_to_text(elem_ops_of_pad)
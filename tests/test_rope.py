@@ -0,0 +1,100 @@
+import itertools
+import random
+
+import pytest
+
+from analytics import Rope as rope_module
+from analytics.Rope import Rope
+
+
+def random_edits(rope, rnd, number_of_edits):
+    """
+    Apply random edits to a rope and to the list of its characters with their attribute
+
+    :return: the characters of the text and their attribute once edited
+    :rtype: list[(str,object)]
+    """
+    characters = [(character, None) for character in rope.get_text()]
+    for i in range(number_of_edits):
+        length = len(characters)
+        position = rnd.randint(-length - 3, length + 3)
+        if rnd.random() < .6:
+            text = ''.join(rnd.choice('abc\n') for _ in range(rnd.randint(0, 8)))
+            start = rnd.randint(0, len(text))
+            end = rnd.randint(start, len(text)) if rnd.random() < .5 else None
+            rope.insert(position, text, start, end, attribute=i)
+            inserted = [(character, i) for character in text[start:end]]
+            characters = characters[:position] + inserted + characters[position:]
+        else:
+            deleted = rnd.randint(-3, 12)
+            rope.delete(position, deleted)
+            characters = characters[:position] + characters[position + deleted:]
+    return characters
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_rope_same_as_str(seed):
+    rnd = random.Random(seed)
+    rope = Rope('initial text')
+    characters = random_edits(rope, rnd, 500)
+    text = ''.join(character for character, _ in characters)
+    assert rope.get_text() == str(rope) == text
+    assert len(rope) == len(text)
+    assert rope.get_spans() == [(''.join(character for character, _ in span), attribute)
+                                for attribute, span in itertools.groupby(characters, key=lambda item: item[1])]
+
+
+def test_rope_render():
+    rnd = random.Random(0)
+    rope = Rope()
+    characters = random_edits(rope, rnd, 300)
+
+    def render_piece(text, start, end, attribute):
+        return ''.join('%s:%s;' % (attribute, character) for character in text[start:end])
+
+    expected = ''.join('%s:%s;' % (attribute, character) for character, attribute in characters)
+    assert rope.render('tagged', render_piece) == expected
+    assert rope.get_text() == ''.join(character for character, _ in characters)
+    # Rendered again from the renderings kept
+    assert rope.render('tagged', render_piece) == expected
+
+
+def kept_renderings(piece, name):
+    """
+    Number of characters of the renderings kept in a subtree
+    """
+    if piece is None:
+        return 0
+    kept = len(piece.renderings[name]) if piece.renderings is not None and name in piece.renderings else 0
+    return kept + kept_renderings(piece.left, name) + kept_renderings(piece.right, name)
+
+
+def test_rope_renderings_kept(monkeypatch):
+    monkeypatch.setattr(rope_module, '_MAXIMUM_SIZE_RENDERED', 64)
+    rnd = random.Random(1)
+    rope = Rope()
+    for i in range(2000):
+        rope.insert(rnd.randint(0, len(rope)), 'abcdefgh'[:rnd.randint(1, 8)], attribute=i)
+    rendered = []
+
+    def render_piece(text, start, end, attribute):
+        rendered.append(attribute)
+        return text[start:end]
+
+    text = rope.render('counted', render_piece)
+    number_of_pieces = len(list(rope._get_pieces()))
+    assert len(rendered) == number_of_pieces
+    # The renderings kept don't overlap
+    assert kept_renderings(rope.root, 'counted') == len(text)
+
+    # After a few edits, only the pieces of the subtrees around them are rendered again
+    for _ in range(3):
+        position = rnd.randint(0, len(rope))
+        rope.insert(position, 'xyz', attribute='new')
+        text = text[:position] + 'xyz' + text[position:]
+    rope.delete(100, 5)
+    text = text[:100] + text[105:]
+    del rendered[:]
+    assert rope.render('counted', render_piece) == text
+    assert 0 < len(rendered) < number_of_pieces // 10
+    assert kept_renderings(rope.root, 'counted') == len(text)